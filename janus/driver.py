@@ -2,6 +2,7 @@
 This is the qmmm driver module
 """
 import pickle
+import json
 from janus import Initializer
 
 
@@ -26,10 +27,64 @@ def run_janus(filename='input.json'):
     # initialize wrappers
     ll_wrapper, qmmm_wrapper = initializer.initialize_wrappers()
 
-    if initializer.run_md is True:
-        run_simulation(ll_wrapper, qmmm_wrapper)
+    try:
+        if initializer.run_md is True:
+            run_simulation(ll_wrapper, qmmm_wrapper)
+        else:
+            run_single_point(ll_wrapper, qmmm_wrapper)
+    finally:
+        qmmm_wrapper.close()
+
+
+def run_calibration(filename='input.json', profile='platform_profile.json'):
+    """
+    Times the MM platforms available for the main simulation
+    and for subsystem computations of the input system, and writes
+    the fastest settings to a profile that can be given to
+    the low level wrapper with the platform_profile keyword
+
+    Parameters
+    ----------
+
+    filename : str
+        Filename from which to read input parameters
+    profile : str
+        Filename of the json profile to write
+
+    """
+
+    initializer = Initializer(filename)
+
+    ll_wrapper = initializer.ll_wrapper(sys_info=initializer.system_info, sys_info_format=initializer.system_info_format, **initializer.ll)
+
+    # Amber inputs may not have a pdb file and Gromacs inputs only have the positions of the gro file
+    positions = ll_wrapper.positions
+    if positions is None:
+        positions = ll_wrapper.pdb.getPositions()
+
+    best = {}
+
+    print('Calibrating main simulation')
+    best['main'], timings = ll_wrapper.calibrate_platforms(ll_wrapper.topology, positions)
+
+    # the qm region is the smallest subsystem that is computed at every step
+    if 'qm_atoms' in initializer.qmmm:
+        qm_atoms = initializer.qmmm['qm_atoms']
     else:
-        run_single_point(ll_wrapper, qmmm_wrapper)
+        qm_atoms = initializer.aqmmm.get('qm_center', [])
+
+    if qm_atoms:
+        print('Calibrating subsystem computations')
+        mod = ll_wrapper.create_modeller(atoms=qm_atoms, keep_atoms=True, positions=positions)
+        best['subsys'], timings = ll_wrapper.calibrate_platforms(mod.topology, mod.positions)
+
+    for role, setting in best.items():
+        print('fastest setting for {} is {} platform with properties {}'.format(role, setting['platform'], setting['properties']))
+
+    with open(profile, 'w') as f:
+        json.dump(best, f, indent=4)
+
+    print('platform profile written to {}'.format(profile))
 
 
 def run_simulation(md_sim_wrapper, qmmm_wrapper):
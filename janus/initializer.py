@@ -1,6 +1,6 @@
 import json
 import os
-from janus.qm_wrapper import Psi4Wrapper 
+from janus.qm_wrapper import Psi4Wrapper, QMWorkerWrapper, AnalyticWrapper
 from janus.mm_wrapper import OpenMMWrapper 
 from janus.qmmm import QMMM, OniomXS, HotSpot, PAP, SAP, DAS
 
@@ -66,10 +66,14 @@ class Initializer(object):
 
         if self.hl_program == "Psi4":
             self.hl_wrapper = Psi4Wrapper
+        elif self.hl_program == "Psi4Worker":
+            self.hl_wrapper = QMWorkerWrapper
+        elif self.hl_program == "Analytic":
+            self.hl_wrapper = AnalyticWrapper
         elif self.hl_program == "OpenMM":
             self.hl_wrapper = OpenMMWrapper
         else:
-            raise ValueError("Only Psi4 and OpenMM currently available to be used in high level computations")
+            raise ValueError("Only Psi4, Psi4Worker, Analytic and OpenMM currently available to be used in high level computations")
 
         if self.ll_program == "OpenMM":
             self.ll_wrapper = OpenMMWrapper
@@ -124,6 +128,9 @@ class Initializer(object):
 
         if self.run_md is True:
 
+            if qmmm_wrapper.energy_only is True:
+                raise ValueError("energy_only cannot be used with MD, which needs QM/MM forces")
+
             md_sim_wrapper = self.md_sim_wrapper(sys_info=self.system_info, sys_info_format=self.system_info_format, **self.ll)
 
             if self.md_restart is False:
@@ -1,4 +1,4 @@
-from janus.driver import run_janus
+from janus.driver import run_janus, run_calibration
 import argparse
 import sys
 
@@ -7,6 +7,8 @@ def main():
     parser = argparse.ArgumentParser(prog='janus')
     parser.add_argument('input_file', metavar='i', type=str, help='input file name')
     parser.add_argument('-o', type=str,help='output file name')
+    parser.add_argument('--calibrate', type=str, nargs='?', const='platform_profile.json', metavar='profile',
+                        help='time the MM platforms on the input system and write the fastest settings to profile')
     args = parser.parse_args()
     file_in = args.input_file
     file_out = args.o
@@ -18,7 +20,11 @@ def main():
     print('running janus')
     print('input file is {}'.format(file_in))
     print('output file is {}'.format(file_out))
-    run_janus(filename=file_in)
+
+    if args.calibrate is not None:
+        run_calibration(filename=file_in, profile=args.calibrate)
+    else:
+        run_janus(filename=file_in)
 
 if __name__ == '__main__':
     main()
@@ -1,2 +1,5 @@
 from janus.mm_wrapper.mm_wrapper import MMWrapper
+from janus.mm_wrapper.context_pool import ContextPool
+from janus.mm_wrapper.system_slicer import SystemSlicer
+from janus.mm_wrapper.numpy_evaluator import NumpyEvaluator
 from janus.mm_wrapper.openmm_wrapper import OpenMMWrapper
@@ -0,0 +1,96 @@
+from collections import OrderedDict
+
+
+class ContextPool(object):
+    """
+    A least recently used store for MM simulation objects,
+    so that repeated evaluations of the same subsystem only need
+    to update positions instead of rebuilding a system and context.
+
+    Parameters
+    ----------
+    max_size : int
+        The maximum number of entries kept in the pool, default is 10.
+        Setting max_size to 0 disables pooling.
+    """
+
+    def __init__(self, max_size=10):
+
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        Looks up an entry in the pool and marks it as most recently used
+
+        Parameters
+        ----------
+        key : hashable
+            signature identifying the pooled entry
+
+        Returns
+        -------
+        object
+            the pooled entry, or None if key is not in the pool
+        """
+
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        self.misses += 1
+        return None
+
+    def put(self, key, entry):
+        """
+        Adds an entry to the pool, evicting the least
+        recently used entry if the pool is full
+
+        Parameters
+        ----------
+        key : hashable
+            signature identifying the pooled entry
+        entry : object
+            the object to store
+        """
+
+        if self.max_size <= 0:
+            return
+
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """
+        Removes all entries from the pool
+        """
+        self.entries.clear()
+
+    def get_stats(self):
+        """
+        Gets the usage counters of the pool
+
+        Returns
+        -------
+        dict
+            number of hits, misses, evictions and current entries
+        """
+
+        return {'hits' : self.hits,
+                'misses' : self.misses,
+                'evictions' : self.evictions,
+                'size' : len(self.entries)}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
@@ -45,7 +45,9 @@ class MMWrapper(ABC):
 
         super().__init__()
 
-    def get_energy_and_gradient(self, traj, geometry=None, include_coulomb='all', link_atoms=None, minimize=False, charges=None):
+    def get_energy_and_gradient(self, traj, geometry=None, include_coulomb='all', link_atoms=None, minimize=False, charges=None,
+                                atom_indices=None, link_bonds=None, engine=None, guess_key=None, guess_atoms=None,
+                                energy_only=False, error_tolerance=None, level=None):
         """
         Gets the energy and gradient from a MM computation
 
@@ -68,6 +70,27 @@ class MMWrapper(ABC):
             whether to return the geometry optimized energy 
         charges : list
             charges and corresponding positions in angstroms as xyz coordinates
+        atom_indices : list
+            indices of the atoms of traj in the entire system, 
+            in the order they appear in traj. Default is None.
+        link_bonds : list
+            (qm index, mm index, g) in the entire system for each 
+            link atom appended to traj after the atoms in atom_indices
+        engine : str
+            the engine used for the MM computation, e.g. 'numpy' for
+            small subsystems with :class:`~janus.mm_wrapper.OpenMMWrapper`.
+            Default is None, which uses the MM program.
+        guess_key : hashable
+            identifies the region for reusing SCF guesses. Not applicable for MM programs
+        guess_atoms : list
+            atoms of the region for assembling SCF guesses. Not applicable for MM programs
+        energy_only : bool
+            whether to only compute the energy, in which case the forces 
+            and gradients are not computed and not returned. Default is False.
+        error_tolerance : float
+            acceptable error for loosening convergence thresholds. Not applicable for MM programs
+        level : str
+            level of theory of QM programs. Not applicable for MM programs
 
         Returns
         -------
@@ -81,10 +104,43 @@ class MMWrapper(ABC):
         if charges is not None:
             self.set_external_charges(charges)
 
-        info = self.compute_info(topology, positions, include_coulomb=include_coulomb, link_atoms=link_atoms, minimize=minimize)
+        info = self.compute_info(topology, positions, include_coulomb=include_coulomb, link_atoms=link_atoms, minimize=minimize,
+                                 atom_indices=atom_indices, link_bonds=link_bonds, engine=engine,
+                                 forces=(energy_only is False))
 
         return info
 
+    def get_energies_and_gradients(self, calls):
+        """
+        Gets the energies and gradients of several computations one after another,
+        for MM programs used as the high level of adaptive QM/MM schemes
+
+        Parameters
+        ----------
+        calls : list
+            a dict of parameters of :func:`~janus.mm_wrapper.MMWrapper.get_energy_and_gradient`
+            for every computation
+
+        Returns
+        -------
+        list
+            the result of every computation, in the order of calls
+        """
+
+        return [self.get_energy_and_gradient(**call) for call in calls]
+
+    def computes_outside_interpreter(self):
+        """
+        Whether the computations of the wrapper run outside of the Python interpreter,
+        for MM programs used as the high level of QM/MM. MM computations 
+        hold the interpreter.
+
+        Returns
+        -------
+        bool
+        """
+        return False
+
     def post_processing_input(self):
 
         self.qmmm_steps = self.end_qmmm - self.start_qmmm
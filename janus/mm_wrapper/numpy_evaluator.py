@@ -0,0 +1,397 @@
+import simtk.openmm as OM
+import simtk.unit as OM_unit
+import numpy as np
+
+
+class NumpyEvaluator(object):
+    """
+    Computes the MM energy and forces of a small system with NumPy,
+    using the parameters of an OpenMM system.
+    For fragments of tens to a few hundred atoms this is cheaper
+    than setting up and evaluating an OpenMM context.
+
+    Note
+    ----
+    Nonbonded interactions are computed between all pairs of particles,
+    so only the NoCutoff nonbonded method is supported.
+
+    Parameters
+    ----------
+    system : OpenMM system object
+        Supported forces are HarmonicBondForce, HarmonicAngleForce,
+        PeriodicTorsionForce and NonbondedForce. CMMotionRemover is ignored.
+    """
+
+    # coulomb constant in kJ/mol nm/e^2
+    one_4pi_eps0 = 138.935456
+
+    def __init__(self, system):
+
+        self.system = system
+        self.num_particles = system.getNumParticles()
+
+        for i in range(self.num_particles):
+            if system.isVirtualSite(i):
+                raise ValueError("systems with virtual sites cannot be evaluated with numpy")
+
+        self.bonds = None
+        self.angles = None
+        self.torsions = None
+        self.nonbonded = None
+
+        for force in system.getForces():
+            if type(force) is OM.HarmonicBondForce:
+                terms = [force.getBondParameters(i) for i in range(force.getNumBonds())]
+                self.bonds = self.add_terms(self.bonds, terms, 2, 2)
+
+            elif type(force) is OM.HarmonicAngleForce:
+                terms = [force.getAngleParameters(i) for i in range(force.getNumAngles())]
+                self.angles = self.add_terms(self.angles, terms, 3, 2)
+
+            elif type(force) is OM.PeriodicTorsionForce:
+                terms = [force.getTorsionParameters(i) for i in range(force.getNumTorsions())]
+                self.torsions = self.add_terms(self.torsions, terms, 4, 3)
+
+            elif type(force) is OM.NonbondedForce:
+                if self.nonbonded is not None:
+                    raise ValueError("only one nonbonded force can be evaluated with numpy")
+                self.nonbonded = self.get_nonbonded_parameters(force)
+
+            elif type(force) is not OM.CMMotionRemover:
+                raise ValueError("{} cannot be evaluated with numpy".format(type(force).__name__))
+
+        # particle index of every force contribution, in the order they are computed
+        scatter = []
+        for terms in (self.bonds, self.angles, self.torsions):
+            if terms is not None:
+                scatter.extend(terms[0].T)
+        if self.nonbonded is not None:
+            scatter.extend((self.nonbonded['i'], self.nonbonded['j']))
+        self.scatter = np.concatenate(scatter) if scatter else np.zeros(0, dtype=int)
+
+    def add_terms(self, current, terms, n, n_params):
+        """
+        Converts force terms into arrays of particle indices and
+        parameters without units, and appends them to the existing terms
+
+        Parameters
+        ----------
+        current : tuple
+            particle indices and parameters of the terms added before, or None
+        terms : list
+            parameters of each term as returned by OpenMM,
+            starting with the particle indices
+        n : int
+            number of particles in each term
+        n_params : int
+            number of parameters of each term
+
+        Returns
+        -------
+        tuple
+            numpy array of particle indices, shape (number of terms, n),
+            and numpy array of parameters, shape (number of terms, number of parameters)
+        """
+
+        particles = np.array([t[:n] for t in terms], dtype=int).reshape(len(terms), n)
+        params = np.array([[NumpyEvaluator.strip_unit(p) for p in t[n:]] for t in terms],
+                          dtype=float).reshape(len(terms), n_params)
+
+        if current is not None:
+            particles = np.concatenate((current[0], particles))
+            params = np.concatenate((current[1], params))
+
+        return particles, params
+
+    def get_nonbonded_parameters(self, force):
+        """
+        Gets the particle and exception parameters of a nonbonded force
+
+        Parameters
+        ----------
+        force : OpenMM NonbondedForce object
+
+        Returns
+        -------
+        dict
+            the particle indices ('i', 'j'), charge product, sigma and epsilon
+            of every interacting pair, including the exceptions
+        """
+
+        if force.getNonbondedMethod() != OM.NonbondedForce.NoCutoff:
+            raise ValueError("only the NoCutoff nonbonded method can be evaluated with numpy")
+        if (force.getNumGlobalParameters() > 0 or force.getNumParticleParameterOffsets() > 0):
+            raise ValueError("nonbonded forces with parameter offsets cannot be evaluated with numpy")
+
+        particles = np.array([[NumpyEvaluator.strip_unit(p) for p in force.getParticleParameters(i)]
+                              for i in range(force.getNumParticles())], dtype=float).reshape(-1, 3)
+
+        exceptions = [force.getExceptionParameters(i) for i in range(force.getNumExceptions())]
+        pairs = np.array([e[:2] for e in exceptions], dtype=int).reshape(-1, 2)
+        params = np.array([[NumpyEvaluator.strip_unit(p) for p in e[2:]] for e in exceptions], dtype=float).reshape(-1, 3)
+
+        # pairs whose interaction is replaced by an exception
+        excluded = np.zeros((self.num_particles, self.num_particles), dtype=bool)
+        excluded[pairs[:,0], pairs[:,1]] = True
+        excluded[pairs[:,1], pairs[:,0]] = True
+
+        i, j = np.triu_indices(self.num_particles, 1)
+        keep = ~excluded[i, j]
+        i, j = i[keep], j[keep]
+
+        charge, sigma, epsilon = particles[:,0], particles[:,1], particles[:,2]
+
+        # exceptions with no interaction are only exclusions
+        nonzero = (params[:,0] != 0.0) | (params[:,2] != 0.0)
+
+        return {'i' : np.concatenate((i, pairs[nonzero,0])),
+                'j' : np.concatenate((j, pairs[nonzero,1])),
+                'charge_prod' : np.concatenate((charge[i] * charge[j], params[nonzero,0])),
+                'sigma' : np.concatenate((0.5 * (sigma[i] + sigma[j]), params[nonzero,1])),
+                'epsilon' : np.concatenate((np.sqrt(epsilon[i] * epsilon[j]), params[nonzero,2]))}
+
+    def strip_unit(value):
+        """
+        Converts a value that may have units to a float in the
+        MD unit system (nm, kJ/mol, radians, elementary charge)
+
+        Parameters
+        ----------
+        value : OpenMM Quantity or float
+
+        Returns
+        -------
+        float
+        """
+
+        if OM_unit.is_quantity(value):
+            return value.value_in_unit_system(OM_unit.md_unit_system)
+        return value
+
+    def compute(self, positions):
+        """
+        Computes the energy and forces of the system
+
+        Parameters
+        ----------
+        positions : numpy array
+            positions of the particles in nm, shape (number of particles, 3)
+
+        Returns
+        -------
+        float
+            potential energy in kJ/mol
+        numpy array
+            forces in kJ/mol/nm, shape (number of particles, 3)
+        """
+
+        pos = np.asarray(positions, dtype=float).reshape(self.num_particles, 3)
+        energy = 0.0
+        contributions = []
+
+        for terms, compute in ((self.bonds, self.compute_bonds),
+                               (self.angles, self.compute_angles),
+                               (self.torsions, self.compute_torsions),
+                               (self.nonbonded, self.compute_nonbonded)):
+            if terms is not None:
+                e, f = compute(pos)
+                energy += e
+                contributions.extend(f)
+
+        forces = np.zeros_like(pos)
+        if contributions:
+            # sum the contributions on each particle
+            contributions = np.concatenate(contributions)
+            for c in range(3):
+                forces[:,c] = np.bincount(self.scatter, weights=contributions[:,c], minlength=self.num_particles)
+
+        return energy, forces
+
+    def compute_bonds(self, pos):
+        """
+        Computes harmonic bonds, E = 1/2 k (r - r0)^2
+
+        Parameters
+        ----------
+        pos : numpy array
+            positions in nm
+
+        Returns
+        -------
+        float
+            energy in kJ/mol
+        list
+            forces in kJ/mol/nm on the particles in each column of the terms
+        """
+
+        particles, params = self.bonds
+        length, k = params[:,0], params[:,1]
+
+        d = pos[particles[:,1]] - pos[particles[:,0]]
+        r = np.sqrt(NumpyEvaluator.dot(d, d))
+        dr = r - length
+
+        # force on the second particle, the first gets the opposite
+        f = (-k * dr / r)[:,None] * d
+
+        return np.sum(0.5 * k * dr**2), [-f, f]
+
+    def compute_angles(self, pos):
+        """
+        Computes harmonic angles, E = 1/2 k (theta - theta0)^2
+
+        Parameters
+        ----------
+        pos : numpy array
+            positions in nm
+
+        Returns
+        -------
+        float
+            energy in kJ/mol
+        list
+            forces in kJ/mol/nm on the particles in each column of the terms
+        """
+
+        particles, params = self.angles
+        theta0, k = params[:,0], params[:,1]
+
+        u = pos[particles[:,0]] - pos[particles[:,1]]
+        v = pos[particles[:,2]] - pos[particles[:,1]]
+        ru = np.sqrt(NumpyEvaluator.dot(u, u))
+        rv = np.sqrt(NumpyEvaluator.dot(v, v))
+
+        cos = np.clip(NumpyEvaluator.dot(u, v) / (ru * rv), -1.0, 1.0)
+        theta = np.arccos(cos)
+        sin = np.maximum(np.sqrt(1.0 - cos**2), 1e-8)
+
+        dE = k * (theta - theta0)
+        # dtheta/dx = -1/sin(theta) dcos(theta)/dx
+        dcos_du = (v / (ru * rv)[:,None]) - (cos / ru**2)[:,None] * u
+        dcos_dv = (u / (ru * rv)[:,None]) - (cos / rv**2)[:,None] * v
+        f1 = (dE / sin)[:,None] * dcos_du
+        f3 = (dE / sin)[:,None] * dcos_dv
+
+        return np.sum(0.5 * k * (theta - theta0)**2), [f1, -f1 - f3, f3]
+
+    def compute_torsions(self, pos):
+        """
+        Computes periodic torsions, E = k (1 + cos(n phi - phi0))
+
+        Parameters
+        ----------
+        pos : numpy array
+            positions in nm
+
+        Returns
+        -------
+        float
+            energy in kJ/mol
+        list
+            forces in kJ/mol/nm on the particles in each column of the terms
+        """
+
+        particles, params = self.torsions
+        n, phase, k = params[:,0], params[:,1], params[:,2]
+
+        b1 = pos[particles[:,1]] - pos[particles[:,0]]
+        b2 = pos[particles[:,2]] - pos[particles[:,1]]
+        b3 = pos[particles[:,3]] - pos[particles[:,2]]
+
+        n1 = NumpyEvaluator.cross(b1, b2)
+        n2 = NumpyEvaluator.cross(b2, b3)
+        rb2_sq = NumpyEvaluator.dot(b2, b2)
+        rb2 = np.sqrt(rb2_sq)
+        n1_sq = np.maximum(NumpyEvaluator.dot(n1, n1), 1e-16)
+        n2_sq = np.maximum(NumpyEvaluator.dot(n2, n2), 1e-16)
+
+        phi = np.arctan2(rb2 * NumpyEvaluator.dot(b1, n2), NumpyEvaluator.dot(n1, n2))
+
+        dE = -k * n * np.sin(n * phi - phase)
+
+        # derivatives of phi with respect to the positions of the four particles
+        dphi1 = -(rb2 / n1_sq)[:,None] * n1
+        dphi4 = (rb2 / n2_sq)[:,None] * n2
+        s1 = (NumpyEvaluator.dot(b1, b2) / rb2_sq)[:,None]
+        s3 = (NumpyEvaluator.dot(b3, b2) / rb2_sq)[:,None]
+        dphi2 = -(1.0 + s1) * dphi1 + s3 * dphi4
+        dphi3 = s1 * dphi1 - (1.0 + s3) * dphi4
+
+        forces = [-dE[:,None] * dphi for dphi in (dphi1, dphi2, dphi3, dphi4)]
+
+        return np.sum(k * (1.0 + np.cos(n * phi - phase))), forces
+
+    def compute_nonbonded(self, pos):
+        """
+        Computes coulombic and Lennard-Jones interactions between all pairs
+        that are not excluded, plus the exceptions
+
+        Parameters
+        ----------
+        pos : numpy array
+            positions in nm
+
+        Returns
+        -------
+        float
+            energy in kJ/mol
+        list
+            forces in kJ/mol/nm on the particles in each column of the terms
+        """
+
+        nb = self.nonbonded
+        charge_prod, sigma, epsilon = nb['charge_prod'], nb['sigma'], nb['epsilon']
+
+        d = pos[nb['i']] - pos[nb['j']]
+        r_sq = NumpyEvaluator.dot(d, d)
+        r = np.sqrt(r_sq)
+        s6 = (sigma**2 / r_sq)**3
+
+        coulomb = NumpyEvaluator.one_4pi_eps0 * charge_prod / r
+        lj = 4.0 * epsilon * (s6**2 - s6)
+        # -dE/dr divided by r
+        f_r = (coulomb + 4.0 * epsilon * (12.0 * s6**2 - 6.0 * s6)) / r_sq
+
+        f = f_r[:,None] * d
+
+        return np.sum(coulomb) + np.sum(lj), [f, -f]
+
+    def dot(a, b):
+        """
+        Row-wise dot product of two arrays of vectors
+
+        Parameters
+        ----------
+        a, b : numpy array
+            shape (number of vectors, 3)
+
+        Returns
+        -------
+        numpy array
+            shape (number of vectors,)
+        """
+
+        return np.einsum('ij,ij->i', a, b)
+
+    def cross(a, b):
+        """
+        Row-wise cross product of two arrays of vectors,
+        which avoids the overhead of np.cross for small arrays
+
+        Parameters
+        ----------
+        a, b : numpy array
+            shape (number of vectors, 3)
+
+        Returns
+        -------
+        numpy array
+            shape (number of vectors, 3)
+        """
+
+        c = np.empty_like(a)
+        c[:,0] = a[:,1]*b[:,2] - a[:,2]*b[:,1]
+        c[:,1] = a[:,2]*b[:,0] - a[:,0]*b[:,2]
+        c[:,2] = a[:,0]*b[:,1] - a[:,1]*b[:,0]
+
+        return c
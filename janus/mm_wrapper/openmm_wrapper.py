@@ -2,9 +2,13 @@ import simtk.openmm.app as OM_app
 import simtk.openmm as OM
 import simtk.unit as OM_unit
 from mdtraj.reporters import NetCDFReporter
-from janus.mm_wrapper import MMWrapper
+from janus.mm_wrapper import MMWrapper, ContextPool, SystemSlicer, NumpyEvaluator
 import numpy as np
 import pickle
+import json
+import time
+import os
+import tempfile
 from copy import deepcopy
 
 
@@ -42,6 +46,34 @@ class OpenMMWrapper(MMWrapper):
     nonbondedCutoff : float 
         The cutoff distance for nonbonded interactions in nanometers,
         default is 1.
+    context_pool_size : int
+        The number of OpenMM simulations kept for reuse in subsystem
+        computations, default is 10. Set to 0 to build a new simulation every time.
+    subsystem_slicing : bool
+        Whether to build the MM systems of subsystems by slicing a system 
+        of the entire system that is parameterized once, instead of calling the 
+        forcefield for every subsystem. Default is False.
+    residue_template_file : str
+        A file in which residue templates generated for unmatched residues 
+        are saved, so they can be reused by later runs. Default is None.
+    coulomb_force_groups : bool
+        Whether subsystem computations put bonded and nonbonded forces in separate
+        force groups and switch coulombic and Lennard-Jones interactions with global
+        parameters, so that every include_coulomb treatment of a subsystem is computed 
+        with the same OpenMM simulation. Default is False.
+    main_platform : str
+        The OpenMM platform used for the main MD simulation, e.g. 'CPU' or 'Reference'.
+        Default is None, which lets OpenMM pick the fastest platform.
+    main_platform_properties : dict
+        The OpenMM platform properties used for the main MD simulation, 
+        e.g. {'Threads' : '4'}. Default is None.
+    subsys_platform : str
+        The OpenMM platform used for subsystem computations. Default is None.
+    subsys_platform_properties : dict
+        The OpenMM platform properties used for subsystem computations. Default is None.
+    platform_profile : str
+        A json file written by ``janus --calibrate`` from which the platforms and 
+        properties are read for every role that is not set explicitly. Default is None.
     **kwargs : dict
         Other parameters for OpenMM, which include:
         - nonbondedMethod : method for nonbonded interactions, default is OM_app.NoCutoff
@@ -68,6 +100,17 @@ class OpenMMWrapper(MMWrapper):
 
     """
 
+    bonded_group = 0
+    nonbonded_group = 1
+    qmmm_group = 31
+
+    # global parameters of the nonbonded force for each include_coulomb treatment
+    coulomb_scales = {'all' : {'lj_scale' : 1.0, 'coulomb_scale' : 1.0, 'link_coulomb_scale' : 1.0},
+                      None : {'lj_scale' : 1.0, 'coulomb_scale' : 1.0, 'link_coulomb_scale' : 1.0},
+                      'no_link' : {'lj_scale' : 1.0, 'coulomb_scale' : 1.0, 'link_coulomb_scale' : 0.0},
+                      'none' : {'lj_scale' : 1.0, 'coulomb_scale' : 0.0, 'link_coulomb_scale' : 0.0},
+                      'only' : {'lj_scale' : 0.0, 'coulomb_scale' : 1.0, 'link_coulomb_scale' : 1.0}}
+
     def __init__(self, sys_info=None, 
                        sys_info_format='pdb', 
                        mm_forcefield='amber99sb.xml',
@@ -78,6 +121,15 @@ class OpenMMWrapper(MMWrapper):
                        step_size = 1,
                        fric_coeff = 1,
                        nonbondedCutoff=0.8,
+                       context_pool_size=10,
+                       subsystem_slicing=False,
+                       residue_template_file=None,
+                       coulomb_force_groups=False,
+                       main_platform=None,
+                       main_platform_properties=None,
+                       subsys_platform=None,
+                       subsys_platform_properties=None,
+                       platform_profile=None,
                        **kwargs):
 
         super().__init__(class_type="OpenMM",
@@ -119,10 +171,33 @@ class OpenMMWrapper(MMWrapper):
             self.integrator = self.NVE_integrator
 
         self.positions = None
+        self.qmmm_forces = None
+        self.main_state = None
+        self.main_state_step = None
+        self.context_pool = ContextPool(max_size=context_pool_size)
+        self.topology_cache = ContextPool(max_size=context_pool_size)
+        self.signature_cache = ContextPool(max_size=context_pool_size)
+        self.subsystem_slicing = subsystem_slicing
+        self.system_slicer = None
+        self.residue_template_file = residue_template_file
+        self.residue_templates = {}
+        self.matched_topologies = set()
+        self.coulomb_force_groups = coulomb_force_groups
+        self.main_platform = main_platform
+        self.main_platform_properties = main_platform_properties
+        self.subsys_platform = subsys_platform
+        self.subsys_platform_properties = subsys_platform_properties
+        self.platform_profile = platform_profile
+
+        if self.platform_profile is not None:
+            self.load_platform_profile()
 
         # parse the input files into topology and coordinates
         self.convert_input()
 
+        if (self.residue_template_file is not None and isinstance(self.forcefield, OM_app.ForceField)):
+            self.load_residue_templates()
+
     def initialize(self, embedding_method):
         """
         Gets information for the system
@@ -152,7 +227,8 @@ class OpenMMWrapper(MMWrapper):
                     integrator = self.NVE_integrator
 
                 OM_system = self.create_openmm_system(self.topology)
-                simulation, integrator_obj = self.create_openmm_simulation(OM_system, self.topology, self.positions, integrator, return_integrator=True)
+                simulation, integrator_obj = self.create_openmm_simulation(OM_system, self.topology, self.positions, integrator, 
+                                                                           return_integrator=True, role='main')
                 simulation.minimizeEnergy()
 
                 #simulation.reporters.append(NetCDFReporter('output_nvt.nc', 50))
@@ -170,6 +246,7 @@ class OpenMMWrapper(MMWrapper):
             pos = self.positions
 
         print('starting main simulation')
+        self.main_state = None
         if embedding_method == 'Mechanical':
             self.main_simulation, self.main_info =\
             self.compute_info(self.topology, pos, initialize=True, return_simulation=True, minimize=False)
@@ -193,10 +270,11 @@ class OpenMMWrapper(MMWrapper):
 
         print(self.integrator)
         # Create an OpenMM simulation from the openmm system, topology, and positions.
-        self.main_simulation = self.create_openmm_simulation(OM_system, self.topology, self.positions, self.integrator)
+        self.main_simulation = self.create_openmm_simulation(OM_system, self.topology, self.positions, self.integrator, role='main')
 
         with open(chkpt_file, 'rb') as f:
             self.main_simulation.context.loadCheckpoint(f.read())
+        self.main_state = None
 
         with open(restart_forces, 'rb') as force_file:
             force = pickle.load(force_file)
@@ -215,27 +293,28 @@ class OpenMMWrapper(MMWrapper):
         
         self.set_up_reporters(self.main_simulation)
         ## Calls openmm wrapper to get information specified
-        self.main_info = OpenMMWrapper.get_state_info(self.main_simulation,
-                                      energy=True,
-                                      positions=True,
-                                      forces=True)
+        self.main_info = self.get_main_info()
         #print('after loading forces')
         #print(self.main_info)
 
-    def take_updated_step(self, force):
+    def take_updated_step(self, force, indices=None):
         """
         Updates the system with forces from qmmm 
         and takes a simulation step
 
         Parameters
         ----------
-        force : dict 
+        force : dict or numpy array
             forces(particle index : forces) in au/bohr to 
-            be updated in custom qmmm force and fed into simulation
+            be updated in custom qmmm force and fed into simulation,
+            or an array of shape (number of particles in indices, 3)
+        indices : list
+            indices of the particles whose forces are given
+            when force is an array. Default is None.
 
         """
 
-        self.update_forces(force, self.qmmm_force, self.main_simulation)
+        self.update_forces(force, self.qmmm_force, self.main_simulation, indices=indices)
         self.main_simulation.step(1)                                             # take a step
         self.main_info = self.get_main_info()                                    # get the energy and gradients after step
         self.positions = self.main_info['positions']                             # get positions after step
@@ -243,48 +322,62 @@ class OpenMMWrapper(MMWrapper):
         #print('main info after step')
         #print(self.main_info)
 
-    def update_forces(self, forces, force_obj, simulation):
+    def update_forces(self, forces, force_obj, simulation, indices=None):
         """
-        Updates a simulation with external forces 
+        Updates a simulation with external forces.
+        When force_obj is the qmmm force, particles 
+        that are not given have their forces set to zero, 
+        and only the particles whose forces change are written.
+        The given forces are not modified.
 
         Parameters
         ----------
-        force : dict 
+        forces : dict or numpy array
             forces(particle index : forces) in au/bohr to 
-            be updated in a force object  and fed into simulation
+            be updated in a force object  and fed into simulation,
+            or an array of shape (number of particles in indices, 3)
         force_obj : OpenMM Force object
             the force object to add the forces to. Can be built in or custom
         simulation : OpenMM simulation object
             where the forces are to be updated in
-        
+        indices : list
+            indices of the particles whose forces are given when forces is an array.
+            Default is None, in which case the array holds the forces of all particles.
+
+        Note
+        ----
+        OpenMM has no call that sets the parameters of all particles at once, 
+        so the changed particles are written one at a time before a single
+        update of the context. The force object needs one term per particle, 
+        added in particle order, as the qmmm force has.
         """
 
-        current = OpenMMWrapper.get_state_info(self.main_simulation,
-                                                energy=False,
-                                                positions=False,
-                                                forces=True)
-        #for f in range(len(current['forces'])):
-        #    print(f, current['forces'][f])
-
-        for f, coord in forces.items():
-            coord *= MMWrapper.au_bohr_to_kjmol_nm             # convert this back to openmm units
-            #print('fed in forces')
-            #print(f, coord)
-            #print('forces from before')
-            #print(current['forces'][f])
-            #coord -= current['forces'][f]
-            #print('new forces')
-            #print(coord)
-            force_obj.setParticleParameters(f, f, coord)  # need to figure out if the first 2 parameters always the same or not
-            
+        if isinstance(forces, dict):
+            indices = np.fromiter(forces.keys(), dtype=int, count=len(forces))
+            forces = [forces[i] for i in indices]
+        elif indices is None:
+            indices = np.arange(len(forces))
+
+        indices = np.asarray(indices, dtype=int)
+        # convert this back to openmm units
+        values = np.asarray(forces, dtype=float).reshape(len(indices), 3) * MMWrapper.au_bohr_to_kjmol_nm
+
+        if force_obj is self.qmmm_force:
+            new_forces = np.zeros_like(self.qmmm_forces)
+            new_forces[indices] = values
+            # particles whose force changed, including those that are no longer given
+            changed = np.nonzero(np.any(new_forces != self.qmmm_forces, axis=1))[0]
+            self.qmmm_forces = new_forces
+            indices, values = changed, new_forces[changed]
+
+        if len(indices) == 0:
+            return
+
+        # the index of each term is the index of its particle
+        for f, coord in zip(indices.tolist(), values.tolist()):
+            force_obj.setParticleParameters(f, f, coord)
 
         force_obj.updateParametersInContext(simulation.context)  # update forces with qmmm force
-        #current2 = OpenMMWrapper.get_state_info(self.main_simulation,
-        #                                        energy=False,
-        #                                        positions=False,
-        #                                        forces=True)
-        #for f in range(len(current2['forces'])):
-        #    print(f, current2['forces'][f])
 
     def take_step(self, num):
         """
@@ -305,6 +398,14 @@ class OpenMMWrapper(MMWrapper):
         Calls :func:`~janus.mm_wrapper.OpenMMWrapper.get_state_info`
         to obtain information.
 
+        The energy and gradients of the MM forces without the qmmm force
+        are obtained from the same state and saved under 'entire_sys', in the format 
+        returned by :func:`~janus.mm_wrapper.MMWrapper.get_energy_and_gradient`, 
+        so QM/MM computations do not need to compute the entire system again.
+
+        The state is only obtained from OpenMM once per MD step,
+        later calls in the same step reuse it.
+
         Returns
         -------
         dict
@@ -312,13 +413,37 @@ class OpenMMWrapper(MMWrapper):
             and positions for the system of interest
     
         """
-        
-        return OpenMMWrapper.get_state_info(self.main_simulation, main_info=True)
+
+        step = self.main_simulation.currentStep
+        if (self.main_state is None or self.main_state_step != step):
+            if self.qmmm_forces is None:
+                self.main_state = OpenMMWrapper.get_state_info(self.main_simulation, main_info=True)
+            else:
+                groups = set(range(32)) - {OpenMMWrapper.qmmm_group}
+                self.main_state = OpenMMWrapper.get_state_info(self.main_simulation, main_info=True, groups_included=groups)
+            self.main_state_step = step
+
+        # a copy, so callers that change the returned dict do not change the saved state
+        info = dict(self.main_state)
+        if self.qmmm_forces is None:
+            return info
+
+        entire_sys = {k : info[k] for k in ['potential', 'kinetic', 'energy', 'positions', 'forces', 'gradients']}
+
+        # add the qmmm force, whose energy is -x*fx-y*fy-z*fz for each particle
+        info['potential'] = info['potential'] - np.sum(info['positions'] * self.qmmm_forces) * MMWrapper.kjmol_to_au
+        info['energy'] = info['potential']
+        info['forces'] = info['forces'] + self.qmmm_forces
+        info['gradients'] = (-1) * info['forces'] * MMWrapper.kjmol_nm_to_au_bohr
+        info['entire_sys'] = entire_sys
+
+        return info
 
     def compute_info(self, topology, positions,
                      include_coulomb='all', initialize=False,
                      return_system=False, return_simulation=False,
-                     link_atoms=None, minimize=False):
+                     link_atoms=None, minimize=False,
+                     atom_indices=None, link_bonds=None, engine=None, forces=True):
         """
         Gets information about a system. 
 
@@ -336,7 +461,10 @@ class OpenMMWrapper(MMWrapper):
         initialize : bool 
             Whether the main system is being initialized.
         return_system : bool 
-            True(default) to return OpenMM system object
+            True(default) to return OpenMM system object. For subsystems, 
+            a copy of the system of the pooled simulation is returned, since 
+            the pooled system is reused by later computations and, with 
+            coulomb_force_groups, holds its charges as parameter offsets
         return_simulation : bool 
             True(default) to return OpenMM simulation object
         link_atoms : list
@@ -344,6 +472,20 @@ class OpenMMWrapper(MMWrapper):
             atoms to remove coulombic forces from. Default is None.
         minimize : bool
             whether to minimize the energy of the system
+        atom_indices : list
+            indices of the atoms of topology in the entire system. 
+            If given and subsystem_slicing is True, the OpenMM system is 
+            sliced out of the system of the entire system. Default is None.
+        link_bonds : list
+            (qm index, mm index, g) in the entire system for each link atom
+            that follows the atoms in atom_indices. Default is None.
+        engine : str
+            'numpy' computes the energy and forces with :class:`~janus.mm_wrapper.NumpyEvaluator`
+            instead of an OpenMM context, which is faster for small subsystems.
+            Not used when initializing, minimizing, returning a simulation or without forces.
+            Default is None, which uses OpenMM.
+        forces : bool
+            whether to get the forces and gradients, default is True
 
         Returns
         -------
@@ -361,15 +503,34 @@ class OpenMMWrapper(MMWrapper):
         >>> state = compute_info(top, pos, return_simulation=False, return_system=False)
         """
 
-        # ensure every computation has same periodic box vector parameters
-        topology.setPeriodicBoxVectors(self.PeriodicBoxVector)
-        # Create an OpenMM system from an object's topology
-        print('topology going into system')
-        print(topology.getNumAtoms())
-        OM_system = self.create_openmm_system(topology, include_coulomb, link_atoms,initialize=initialize)
+        # the minimizer uses all force groups, so a minimized
+        # computation cannot share a simulation with other treatments
+        use_groups = (self.coulomb_force_groups is True and minimize is False)
 
-        # Create an OpenMM simulation from the openmm system, topology, and positions.
-        simulation = self.create_openmm_simulation(OM_system, topology, positions, self.integrator)
+        if (engine == 'numpy' and initialize is False and minimize is False and return_simulation is False and forces is True):
+            evaluator = self.get_pooled_evaluator(topology, include_coulomb, link_atoms, atom_indices, link_bonds)
+            if evaluator is not None:
+                state = self.get_evaluator_info(evaluator, positions)
+                if return_system is True:
+                    return deepcopy(evaluator.system), state
+                return state
+
+        if initialize is True:
+            # ensure every computation has same periodic box vector parameters
+            topology.setPeriodicBoxVectors(self.PeriodicBoxVector)
+
+            # Create an OpenMM system from an object's topology
+            print('topology going into system')
+            print(topology.getNumAtoms())
+            OM_system = self.create_openmm_system(topology, include_coulomb, link_atoms,initialize=initialize)
+
+            # Create an OpenMM simulation from the openmm system, topology, and positions.
+            simulation = self.create_openmm_simulation(OM_system, topology, positions, self.integrator, role='main')
+        else:
+            simulation = self.get_pooled_simulation(topology, positions, include_coulomb, link_atoms,
+                                                    atom_indices, link_bonds, use_groups)
+            if return_system is True:
+                OM_system = deepcopy(simulation.system)
 
         if minimize is True:
             simulation.minimizeEnergy()
@@ -379,10 +540,13 @@ class OpenMMWrapper(MMWrapper):
             self.set_up_reporters(simulation) 
 
         # Calls openmm wrapper to get information specified
-        state = OpenMMWrapper.get_state_info(simulation,
-                                      energy=True,
-                                      positions=True,
-                                      forces=True)
+        if (use_groups is True and initialize is False):
+            state = self.get_coulomb_variant_info(simulation, include_coulomb, forces=forces)
+        else:
+            state = OpenMMWrapper.get_state_info(simulation,
+                                          energy=True,
+                                          positions=True,
+                                          forces=forces)
 
         if return_system is True and return_simulation is True:
             return OM_system, simulation, state
@@ -394,6 +558,311 @@ class OpenMMWrapper(MMWrapper):
             return state
 
 
+    def get_pooled_simulation(self, topology, positions, include_coulomb='all', link_atoms=None,
+                              atom_indices=None, link_bonds=None, use_groups=False):
+        """
+        Gets the simulation of a subsystem from the context pool with the 
+        given positions, creating and pooling a new one if there is none
+
+        Parameters
+        ----------
+        topology : OpenMM topology object
+        positions : OpenMM Vec3 vector 
+            contains the positions of the system in nm
+        include_coulomb : str
+            the coulomb treatment of the simulation, see 
+            :func:`~janus.mm_wrapper.OpenMMWrapper.compute_info`
+        link_atoms : list
+            indices of link atoms. Default is None.
+        atom_indices : list
+            indices of the atoms of topology in the entire system. Default is None.
+        link_bonds : list
+            (qm index, mm index, g) in the entire system for each link atom
+            that follows the atoms in atom_indices. Default is None.
+        use_groups : bool
+            whether to create a simulation that can compute every coulomb treatment,
+            in which case include_coulomb is ignored. Default is False.
+
+        Returns
+        -------
+        OpenMM simulation object
+        """
+
+        slicer = None
+        if atom_indices is not None:
+            slicer = self.get_system_slicer()
+
+        if use_groups is True:
+            include_coulomb = 'force_groups'
+
+        if slicer is not None:
+            key = self.get_context_key(topology, include_coulomb, link_atoms, atom_indices, link_bonds)
+        else:
+            key = self.get_context_key(topology, include_coulomb, link_atoms)
+
+        simulation = self.context_pool.get(key)
+
+        if simulation is None:
+            # ensure every computation has same periodic box vector parameters
+            topology.setPeriodicBoxVectors(self.PeriodicBoxVector)
+
+            if slicer is not None:
+                # Slice the OpenMM system out of the system of the entire system
+                OM_system = slicer.slice(atom_indices, link_bonds)
+                if use_groups is False:
+                    self.set_coulomb_treatment(OM_system, include_coulomb, link_atoms)
+            else:
+                # Create an OpenMM system from an object's topology
+                print('topology going into system')
+                print(topology.getNumAtoms())
+                if use_groups is True:
+                    OM_system = self.create_openmm_system(topology)
+                else:
+                    OM_system = self.create_openmm_system(topology, include_coulomb, link_atoms)
+
+            if use_groups is True:
+                self.set_coulomb_force_groups(OM_system, link_atoms)
+
+            # Create an OpenMM simulation from the openmm system, topology, and positions.
+            simulation = self.create_openmm_simulation(OM_system, topology, positions, self.integrator)
+            self.context_pool.put(key, simulation)
+        else:
+            self.reset_simulation(simulation, positions)
+
+        return simulation
+
+    def get_pooled_evaluator(self, topology, include_coulomb='all', link_atoms=None,
+                             atom_indices=None, link_bonds=None):
+        """
+        Gets the :class:`~janus.mm_wrapper.NumpyEvaluator` of a subsystem 
+        from the context pool, creating and pooling a new one if there is none
+
+        Parameters
+        ----------
+        topology : OpenMM topology object
+        include_coulomb : str
+            the coulomb treatment, see :func:`~janus.mm_wrapper.OpenMMWrapper.compute_info`
+        link_atoms : list
+            indices of link atoms. Default is None.
+        atom_indices : list
+            indices of the atoms of topology in the entire system. Default is None.
+        link_bonds : list
+            (qm index, mm index, g) in the entire system for each link atom
+            that follows the atoms in atom_indices. Default is None.
+
+        Returns
+        -------
+        :class:`~janus.mm_wrapper.NumpyEvaluator`
+            None if the system cannot be evaluated with numpy
+        """
+
+        slicer = None
+        if atom_indices is not None:
+            slicer = self.get_system_slicer()
+
+        if slicer is not None:
+            key = ('numpy',) + self.get_context_key(topology, include_coulomb, link_atoms, atom_indices, link_bonds)
+        else:
+            key = ('numpy',) + self.get_context_key(topology, include_coulomb, link_atoms)
+
+        evaluator = self.context_pool.get(key)
+
+        if evaluator is None:
+            # ensure every computation has same periodic box vector parameters
+            topology.setPeriodicBoxVectors(self.PeriodicBoxVector)
+
+            if slicer is not None:
+                OM_system = slicer.slice(atom_indices, link_bonds)
+                self.set_coulomb_treatment(OM_system, include_coulomb, link_atoms)
+            else:
+                OM_system = self.create_openmm_system(topology, include_coulomb, link_atoms)
+
+            try:
+                evaluator = NumpyEvaluator(OM_system)
+            except ValueError as e:
+                print('using OpenMM instead of numpy: {}'.format(e))
+                # remember that this system cannot be evaluated with numpy
+                evaluator = False
+
+            self.context_pool.put(key, evaluator)
+
+        if evaluator is False:
+            return None
+
+        return evaluator
+
+    def get_evaluator_info(self, evaluator, positions):
+        """
+        Gets the energy and forces of a system from a 
+        :class:`~janus.mm_wrapper.NumpyEvaluator` in the same format as
+        :func:`~janus.mm_wrapper.OpenMMWrapper.get_state_info`
+
+        Parameters
+        ----------
+        evaluator : :class:`~janus.mm_wrapper.NumpyEvaluator`
+        positions : OpenMM Vec3 vector or numpy array
+            contains the positions of the system in nm
+
+        Returns
+        -------
+        dict
+            Information including the energy, forces, gradients and positions.
+            The kinetic energy is zero.
+        """
+
+        if OM_unit.is_quantity(positions):
+            positions = positions.value_in_unit(OM_unit.nanometer)
+        positions = np.asarray(positions, dtype=float)
+
+        energy, forces = evaluator.compute(positions)
+
+        values = {}
+        values['potential'] = energy * MMWrapper.kjmol_to_au
+        values['kinetic'] = 0.0
+        values['energy'] = values['potential']
+        values['positions'] = positions
+        values['forces'] = forces
+        values['gradients'] = (-1) * forces * MMWrapper.kjmol_nm_to_au_bohr
+
+        return values
+
+    def get_context_key(self, topology, include_coulomb='all', link_atoms=None,
+                        atom_indices=None, link_bonds=None):
+        """
+        Gets the signature used to look up a pooled simulation.
+        Two topologies have the same signature if they have the same
+        residues, atoms, elements and bonds in the same order.
+        Sliced subsystems are identified by their atom indices and link bonds instead.
+
+        Parameters
+        ----------
+        topology : OpenMM topology object
+        include_coulomb : str
+            the coulomb treatment of the simulation, see 
+            :func:`~janus.mm_wrapper.OpenMMWrapper.compute_info`
+        link_atoms : list
+            indices of link atoms, only relevant if include_coulomb is 'no_link' or 'force_groups'
+        atom_indices : list
+            indices of the atoms of a sliced subsystem in the entire system
+        link_bonds : list
+            (qm index, mm index, g) for each link atom of a sliced subsystem
+
+        Returns
+        -------
+        tuple
+            hashable signature of the simulation
+        """
+
+        if atom_indices is not None:
+            atoms = ('sliced', tuple(atom_indices))
+            bonds = tuple(tuple(link) for link in link_bonds) if link_bonds else None
+        else:
+            atoms, bonds = self.get_topology_signature(topology)
+
+        if (include_coulomb in ['no_link', 'force_groups'] and link_atoms):
+            links = tuple(link_atoms)
+        else:
+            links = None
+
+        return (atoms, bonds, include_coulomb, links)
+
+    def get_topology_signature(self, topology):
+        """
+        Gets a signature of a topology made of the residue name, 
+        atom name, and element of every atom and the bonds between atoms
+
+        Parameters
+        ----------
+        topology : OpenMM topology object
+
+        Returns
+        -------
+        tuple
+            hashable signature of the atoms
+        tuple
+            hashable signature of the bonds
+        """
+
+        cached = self.signature_cache.get(id(topology))
+        if (cached is not None and cached[0] is topology):
+            return cached[1]
+
+        atoms = tuple((atom.residue.name, atom.name, atom.element.symbol if atom.element else None)
+                      for atom in topology.atoms())
+        bonds = tuple((bond[0].index, bond[1].index) for bond in topology.bonds())
+
+        self.signature_cache.put(id(topology), (topology, (atoms, bonds)))
+
+        return atoms, bonds
+
+    def get_residue_signature(self, residue):
+        """
+        Gets a signature of a residue made of its name, the name and element 
+        of its atoms, its internal bonds, and the atoms with external bonds.
+        Residues with the same signature match the same residue template.
+
+        Parameters
+        ----------
+        residue : OpenMM residue object
+
+        Returns
+        -------
+        tuple
+            hashable signature of the residue
+        """
+
+        atoms = tuple((atom.name, atom.element.symbol if atom.element else None) for atom in residue.atoms())
+        bonds = tuple(sorted(tuple(sorted((bond[0].name, bond[1].name))) for bond in residue.internal_bonds()))
+        external = tuple(sorted(atom.name for bond in residue.external_bonds()
+                                for atom in bond if atom.residue == residue))
+
+        return (residue.name, atoms, bonds, external)
+
+    def get_system_slicer(self):
+        """
+        Gets the :class:`~janus.mm_wrapper.SystemSlicer` built from the 
+        OpenMM system of the entire system, creating it the first time it is needed.
+
+        Returns
+        -------
+        :class:`~janus.mm_wrapper.SystemSlicer`
+            None if subsystem_slicing is False or the system 
+            of the entire system cannot be sliced
+        """
+
+        if self.subsystem_slicing is not True:
+            return None
+
+        if self.system_slicer is None:
+            self.topology.setPeriodicBoxVectors(self.PeriodicBoxVector)
+            try:
+                self.system_slicer = SystemSlicer(self.create_openmm_system(self.topology))
+            except ValueError as e:
+                print('subsystem slicing turned off: {}'.format(e))
+                self.subsystem_slicing = False
+
+        return self.system_slicer
+
+    def reset_simulation(self, simulation, positions):
+        """
+        Prepares a pooled simulation for a new computation by
+        updating the positions and resetting the velocities
+        the same way :func:`~janus.mm_wrapper.OpenMMWrapper.create_openmm_simulation` does
+
+        Parameters
+        ----------
+        simulation : OpenMM simulation object
+        positions : OpenMM Vec3 vector 
+            contains the positions of the system in nm
+        """
+
+        simulation.context.setPositions(positions)
+
+        if self.integrator == 'Verlet':
+            simulation.context.setVelocitiesToTemperature(self.temp)
+        else:
+            simulation.context.setVelocities(np.zeros((simulation.system.getNumParticles(), 3)))
+
     def create_openmm_system(self, topology, include_coulomb='all',
                              link_atoms=None, initialize=False):
         """
@@ -435,9 +904,13 @@ class OpenMMWrapper(MMWrapper):
 
         # check to see if there are unmatched residues in pdb, create residue templates if there are
         if (self.system_info_format == 'pdb' or self.use_pdb is True):
-            unmatched = self.forcefield.getUnmatchedResidues(topology)
-            if unmatched:
-                self.create_new_residue_template(topology)
+            # topologies that were matched before do not need to be checked again
+            signature = self.get_topology_signature(topology)
+            if signature not in self.matched_topologies:
+                unmatched = self.forcefield.getUnmatchedResidues(topology)
+                if unmatched:
+                    self.create_new_residue_template(topology)
+                self.matched_topologies.add(signature)
 
             openmm_system = self.forcefield.createSystem(topology,
                                             nonbondedMethod=self.nonbondedMethod,
@@ -482,11 +955,39 @@ class OpenMMWrapper(MMWrapper):
             for i in range(openmm_system.getNumParticles()):
                 self.qmmm_force.addParticle(i, np.array([0.0, 0.0, 0.0]))
             
+            # the qmmm force is kept in its own force group so the MM forces can be obtained without it
+            self.qmmm_force.setForceGroup(OpenMMWrapper.qmmm_group)
+            self.qmmm_forces = np.zeros((openmm_system.getNumParticles(), 3))
+
             openmm_system.addForce(self.qmmm_force)
 
             self.main_charges = [openmm_system.getForce(3).getParticleParameters(i)[0]/OM_unit.elementary_charge
                                  for i in range(openmm_system.getNumParticles())]
 
+        self.set_coulomb_treatment(openmm_system, include_coulomb, link_atoms)
+
+        return openmm_system
+
+    def set_coulomb_treatment(self, openmm_system, include_coulomb='all', link_atoms=None):
+        """
+        Modifies the coulombic interactions of an OpenMM system 
+
+        Parameters
+        ----------
+        openmm_system : OpenMM system object
+        include_coulomb : str
+
+            whether to include coulombic interactions. 
+            'all' (default) includes coulombic forces for all particles,
+            'no_link' excludes coulombic forces for link atoms,
+            'only' excludes all other forces for all atoms,
+            'none' excludes coulombic forces for all particles.
+
+        link_atoms : list
+            if included as a list with include_coulomb='no_link', specifies which 
+            atoms to remove coulombic forces from. Default is None.
+        """
+
         # If in electrostatic embedding scheme need to get a system without coulombic interactions
         if include_coulomb == 'none':
             # get the nonbonded force
@@ -503,7 +1004,84 @@ class OpenMMWrapper(MMWrapper):
             self.set_LJ_zero(openmm_system)
 
 
-        return openmm_system
+    def set_coulomb_force_groups(self, openmm_system, link_atoms=None):
+        """
+        Prepares an OpenMM system so that every include_coulomb treatment 
+        can be computed from the same context. Bonded forces are put in 
+        force group bonded_group and nonbonded forces in nonbonded_group.
+        The charges and Lennard-Jones well depths of the particles are moved into
+        parameter offsets that are scaled by the global parameters in coulomb_scales.
+        Exceptions are not changed, as is the case for 
+        :func:`~janus.mm_wrapper.OpenMMWrapper.set_coulomb_treatment`
+
+        Parameters
+        ----------
+        openmm_system : OpenMM system object
+        link_atoms : list
+            indices of link atoms, whose charges are scaled separately 
+            for the 'no_link' treatment. Default is None.
+        """
+
+        if link_atoms is None:
+            link_atoms = []
+        link_atoms = set(link_atoms)
+
+        for force in openmm_system.getForces():
+            if type(force) is OM.NonbondedForce:
+                force.setForceGroup(OpenMMWrapper.nonbonded_group)
+                for param in OpenMMWrapper.coulomb_scales['all']:
+                    force.addGlobalParameter(param, 1.0)
+
+                for i in range(force.getNumParticles()):
+                    charge, sigma, epsilon = force.getParticleParameters(i)
+                    force.setParticleParameters(i, charge=0.0, sigma=sigma, epsilon=0.0)
+                    if i in link_atoms:
+                        force.addParticleParameterOffset('link_coulomb_scale', i, charge, 0.0, 0.0)
+                    else:
+                        force.addParticleParameterOffset('coulomb_scale', i, charge, 0.0, 0.0)
+                    force.addParticleParameterOffset('lj_scale', i, 0.0, 0.0, epsilon)
+            else:
+                force.setForceGroup(OpenMMWrapper.bonded_group)
+
+    def get_coulomb_variant_info(self, simulation, include_coulomb='all', forces=True):
+        """
+        Gets the state information of a simulation prepared with 
+        :func:`~janus.mm_wrapper.OpenMMWrapper.set_coulomb_force_groups`
+        for one include_coulomb treatment
+
+        Parameters
+        ----------
+        simulation : OpenMM simulation object
+        include_coulomb : str
+            the coulomb treatment, see :func:`~janus.mm_wrapper.OpenMMWrapper.compute_info`.
+            Treatments that are not recognized include all interactions, 
+            as in :func:`~janus.mm_wrapper.OpenMMWrapper.set_coulomb_treatment`
+        forces : bool
+            whether to get the forces and gradients, default is True
+
+        Returns
+        -------
+        dict
+            A dictionary with state information
+        """
+
+        if include_coulomb not in OpenMMWrapper.coulomb_scales:
+            include_coulomb = 'all'
+
+        for param, value in OpenMMWrapper.coulomb_scales[include_coulomb].items():
+            if simulation.context.getParameter(param) != value:
+                simulation.context.setParameter(param, value)
+
+        if include_coulomb == 'only':
+            groups = {OpenMMWrapper.nonbonded_group}
+        else:
+            groups = -1
+
+        return OpenMMWrapper.get_state_info(simulation,
+                                            energy=True,
+                                            positions=True,
+                                            forces=forces,
+                                            groups_included=groups)
 
     def set_charge_zero(self, OM_system, link_atoms=None):
         """
@@ -564,6 +1142,9 @@ class OpenMMWrapper(MMWrapper):
         currently, if there is unmatched name, currently only checks original 
         unmodified residue, N-terminus form, and C-terminus form. 
         This may not be robust.
+        Templates are cached by residue signature, so each modified residue 
+        only gets a template once. Modified residues of the same original residue
+        that have different atoms or bonds are named Modified_NAME, Modified_NAME_2, etc.
 
         Parameters
         ----------
@@ -578,10 +1159,19 @@ class OpenMMWrapper(MMWrapper):
         # Loop through list of unmatched residues
         print('Loop through list of unmatched residues')
         for i, res in enumerate(unmatched_res):
+            signature = self.get_residue_signature(res)
+            if signature in self.residue_templates:
+                print('template for modified residue {} already registered'.format(res.name))
+                continue
+
             res_name = res.name                             # get the name of the original unmodifed residue
             n_res_name = 'N' + res.name                     # get the name of the N-terminus form of original residue
             c_res_name = 'C' + res.name                     # get the name of the C-terminus form of original residue
             name = 'Modified_' + res_name                   # assign new name
+            count = 1
+            while name in [t.name for t in self.residue_templates.values()]:
+                count += 1
+                name = 'Modified_{}_{}'.format(res_name, count)
             template[i].name = name
 
             # loop through all atoms in modified template and all atoms in orignal template to assign atom type
@@ -610,9 +1200,54 @@ class OpenMMWrapper(MMWrapper):
             # register the new template to the forcefield object
             print('register the new template to the forcefield object')
             self.forcefield.registerResidueTemplate(template[i])
+            self.residue_templates[signature] = template[i]
+
+        if self.residue_template_file is not None:
+            self.save_residue_templates()
+
+    def load_residue_templates(self):
+        """
+        Loads residue templates saved in self.residue_template_file
+        by an earlier run and registers them into self.forcefield.
+        Templates saved for other forcefields are ignored.
+        """
+
+        if not os.path.isfile(self.residue_template_file):
+            return
+
+        with open(self.residue_template_file, 'rb') as f:
+            saved = pickle.load(f)
+
+        if saved['forcefield'] != (self.ff, self.ff_water):
+            print('residue templates in {} are for a different forcefield, not loading'.format(self.residue_template_file))
+            return
+
+        for signature, template in saved['templates'].items():
+            if signature not in self.residue_templates:
+                if template.name in self.forcefield._templates:
+                    template.overrideLevel = self.forcefield._templates[template.name].overrideLevel + 1
+                self.forcefield.registerResidueTemplate(template)
+                self.residue_templates[signature] = template
+
+        print('loaded {} residue templates from {}'.format(len(saved['templates']), self.residue_template_file))
+
+    def save_residue_templates(self):
+        """
+        Saves the residue templates generated for unmatched residues 
+        to self.residue_template_file. The file is replaced atomically, 
+        so several runs can share the same file.
+        """
+
+        saved = {'forcefield' : (self.ff, self.ff_water), 'templates' : self.residue_templates}
+
+        directory = os.path.dirname(os.path.abspath(self.residue_template_file))
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(saved, f)
+        os.replace(tmp, self.residue_template_file)
 
 
-    def create_openmm_simulation(self, openmm_system, topology, positions, integrator,  return_integrator=False, seed=0):
+    def create_openmm_simulation(self, openmm_system, topology, positions, integrator,  return_integrator=False, seed=0, role='subsys'):
         """
         Creates an OpenMM simulation object given
         an OpenMM system, topology, and positions
@@ -630,6 +1265,10 @@ class OpenMMWrapper(MMWrapper):
         seed : int
             Set a random seed number for the Langevin integrator. 
             Default is 0, which means seed is randomized every time.
+        role : str
+            Whether the simulation is the main MD simulation ('main') or 
+            a subsystem computation ('subsys', default), which determines 
+            the platform and platform properties used
 
         Returns
         -------
@@ -653,7 +1292,8 @@ class OpenMMWrapper(MMWrapper):
         else:
             print('only Langevin integrator supported currently')
 
-        simulation = OM_app.Simulation(topology, openmm_system, integrator_obj)
+        platform, properties = self.get_platform(role)
+        simulation = OM_app.Simulation(topology, openmm_system, integrator_obj, platform, properties)
         simulation.context.setPositions(positions)
 
         if integrator == 'Verlet':
@@ -664,6 +1304,124 @@ class OpenMMWrapper(MMWrapper):
         else:
             return simulation, integrator_obj
 
+    def get_platform(self, role='subsys'):
+        """
+        Gets the OpenMM platform and platform properties of a role
+
+        Parameters
+        ----------
+        role : str
+            'main' for the main MD simulation, 'subsys' (default) for subsystem computations
+
+        Returns
+        -------
+        OpenMM platform object
+            None if no platform is set for the role
+        dict
+            platform properties with string values, None if not set
+        """
+
+        if role == 'main':
+            name, properties = self.main_platform, self.main_platform_properties
+        else:
+            name, properties = self.subsys_platform, self.subsys_platform_properties
+
+        if name is None:
+            return None, None
+
+        platform = OM.Platform.getPlatformByName(name)
+        if properties is not None:
+            properties = {k : str(v) for k, v in properties.items()}
+
+        return platform, properties
+
+    def load_platform_profile(self):
+        """
+        Sets the platform and platform properties of every role
+        that is not set explicitly from self.platform_profile
+        """
+
+        with open(self.platform_profile, 'r') as f:
+            profile = json.load(f)
+
+        for role in ['main', 'subsys']:
+            if (role in profile and getattr(self, role + '_platform') is None):
+                print('using {} platform with properties {} for {}'.format(profile[role]['platform'], 
+                                                                          profile[role]['properties'], role))
+                setattr(self, role + '_platform', profile[role]['platform'])
+                setattr(self, role + '_platform_properties', profile[role]['properties'])
+
+    def calibrate_platforms(self, topology, positions, platforms=None, threads=None, repeats=10):
+        """
+        Times energy and force evaluations of a system on 
+        OpenMM platforms with different platform properties
+
+        Parameters
+        ----------
+        topology : OpenMM topology object
+        positions : OpenMM Vec3 vector 
+            contains the positions of the system in nm
+        platforms : list
+            names of the platforms to time. Default is None, which times CPU and Reference.
+            Platforms that are not available are skipped.
+        threads : list
+            numbers of threads to time the CPU platform with. Default is None,
+            which uses powers of two up to the number of cores, and the number of cores
+        repeats : int
+            number of evaluations averaged for every setting, default is 10
+
+        Returns
+        -------
+        dict
+            the fastest setting, with keys 'platform', 'properties' and 'time' in seconds
+        list
+            a dict for every setting that was timed
+        """
+
+        if platforms is None:
+            platforms = ['CPU', 'Reference']
+
+        if threads is None:
+            cores = os.cpu_count() or 1
+            threads = sorted(set([2**i for i in range(cores.bit_length()) if 2**i <= cores] + [cores]))
+
+        available = [OM.Platform.getPlatform(i).getName() for i in range(OM.Platform.getNumPlatforms())]
+
+        # ensure every computation has same periodic box vector parameters
+        topology.setPeriodicBoxVectors(self.PeriodicBoxVector)
+        OM_system = self.create_openmm_system(topology)
+
+        timings = []
+        for name in platforms:
+            if name not in available:
+                print('{} platform not available'.format(name))
+                continue
+
+            if name == 'CPU':
+                settings = [{'Threads' : str(n)} for n in threads]
+            else:
+                settings = [{}]
+
+            for properties in settings:
+                integrator = OM.VerletIntegrator(self.step_size)
+                context = OM.Context(OM_system, integrator, OM.Platform.getPlatformByName(name), properties)
+                context.setPositions(positions)
+                context.getState(getEnergy=True, getForces=True)
+
+                start = time.perf_counter()
+                for i in range(repeats):
+                    context.setPositions(positions)
+                    context.getState(getEnergy=True, getForces=True)
+                elapsed = (time.perf_counter() - start)/repeats
+
+                print('{} platform with properties {}: {:.6f} s per evaluation'.format(name, properties, elapsed))
+                timings.append({'platform' : name, 'properties' : properties, 'time' : elapsed})
+                del context, integrator
+
+        best = min(timings, key=lambda t: t['time'])
+
+        return best, timings
+
     def get_state_info(simulation,
                        main_info=False,
                        energy=True,
@@ -763,7 +1521,7 @@ class OpenMMWrapper(MMWrapper):
             OM_app.PDBFile.writeqmmm_stepsFile(info['topology'], info['positions'], open(self.return_system_filename, 'w'))
  
 
-    def create_modeller(self, atoms, keep_atoms=False):
+    def create_modeller(self, atoms, keep_atoms=False, positions=None):
         """
         Makes a OpenMM modeller object based on given geometry
 
@@ -774,6 +1532,9 @@ class OpenMMWrapper(MMWrapper):
         keep_atoms : bool 
             Whether to keep the atoms specified in the modeller or delete them.
             Default is false.
+        positions : OpenMM Vec3 vector
+            positions of all atoms of the system. Default is None,
+            which uses the positions of the input pdb file
 
         Returns
         -------
@@ -785,7 +1546,10 @@ class OpenMMWrapper(MMWrapper):
         modeller = self.make_modeller(keep_qm=True)
         """
 
-        modeller = OM_app.Modeller(self.topology, self.pdb.getPositions())
+        if positions is None:
+            positions = self.pdb.getPositions()
+
+        modeller = OM_app.Modeller(self.topology, positions)
         if keep_atoms is False:
             OpenMMWrapper.delete_atoms(modeller, atoms)
         elif keep_atoms is True:
@@ -865,7 +1629,9 @@ class OpenMMWrapper(MMWrapper):
     def convert_trajectory(self, traj):
         """
         Converts an OpenMM trajectory to get 
-        topology and positions that are compatible with MDtraj
+        topology and positions that are compatible with MDtraj.
+        The OpenMM topology of a MDtraj topology is only created once
+        and reused as long as the same MDtraj topology object is given.
         
         Parameters
         ----------
@@ -873,17 +1639,23 @@ class OpenMMWrapper(MMWrapper):
 
         Returns
         -------
-        list
-            positions in nm
         OpenMM topology object
+        numpy array
+            positions in nm
                   
         Examples
         --------
-        >>> positions, topology = convert_trajectory(OpenMM_traj)
+        >>> topology, positions = convert_trajectory(OpenMM_traj)
         """
 
-        topology = traj.topology.to_openmm()
-        positions = traj.openmm_positions((0))
+        cached = self.topology_cache.get(id(traj.topology))
+        if (cached is not None and cached[0] is traj.topology):
+            topology = cached[1]
+        else:
+            topology = traj.topology.to_openmm()
+            self.topology_cache.put(id(traj.topology), (traj.topology, topology))
+
+        positions = traj.xyz[0].astype(np.float64)
         
         return topology, positions
 
@@ -0,0 +1,257 @@
+import simtk.openmm as OM
+import numpy as np
+
+
+class SystemSlicer(object):
+    """
+    Builds OpenMM system objects for subsystems by copying
+    the relevant particles, bonded terms, nonbonded parameters and
+    exceptions out of a system that describes the entire system.
+    The entire system only has to be parameterized once.
+
+    Note
+    ----
+    A link atom takes over the parameters of the MM atom it replaces.
+    Terms that contain both the QM and the MM atom of a cut bond are kept
+    with the MM atom swapped for the link atom, and the equilibrium length
+    of the cut bond is scaled by the link atom scale factor g.
+
+    Parameters
+    ----------
+    system : OpenMM system object
+        The system of the entire system. Supported forces are
+        HarmonicBondForce, HarmonicAngleForce, PeriodicTorsionForce,
+        RBTorsionForce, NonbondedForce and CMMotionRemover.
+    """
+
+    n_particles = {OM.HarmonicBondForce : 2,
+                   OM.HarmonicAngleForce : 3,
+                   OM.PeriodicTorsionForce : 4,
+                   OM.RBTorsionForce : 4}
+
+    def __init__(self, system):
+
+        self.system = system
+        self.num_particles = system.getNumParticles()
+        self.masses = [system.getParticleMass(i) for i in range(self.num_particles)]
+
+        if system.getNumConstraints() > 0:
+            self.constraints = self.split_terms([system.getConstraintParameters(i)
+                                                 for i in range(system.getNumConstraints())], 2)
+        else:
+            self.constraints = None
+
+        for i in range(self.num_particles):
+            if system.isVirtualSite(i):
+                raise ValueError("systems with virtual sites cannot be sliced")
+
+        # extract the parameters of every force once
+        self.forces = []
+        for force in system.getForces():
+            if type(force) in SystemSlicer.n_particles:
+                if type(force) is OM.HarmonicBondForce:
+                    terms = [force.getBondParameters(i) for i in range(force.getNumBonds())]
+                elif type(force) is OM.HarmonicAngleForce:
+                    terms = [force.getAngleParameters(i) for i in range(force.getNumAngles())]
+                else:
+                    terms = [force.getTorsionParameters(i) for i in range(force.getNumTorsions())]
+                self.forces.append((force, self.split_terms(terms, SystemSlicer.n_particles[type(force)])))
+
+            elif type(force) is OM.NonbondedForce:
+                if (force.getNumGlobalParameters() > 0 or force.getNumParticleParameterOffsets() > 0):
+                    raise ValueError("nonbonded forces with parameter offsets cannot be sliced")
+                particles = [force.getParticleParameters(i) for i in range(force.getNumParticles())]
+                exceptions = [force.getExceptionParameters(i) for i in range(force.getNumExceptions())]
+                self.forces.append((force, (particles, self.split_terms(exceptions, 2))))
+
+            elif type(force) is OM.CMMotionRemover:
+                self.forces.append((force, None))
+
+            else:
+                raise ValueError("{} cannot be sliced".format(type(force).__name__))
+
+    def split_terms(self, terms, n):
+        """
+        Splits a list of force terms into an array of particle indices
+        and a list of the remaining parameters
+
+        Parameters
+        ----------
+        terms : list
+            parameters of each term as returned by OpenMM,
+            starting with the particle indices
+        n : int
+            number of particles in each term
+
+        Returns
+        -------
+        numpy array
+            particle indices of each term, shape (number of terms, n)
+        list
+            the parameters of each term
+        """
+
+        particles = np.array([t[:n] for t in terms], dtype=int).reshape(len(terms), n)
+        params = [t[n:] for t in terms]
+
+        return particles, params
+
+    def map_terms(self, particles, new_index, links, bonded=True):
+        """
+        Finds the terms that are within a subsystem
+
+        Parameters
+        ----------
+        particles : numpy array
+            particle indices of each term in the entire system
+        new_index : numpy array
+            index of each particle of the entire system in the subsystem,
+            -1 for particles that are not in the subsystem
+        links : list
+            (qm index, mm index, link index, g) for each link atom
+        bonded : bool
+            If True (default), a term that involves the MM atom of a cut bond
+            is only kept if it also involves the QM atom of that bond.
+            Set to False for nonbonded exceptions, which must be kept for every
+            pair whose other atom is in the subsystem.
+
+        Returns
+        -------
+        list
+            (term index, particle indices in the subsystem, scale factor)
+            for every term that is kept, in the original order.
+            The scale factor is None if the term does not involve a link atom
+        """
+
+        if len(particles) == 0:
+            return []
+
+        idx = new_index[particles]
+        kept = [(t, tuple(idx[t]), None) for t in np.nonzero(np.all(idx >= 0, axis=1))[0]]
+
+        for q, m, l, g in links:
+            has_mm = (particles == m)
+            candidates = has_mm.any(axis=1)
+            if bonded is True:
+                candidates &= (particles == q).any(axis=1)
+            for t in np.nonzero(candidates)[0]:
+                mapped = np.where(has_mm[t], l, idx[t])
+                if np.all(mapped >= 0):
+                    kept.append((t, tuple(mapped), g))
+
+        kept.sort(key=lambda term: term[0])
+
+        return kept
+
+    def slice(self, atom_indices, link_bonds=None):
+        """
+        Creates an OpenMM system for a subsystem
+
+        Parameters
+        ----------
+        atom_indices : list
+            indices of the subsystem atoms in the entire system,
+            in the order the atoms appear in the subsystem
+        link_bonds : list
+            (qm index, mm index, g) for each link atom appended
+            after the atoms in atom_indices. Default is None.
+
+        Returns
+        -------
+        OpenMM system object
+
+        Examples
+        --------
+        >>> sys = slicer.slice([0,1,2])
+        sys = slicer.slice([0,1,2,3], link_bonds=[(3, 4, 0.71)])
+        """
+
+        if link_bonds is None:
+            link_bonds = []
+
+        new_index = np.full(self.num_particles, -1, dtype=int)
+        new_index[np.asarray(atom_indices, dtype=int)] = np.arange(len(atom_indices))
+
+        links = [(q, m, len(atom_indices) + i, g) for i, (q, m, g) in enumerate(link_bonds)]
+        originals = list(atom_indices) + [m for q, m, l, g in links]
+
+        system = OM.System()
+        system.setDefaultPeriodicBoxVectors(*self.system.getDefaultPeriodicBoxVectors())
+
+        for i in originals:
+            system.addParticle(self.masses[i])
+
+        if self.constraints is not None:
+            particles, params = self.constraints
+            for t, (a, b), g in self.map_terms(particles, new_index, links):
+                distance = params[t][0] if g is None else params[t][0]*g
+                system.addConstraint(int(a), int(b), distance)
+
+        for force, terms in self.forces:
+
+            if type(force) is OM.HarmonicBondForce:
+                new_force = OM.HarmonicBondForce()
+                particles, params = terms
+                for t, (a, b), g in self.map_terms(particles, new_index, links):
+                    length, k = params[t]
+                    if g is not None:
+                        length *= g
+                    new_force.addBond(int(a), int(b), length, k)
+
+            elif type(force) is OM.HarmonicAngleForce:
+                new_force = OM.HarmonicAngleForce()
+                particles, params = terms
+                for t, p, g in self.map_terms(particles, new_index, links):
+                    new_force.addAngle(*[int(i) for i in p], *params[t])
+
+            elif type(force) is OM.PeriodicTorsionForce:
+                new_force = OM.PeriodicTorsionForce()
+                particles, params = terms
+                for t, p, g in self.map_terms(particles, new_index, links):
+                    new_force.addTorsion(*[int(i) for i in p], *params[t])
+
+            elif type(force) is OM.RBTorsionForce:
+                new_force = OM.RBTorsionForce()
+                particles, params = terms
+                for t, p, g in self.map_terms(particles, new_index, links):
+                    new_force.addTorsion(*[int(i) for i in p], *params[t])
+
+            elif type(force) is OM.NonbondedForce:
+                new_force = OM.NonbondedForce()
+                SystemSlicer.copy_nonbonded_settings(force, new_force)
+                particles, (exception_particles, exception_params) = terms
+                for i in originals:
+                    new_force.addParticle(*particles[i])
+                for t, (a, b), g in self.map_terms(exception_particles, new_index, links, bonded=False):
+                    new_force.addException(int(a), int(b), *exception_params[t])
+
+            elif type(force) is OM.CMMotionRemover:
+                new_force = OM.CMMotionRemover(force.getFrequency())
+
+            new_force.setForceGroup(force.getForceGroup())
+            system.addForce(new_force)
+
+        return system
+
+    def copy_nonbonded_settings(force, new_force):
+        """
+        Copies the nonbonded method and its settings from
+        one nonbonded force to another
+
+        Parameters
+        ----------
+        force : OpenMM NonbondedForce object
+            force to copy settings from
+        new_force : OpenMM NonbondedForce object
+            force to copy settings to
+        """
+
+        new_force.setNonbondedMethod(force.getNonbondedMethod())
+        new_force.setCutoffDistance(force.getCutoffDistance())
+        new_force.setUseSwitchingFunction(force.getUseSwitchingFunction())
+        new_force.setSwitchingDistance(force.getSwitchingDistance())
+        new_force.setUseDispersionCorrection(force.getUseDispersionCorrection())
+        new_force.setReactionFieldDielectric(force.getReactionFieldDielectric())
+        new_force.setEwaldErrorTolerance(force.getEwaldErrorTolerance())
+        new_force.setPMEParameters(*force.getPMEParameters())
+        new_force.setReciprocalSpaceForceGroup(force.getReciprocalSpaceForceGroup())
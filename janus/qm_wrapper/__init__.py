@@ -1,2 +1,5 @@
+from janus.qm_wrapper.qm_cache import QMCache
 from janus.qm_wrapper.qm_wrapper import QMWrapper
 from janus.qm_wrapper.psi4_wrapper import Psi4Wrapper
+from janus.qm_wrapper.analytic_wrapper import AnalyticWrapper
+from janus.qm_wrapper.qm_worker import QMWorkerPool, QMWorkerWrapper
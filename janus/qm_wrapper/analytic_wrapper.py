@@ -0,0 +1,341 @@
+import time
+import numpy as np
+import mdtraj as md
+from janus.qm_wrapper import QMWrapper
+
+class AnalyticWrapper(QMWrapper):
+    r"""
+    A wrapper class that stands in for a QM program with deterministic,
+    analytic energies and gradients, so the QM/MM machinery (partitioning,
+    scheduling, interpolation, caches and workers) can be tested and benchmarked
+    without a QM program. Class inherits from QMWrapper.
+
+    The energy in hartrees is
+
+    .. math::
+        E = \sum_i -0.7687 Z_i^{7/3} + \sum_{i<j} D\left[(1 - e^{-a(r_{ij} - r_0)})^2 - 1\right] + \sum_{i,k} \frac{q_i Q_k}{r_{ik}}
+
+    where i and j are QM atoms with atomic numbers Z and partial charges q,
+    k are the external charges Q and distances are in bohr.
+    """
+
+    # partial charges of QM atoms for the interaction with external charges
+    default_atom_charges = {'H' : 0.4, 'C' : 0.0, 'N' : -0.5, 'O' : -0.8, 'S' : -0.3}
+
+    bohr_per_angstrom = 1.8897261246257702
+
+    def __init__(self,
+                 method='analytic',
+                 charge=0,
+                 multiplicity=1,
+                 morse_depth=0.1,
+                 morse_width=1.0,
+                 morse_distance=2.0,
+                 atom_charges=None,
+                 cost_scale=0.0,
+                 cost_exponent=3,
+                 cost_mode='sleep',
+                 gradient_cost=1.0,
+                 sys_info=None,
+                 sys_info_format=None,
+                 cache_size=0,
+                 cache_dir=None,
+                 levels=None,
+                 **kwargs):
+        """
+        Initializes an AnalyticWrapper class
+
+        Parameters
+        ----------
+        method : str
+            name of the method, only used to tell levels apart, default is analytic
+        charge : int
+            charge of qm system, spread evenly over the partial charges
+            of the QM atoms, default is 0
+        multiplicity : int
+            spin state of qm system, not used, default is singlet(1)
+        morse_depth : float
+            depth D of the Morse potential between QM atoms in hartrees, default is 0.1
+        morse_width : float
+            width parameter a of the Morse potential in 1/bohr, default is 1.0
+        morse_distance : float
+            equilibrium distance r0 of the Morse potential in bohr, default is 2.0
+        atom_charges : dict
+            partial charges of the QM atoms by element symbol, default is None,
+            which uses AnalyticWrapper.default_atom_charges. Other elements have no charge.
+        cost_scale : float
+            artificial cost of a computation of N QM atoms is cost_scale * N^cost_exponent
+            seconds, default is 0.0 (no artificial cost)
+        cost_exponent : float
+            scaling of the artificial cost with the number of QM atoms, default is 3
+        cost_mode : str
+            'sleep' waits for the artificial cost, like a QM program that runs outside
+            of the Python interpreter, 'busy' spins in Python for it, like a QM program
+            that holds the interpreter. Default is sleep
+        gradient_cost : float
+            additional artificial cost of the gradient, as a fraction of the cost
+            of the energy, default is 1.0
+        cache_size : int
+            number of results kept in memory for reuse, default is 0
+        cache_dir : str
+            directory of a store of results on disk, default is None
+        levels : dict
+            named alternative levels with the parameters that differ,
+            e.g. {'low' : {'morse_depth' : 0.08, 'cost_scale' : 1e-4}}. Default is None
+        **kwargs : dict
+            Other parameters, e.g. the basis of a Psi4 input, which are kept
+            as QM parameters but not used
+
+        Raises
+        ------
+        ValueError
+            if cost_mode is not sleep or busy
+        """
+
+        super().__init__("Analytic", cache_size=cache_size, cache_dir=cache_dir, levels=levels)
+        self.energy = None
+        self.gradient = None
+
+        if cost_mode not in ('sleep', 'busy'):
+            raise ValueError("cost_mode needs to be sleep or busy")
+
+        self.method = method
+        self.charge = charge
+        self.multiplicity = multiplicity
+
+        self.qm_param = kwargs
+        self.qm_param['morse_depth'] = morse_depth
+        self.qm_param['morse_width'] = morse_width
+        self.qm_param['morse_distance'] = morse_distance
+        self.qm_param['atom_charges'] = atom_charges
+        self.qm_param['cost_scale'] = cost_scale
+        self.qm_param['cost_exponent'] = cost_exponent
+        self.qm_param['cost_mode'] = cost_mode
+        self.qm_param['gradient_cost'] = gradient_cost
+
+        self.timings = {}
+
+    def compute_energy(self):
+        """
+        Computes the energy of the QM region and saves it as self.energy
+        """
+        self.energy, self.gradient = self.compute_potential(gradient=False)
+
+    def compute_info(self):
+        """
+        Computes the energy and gradient of the QM region
+        and saves them as self.energy and self.gradient
+        """
+        self.energy, self.gradient = self.compute_potential(gradient=True)
+
+    def compute_potential(self, gradient=True):
+        """
+        Computes the analytic energy and, optionally, gradient of the QM region
+        in the external charges, after spending the artificial cost
+
+        Parameters
+        ----------
+        gradient : bool
+            whether to compute the gradient
+
+        Returns
+        -------
+        float
+            the energy in hartrees
+        numpy array
+            the gradient in hartree/bohr, or None
+        """
+
+        symbols, coordinates = self.get_atoms()
+        param = self.qm_param
+
+        start = time.perf_counter()
+        cost = param['cost_scale'] * len(symbols)**param['cost_exponent']
+        if gradient is True:
+            cost *= 1.0 + param['gradient_cost']
+        AnalyticWrapper.spend(cost, param['cost_mode'])
+        self.timings = {'cost' : time.perf_counter() - start}
+
+        start = time.perf_counter()
+        R = coordinates * AnalyticWrapper.bohr_per_angstrom
+        Z = np.array([md.element.get_by_symbol(s).atomic_number for s in symbols], dtype=float)
+        energy = np.sum(-0.7687 * Z**(7.0/3.0))
+        grad = np.zeros_like(R)
+
+        # Morse potential between QM atoms
+        D, a, r0 = param['morse_depth'], param['morse_width'], param['morse_distance']
+        i, j = np.triu_indices(len(R), k=1)
+        d = R[i] - R[j]
+        r = np.linalg.norm(d, axis=1)
+        e = np.exp(-a * (r - r0))
+        energy += np.sum(D * ((1.0 - e)**2 - 1.0))
+        if gradient is True:
+            f = (2.0 * D * a * e * (1.0 - e) / r)[:,None] * d
+            np.add.at(grad, i, f)
+            np.add.at(grad, j, -f)
+
+        # Coulomb interaction with the external charges
+        if self.external_charges is not None:
+            charges = np.asarray(self.external_charges, dtype=float).reshape(-1, 4)
+            if len(charges) > 0:
+                q = self.get_atom_charges(symbols)
+                d = R[:,None,:] - charges[None,:,1:] * AnalyticWrapper.bohr_per_angstrom
+                r = np.linalg.norm(d, axis=2)
+                qQ = q[:,None] * charges[None,:,0]
+                energy += np.sum(qQ / r)
+                if gradient is True:
+                    grad -= np.sum((qQ / r**3)[:,:,None] * d, axis=1)
+
+        self.timings['compute'] = time.perf_counter() - start
+
+        if gradient is False:
+            grad = None
+
+        return float(energy), grad
+
+    def get_atoms(self):
+        """
+        Gets the element symbols and coordinates in angstroms of the QM region,
+        parsed from self.qm_geometry if it was not given as a trajectory
+
+        Returns
+        -------
+        list
+            element symbols
+        numpy array
+            coordinates in angstroms
+        """
+
+        if self.qm_symbols is not None:
+            return list(self.qm_symbols), np.asarray(self.qm_coordinates, dtype=float)
+
+        symbols, coordinates = [], []
+        for line in self.qm_geometry.splitlines():
+            fields = line.split()
+            if len(fields) == 4:
+                symbols.append(fields[0])
+                coordinates.append([float(x) for x in fields[1:]])
+
+        return symbols, np.array(coordinates, dtype=float).reshape(-1, 3)
+
+    def get_atom_charges(self, symbols):
+        """
+        Gets the partial charges of the QM atoms,
+        shifted evenly so that they add up to self.charge
+
+        Parameters
+        ----------
+        symbols : list
+            element symbols of the QM atoms
+
+        Returns
+        -------
+        numpy array
+        """
+
+        atom_charges = self.qm_param['atom_charges']
+        if atom_charges is None:
+            atom_charges = AnalyticWrapper.default_atom_charges
+
+        q = np.array([atom_charges.get(s, 0.0) for s in symbols], dtype=float)
+        q += (self.charge - q.sum()) / len(q)
+
+        return q
+
+    def spend(seconds, mode='sleep'):
+        """
+        Spends the artificial cost of a computation
+
+        Parameters
+        ----------
+        seconds : float
+        mode : str
+            sleep or busy
+        """
+
+        if seconds <= 0.0:
+            return
+
+        if mode == 'sleep':
+            time.sleep(seconds)
+        else:
+            end = time.perf_counter() + seconds
+            while time.perf_counter() < end:
+                pass
+
+    def optimize_geometry(self, max_steps=200, gtol=1e-5):
+        """
+        Optimizes the geometry of the QM region by steepest descent
+        and saves the energy of the optimized geometry as self.energy
+
+        Parameters
+        ----------
+        max_steps : int
+            maximum number of steps, default is 200
+        gtol : float
+            largest gradient component in hartree/bohr at convergence, default is 1e-5
+
+        Returns
+        -------
+        numpy array
+            XYZ coordinates of the optimized geometry in bohr
+        """
+
+        original = (self.qm_symbols, self.qm_coordinates)
+        symbols, coordinates = self.get_atoms()
+        self.qm_symbols, self.qm_coordinates = tuple(symbols), coordinates
+
+        energy, grad = self.compute_potential()
+        step = 0.1
+        for n in range(max_steps):
+            if np.max(np.abs(grad)) < gtol:
+                break
+            trial = self.qm_coordinates - step * grad / AnalyticWrapper.bohr_per_angstrom
+            previous = self.qm_coordinates
+            self.qm_coordinates = trial
+            trial_energy, trial_grad = self.compute_potential()
+            if trial_energy < energy:
+                energy, grad = trial_energy, trial_grad
+                step *= 1.2
+            else:
+                self.qm_coordinates = previous
+                step *= 0.5
+
+        self.energy, self.gradient = energy, grad
+        optimized = self.qm_coordinates * AnalyticWrapper.bohr_per_angstrom
+
+        self.qm_symbols, self.qm_coordinates = original
+
+        return optimized
+
+    def computes_outside_interpreter(self):
+        """
+        Whether the computations of the wrapper run outside of the Python interpreter,
+        which the artificial cost does at every level if its cost_mode is sleep
+
+        Returns
+        -------
+        bool
+        """
+
+        modes = [self.qm_param['cost_mode']]
+        modes += [level.get('cost_mode', modes[0]) for level in self.levels.values()]
+
+        return all(mode == 'sleep' for mode in modes)
+
+    def get_telemetry(self):
+        """
+        Gets the details of the last computation
+
+        Returns
+        -------
+        dict
+            wall times in seconds of the artificial cost and of the analytic potential ('times')
+        """
+        return {'times' : dict(self.timings)}
+
+    def build_qm_param(self):
+        """
+        Returns the QM parameters
+        """
+        return self.qm_param
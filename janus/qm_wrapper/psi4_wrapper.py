@@ -1,5 +1,8 @@
 import psi4
 import numpy as np
+import time
+from collections import OrderedDict
+from scipy.special import comb
 from janus.qm_wrapper import QMWrapper
 
 class Psi4Wrapper(QMWrapper):
@@ -8,6 +11,12 @@ class Psi4Wrapper(QMWrapper):
     information. Class inherits from QMWrapper.
     """
 
+    # Psi4 defaults of the options changed for single computations
+    default_options = {'guess' : 'auto'}
+
+    # the wrapper whose options are currently set in Psi4
+    options_owner = None
+
     def __init__(self,
                  method='scf',
                  charge=0,
@@ -18,6 +27,14 @@ class Psi4Wrapper(QMWrapper):
                  d_convergence=1e-8,
                  sys_info=None,
                  sys_info_format=None,
+                 guess_reuse=None,
+                 guess_order=2,
+                 max_guesses=20,
+                 fragment_guess=False,
+                 cache_size=0,
+                 cache_dir=None,
+                 max_convergence=1e-4,
+                 levels=None,
                  **kwargs):
         """
         Initializes a Psi4Wrapper class with a set of 
@@ -41,13 +58,32 @@ class Psi4Wrapper(QMWrapper):
             - charge_method : method for getting QM charges, default is Mulliken
             - charge : charge of qm system, default is 0
             - multiplicity : spin state of qm system, default is singlet(1)
+            - guess_reuse : how the converged orbitals of a QM region are reused as the 
+                            SCF guess of its next computation. None (default) always starts 
+                            from the guess option, 'previous' starts from the last converged orbitals,
+                            'extrapolate' extrapolates the densities of the last guess_order + 2 
+                            computations with the always stable predictor-corrector (ASPC) coefficients
+            - guess_order : order of the ASPC extrapolation, default is 2
+            - max_guesses : number of QM regions for which orbitals are kept, default is 20
+            - fragment_guess : whether a QM region without orbitals of its own starts from 
+                               a density assembled from the converged densities of other QM regions 
+                               that share its atoms, e.g. the QM core and buffer groups of AQMMM 
+                               partitions. Default is False
+            - cache_size : number of QM results kept in memory for reuse, default is 0
+            - cache_dir : directory of a store of QM results on disk that can be shared 
+                          by several janus processes, default is None
+            - max_convergence : loosest e_convergence and d_convergence used when a computation 
+                                is given an error tolerance, default is 1e-4
+            - levels : named cheaper levels of theory with the method and options that differ, 
+                       e.g. {'low' : {'method' : 'scf', 'basis' : '3-21G'}}. Orbitals for
+                       SCF guesses are kept separately for each level. Default is None
 
             For more information about these parameters and 
             other possible parameter values consult psicode.org
 
         """
 
-        super().__init__("Psi4")
+        super().__init__("Psi4", cache_size=cache_size, cache_dir=cache_dir, levels=levels)
         self.energy = None
         self.wavefunction = None
         self.gradient = None
@@ -61,15 +97,29 @@ class Psi4Wrapper(QMWrapper):
         self.qm_param['basis'] = basis
         self.qm_param['e_convergence'] = e_convergence
         self.qm_param['d_convergence'] = d_convergence
+        self.max_convergence = max_convergence
+
+        self.guess_reuse = guess_reuse
+        self.guess_order = guess_order
+        self.max_guesses = max_guesses
+        self.guesses = OrderedDict()
+        self.fragment_guess = fragment_guess
+        self.fragments = OrderedDict()
+        self.level_guesses = {}
+        self.applied_options = None
+        self.temporary_options = {}
+        self.molecules = OrderedDict()
+        self.scf_iterations = None
+        self.guess_type = None
+        self.fallback = None
+        self.timings = {}
 
     def compute_energy(self):
         """
         Calls Psi4 to obtain the energy and Psi4 wavefunction object of the QM region
-        and saves as self.energy and self.wavefunction
+        and saves as self.energy and self.wavefunction, without computing the gradient
         """
-        self.set_up_psi4()
-        self.energy, self.wavefunction = psi4.energy(self.method,
-                                                       return_wfn=True)
+        self.energy, self.wavefunction = self.run_psi4(psi4.energy)
 
     def compute_gradient(self):
         """
@@ -85,28 +135,393 @@ class Psi4Wrapper(QMWrapper):
         Calls Psi4 to obtain the energy, Psi4 wavefunction object, and 
         gradient of the QM region and saves as self.energy, self.wavefuction,
         and self.gradient
+
+        Note
+        ----
+        The energy, gradient and wavefunction all come from a single 
+        psi4.gradient call, so the SCF is only solved once.
+        """
+        G, self.wavefunction = self.run_psi4(psi4.gradient)
+
+        # same as the value returned by psi4.energy for the method
+        self.energy = psi4.core.variable('CURRENT ENERGY')
+        self.gradient = np.asarray(G)
+
+    def set_level(self, level=None):
+        """
+        Switches to a level of theory, see :func:`~janus.qm_wrapper.QMWrapper.set_level`.
+        The orbitals kept for SCF guesses are switched as well, 
+        since orbitals of a different basis cannot be used as a guess.
+
+        Parameters
+        ----------
+        level : str
+            name of the level in self.levels, or None for the default level
+        """
+
+        if level != self.level:
+            self.level_guesses[self.level] = (self.guesses, self.fragments)
+            super().set_level(level)
+            self.guesses, self.fragments = self.level_guesses.get(level, (OrderedDict(), OrderedDict()))
+
+    def run_psi4(self, driver):
+        """
+        Sets up Psi4 and the SCF guess of :func:`~janus.qm_wrapper.Psi4Wrapper.set_up_guess`,
+        calls a Psi4 driver for self.method, then saves the orbitals for later guesses
+
+        Parameters
+        ----------
+        driver : function
+            psi4.energy or psi4.gradient
+
+        Returns
+        -------
+        tuple
+            the value returned by the driver and the Psi4 wavefunction object
+
+        Note
+        ----
+        If setting up Psi4 or the driver fails, only the part that failed
+        is repeated with Psi4 output turned on. Which part was repeated, 
+        the guess type and the time of each part are kept for 
+        :func:`~janus.qm_wrapper.Psi4Wrapper.get_telemetry`.
         """
+        self.fallback = None
+        self.timings = {}
+
+        start = time.perf_counter()
         try:
             self.set_up_psi4()
-            print("Method", self.method)
-            self.energy, self.wavefunction = psi4.energy(self.method,
-                                                        return_wfn=True)
+        except Exception as e:
+            print("Psi4 set up failed, retrying with output: {}".format(e))
+            self.fallback = 'set_up'
+            self.set_up_psi4(be_quiet=False)
+
+        self.timings['set_up'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self.set_up_guess()
+        self.timings['guess'] = time.perf_counter() - start
 
-            G = psi4.gradient(self.method)
-            self.gradient = np.asarray(G)
-        except:
+        print("Method", self.method)
+        start = time.perf_counter()
+        try:
+            value, wfn = driver(self.method, return_wfn=True)
+        except Exception as e:
+            print("Psi4 {} failed, retrying with output: {}".format(driver.__name__, e))
+            self.fallback = driver.__name__
             self.set_up_psi4(be_quiet=False)
-            print("Method", self.method)
-            self.energy, self.wavefunction = psi4.energy(self.method,
-                                                        return_wfn=True)
+            self.set_up_guess()
+            value, wfn = driver(self.method, return_wfn=True)
+
+        self.timings[driver.__name__] = time.perf_counter() - start
+
+        self.wavefunction = wfn
+        self.scf_iterations = psi4.core.variable('SCF ITERATIONS')
+        print("SCF iterations", self.scf_iterations)
+        print("SCF convergence", self.convergence)
+        print("Psi4 guess {}, times {}".format(self.guess_type, self.timings))
 
-            G = psi4.gradient(self.method)
-            self.gradient = np.asarray(G)
+        self.save_guess()
+
+        return value, wfn
             
         #deriv = psi4.core.Deriv(self.wavefunction)
         #deriv.compute()
         #self.gradient = np.asarray(self.wavefunction.gradient())
 
+    def set_up_guess(self):
+        """
+        Writes the SCF guess of the current QM region from the orbitals 
+        of its previous computations, and sets Psi4 up to read it.
+        Without orbitals of its own, the guess of 
+        :func:`~janus.qm_wrapper.Psi4Wrapper.set_up_fragment_guess` is used.
+        """
+
+        self.guess_type = 'default'
+        if (self.guess_reuse is None or self.guess_key is None or self.guess_key not in self.guesses):
+            self.set_up_fragment_guess()
+            return
+
+        self.guesses.move_to_end(self.guess_key)
+        guess = self.guesses[self.guess_key]
+        self.guess_type = 'previous'
+
+        if (self.guess_reuse == 'extrapolate' and len(guess['history']) > 1):
+            wfn = guess['wavefunction']
+            S = np.asarray(wfn.S())
+            history = guess['history'][-(self.guess_order + 2):]
+            coefficients = Psi4Wrapper.get_aspc_coefficients(len(history) - 2)
+
+            # history holds (Ca occupied, Cb occupied) with the most recent last
+            C = []
+            for spin in range(2):
+                D = sum(c * np.dot(h[spin], h[spin].T) for c, h in zip(coefficients, reversed(history)))
+                C.append(Psi4Wrapper.get_occupied_orbitals(D, S, history[-1][spin].shape[1]))
+
+            np.asarray(wfn.Ca())[:,:C[0].shape[1]] = C[0]
+            np.asarray(wfn.Cb())[:,:C[1].shape[1]] = C[1]
+            self.guess_type = 'extrapolate'
+
+        self.write_guess(guess['wavefunction'])
+
+    def write_guess(self, wfn):
+        """
+        Writes orbitals to the scratch file Psi4 reads with guess read, 
+        and sets the guess option for the next computation only.
+
+        Parameters
+        ----------
+        wfn : Psi4 wavefunction object
+            wavefunction of the current QM region
+
+        Note
+        ----
+        The restart_file keyword is only handled by psi4.energy, 
+        so the file is written where every Psi4 driver looks for it.
+        The scratch file name depends on the name of the molecule, 
+        which is the same for all molecules of this wrapper.
+        """
+
+        wfn.to_file(wfn.get_scratch_filename(180))
+        self.set_temporary_options({'guess' : 'read'})
+
+    def save_guess(self):
+        """
+        Keeps the converged orbitals of the current QM region 
+        so they can be used as the guess of its next computation,
+        and its densities for assembling guesses of other QM regions
+        """
+
+        save_history = (self.guess_reuse is not None and self.guess_key is not None)
+        save_fragment = (self.fragment_guess is True and self.guess_atoms is not None)
+
+        if (save_history is False and save_fragment is False):
+            return
+
+        # keep a copy in C1 symmetry so the orbitals can be extrapolated
+        wfn = self.wavefunction.c1_deep_copy(self.wavefunction.basisset())
+        occupied = (np.array(wfn.Ca_subset("SO", "OCC")), np.array(wfn.Cb_subset("SO", "OCC")))
+
+        if save_fragment is True:
+            self.save_fragment(wfn, occupied)
+
+        if save_history is False:
+            return
+
+        if self.guess_key in self.guesses:
+            guess = self.guesses[self.guess_key]
+            if guess['history'][-1][0].shape != occupied[0].shape:
+                guess['history'] = []
+        else:
+            guess = {'history' : []}
+            self.guesses[self.guess_key] = guess
+
+            if len(self.guesses) > self.max_guesses:
+                self.guesses.popitem(last=False)
+
+        guess['wavefunction'] = wfn
+        guess['history'].append(occupied)
+        guess['history'] = guess['history'][-(self.guess_order + 2):]
+
+    def save_fragment(self, wfn, occupied):
+        """
+        Keeps the converged densities of the current QM region, 
+        with the basis functions of each of its atoms
+
+        Parameters
+        ----------
+        wfn : Psi4 wavefunction object
+            the converged wavefunction in C1 symmetry
+        occupied : tuple
+            the alpha and beta occupied orbitals of wfn
+        """
+
+        key = tuple(self.guess_atoms)
+        self.fragments.pop(key, None)
+        self.fragments[key] = {'atoms' : {a : i for i, a in enumerate(self.guess_atoms) if a is not None},
+                               'functions' : Psi4Wrapper.get_atom_functions(wfn.basisset(), len(self.guess_atoms)),
+                               'densities' : [np.dot(C, C.T) for C in occupied]}
+
+        if len(self.fragments) > self.max_guesses:
+            self.fragments.popitem(last=False)
+
+    def assemble_fragments(self, atoms):
+        """
+        Covers the atoms of a QM region with the atoms of saved fragments,
+        taking the fragment that covers most of the remaining atoms each time.
+        A fragment of a nested, smaller QM region, such as the QM core of 
+        an AQMMM partition, is used as a whole.
+
+        Parameters
+        ----------
+        atoms : list
+            index of each atom of the QM region in the entire system, None for link atoms
+
+        Returns
+        -------
+        list
+            (fragment, atoms taken from the fragment) for every fragment used,
+            None if some atoms are not in any fragment
+        """
+
+        remaining = set(a for a in atoms if a is not None)
+        blocks = []
+
+        while remaining:
+            best, best_overlap = None, set()
+            # the most recent fragments are preferred
+            for fragment in reversed(self.fragments.values()):
+                overlap = remaining.intersection(fragment['atoms'])
+                if len(overlap) > len(best_overlap):
+                    best, best_overlap = fragment, overlap
+
+            if best is None:
+                return None
+
+            blocks.append((best, best_overlap))
+            remaining -= best_overlap
+
+        return blocks
+
+    def set_up_fragment_guess(self):
+        """
+        Writes the SCF guess of the current QM region as the block diagonal 
+        density assembled from the saved fragments, and sets Psi4 up to read it.
+        The default guess is kept if the QM region cannot be covered with saved fragments.
+
+        Note
+        ----
+        Psi4 only reads guesses from wavefunction files, so an SCF wavefunction 
+        of the QM region is built in C1 symmetry for the guess orbitals, 
+        without computing integrals other than the overlap or running any SCF iterations.
+        The blocks of link atoms and between fragments start from zero.
+        """
+
+        if (self.fragment_guess is False or self.guess_atoms is None):
+            return
+
+        blocks = self.assemble_fragments(self.guess_atoms)
+        if not blocks:
+            return
+
+        wfn = Psi4Wrapper.build_guess_wavefunction()
+
+        functions = Psi4Wrapper.get_atom_functions(wfn.basisset(), len(self.guess_atoms))
+        position = {a : i for i, a in enumerate(self.guess_atoms) if a is not None}
+        # in C1 symmetry the SO basis is the AO basis
+        S = np.asarray(psi4.core.MintsHelper(wfn.basisset()).ao_overlap())
+
+        for spin, (C, n_occ) in enumerate([(wfn.Ca(), wfn.nalpha()), (wfn.Cb(), wfn.nbeta())]):
+            D = np.zeros_like(S)
+            for fragment, atoms in blocks:
+                new = np.concatenate([functions[position[a]] for a in atoms])
+                old = np.concatenate([fragment['functions'][fragment['atoms'][a]] for a in atoms])
+                D[np.ix_(new, new)] = fragment['densities'][spin][np.ix_(old, old)]
+            np.asarray(C)[:,:n_occ] = Psi4Wrapper.get_occupied_orbitals(D, S, n_occ)
+
+        self.write_guess(wfn)
+        self.guess_type = 'fragments'
+        print("SCF guess assembled from {} fragments".format(len(blocks)))
+
+    def build_guess_wavefunction():
+        """
+        Builds an SCF wavefunction of the active Psi4 molecule with the current 
+        basis set and reference, in C1 symmetry and with the occupations set, 
+        whose orbitals can be filled in and written as a guess
+
+        Returns
+        -------
+        Psi4 wavefunction object
+        """
+
+        mol = psi4.core.get_active_molecule()
+        ref_wfn = psi4.core.Wavefunction.build(mol, psi4.core.get_global_option('BASIS'))
+        wfn = psi4.driver.scf_wavefunction_factory('hf', ref_wfn, psi4.core.get_option('SCF', 'REFERENCE'))
+        wfn = wfn.c1_deep_copy(wfn.basisset())
+
+        wfn.force_doccpi(psi4.core.Dimension([wfn.nbeta()]))
+        wfn.force_soccpi(psi4.core.Dimension([wfn.nalpha() - wfn.nbeta()]))
+
+        return wfn
+
+    def get_atom_functions(basis, n_atoms):
+        """
+        Finds the basis functions centered on each atom
+
+        Parameters
+        ----------
+        basis : Psi4 basis set object
+        n_atoms : int
+            number of atoms of the molecule
+
+        Returns
+        -------
+        list
+            a numpy array with the basis function indices of each atom
+        """
+
+        centers = np.array([basis.function_to_center(i) for i in range(basis.nbf())], dtype=int)
+
+        return [np.nonzero(centers == i)[0] for i in range(n_atoms)]
+
+    def get_aspc_coefficients(k):
+        """
+        Computes the coefficients of the always stable predictor-corrector
+        extrapolation of Kolafa, J. Comput. Chem. 25, 335 (2004)
+
+        Parameters
+        ----------
+        k : int
+            order of the extrapolation, which uses k + 2 previous steps
+
+        Returns
+        -------
+        numpy array
+            the coefficient of each previous step, the most recent first
+
+        Examples
+        --------
+        >>> get_aspc_coefficients(0)
+        array([ 2., -1.])
+        """
+
+        j = np.arange(1, k + 3)
+
+        return (-1)**(j + 1) * j * comb(2*k + 4, k + 2 - j) / comb(2*k + 2, k + 1)
+
+    def get_occupied_orbitals(D, S, n_occ):
+        """
+        Finds the occupied orbitals that best represent a density matrix,
+        which is not idempotent after extrapolation
+
+        Parameters
+        ----------
+        D : numpy array
+            density matrix in the SO basis of C1 symmetry
+        S : numpy array
+            overlap matrix in the same basis
+        n_occ : int
+            number of occupied orbitals
+
+        Returns
+        -------
+        numpy array
+            orthonormal occupied orbital coefficients, shape (number of basis functions, n_occ)
+        """
+
+        if n_occ == 0:
+            return np.zeros((D.shape[0], 0))
+
+        s, U = np.linalg.eigh(S)
+        S_half = np.dot(U * np.sqrt(s), U.T)
+        S_inv_half = np.dot(U / np.sqrt(s), U.T)
+
+        # natural orbitals in the orthogonal basis, with the largest occupations last
+        occupations, V = np.linalg.eigh(np.dot(S_half, np.dot(D, S_half)))
+
+        return np.dot(S_inv_half, V[:,::-1][:,:n_occ])
+
     def optimize_geometry(self):
         """
         Calls Psi4 to obtain a geometry optimized geometry 
@@ -117,53 +532,194 @@ class Psi4Wrapper(QMWrapper):
             XYZ coordinates of the optimized geometry
         """
 
+        self.fallback = None
+        self.guess_type = 'default'
+
+        start = time.perf_counter()
         self.set_up_psi4()
+        self.timings = {'set_up' : time.perf_counter() - start}
+
+        start = time.perf_counter()
         self.energy, self.wavefunction = psi4.opt(self.method, return_wfn=True)
+        self.timings['opt'] = time.perf_counter() - start
+        self.scf_iterations = psi4.core.variable('SCF ITERATIONS')
+
         return np.array(self.wavefunction.molecule().geometry())
 
+    def get_telemetry(self):
+        """
+        Gets the details of the last Psi4 computation
+
+        Returns
+        -------
+        dict
+            number of basis functions ('n_basis'), SCF iterations ('scf_iterations') 
+            of the last SCF, SCF guess ('guess': 'default', 'previous', 'extrapolate' or 'fragments'),
+            the part repeated after a failure ('fallback': None, 'set_up', 'energy' or 'gradient'),
+            wall times in seconds of setting up Psi4, the guess and the Psi4 driver ('times'), 
+            and the convergence thresholds ('convergence')
+        """
+
+        n_basis = None
+        if self.wavefunction is not None:
+            n_basis = self.wavefunction.basisset().nbf()
+
+        return {'n_basis' : n_basis,
+                'scf_iterations' : self.scf_iterations,
+                'guess' : self.guess_type,
+                'fallback' : self.fallback,
+                'times' : dict(self.timings),
+                'convergence' : self.convergence}
+
     def set_up_psi4(self, be_quiet=True):
         """
         Sets up a psi4 computation
+
+        Note
+        ----
+        The options are set the first time, and afterwards only the options 
+        that changed are set again. If the geometry comes from
+        :func:`~janus.qm_wrapper.QMWrapper.get_geom_from_trajectory`, the molecule 
+        is built from the element and coordinate arrays once per set of elements,
+        and afterwards only its geometry is updated.
+        The convergence thresholds are set by :func:`~janus.qm_wrapper.Psi4Wrapper.set_convergence`.
         """
         # psi4.core.set_output_file('output.dat', True)
         psi4.core.clean()
-        psi4.core.clean_options()
-        psi4.core.EXTERN = None 
         
         # Supress print out
         if be_quiet is True:
             psi4.core.be_quiet()
-       
-        #print("GEO", self.qm_geometry) 
-        print("QM Params", self.qm_param)
+
+        self.set_options()
+        self.set_convergence()
+
+        if self.qm_symbols is not None:
+            self.set_molecule()
+        else:
+            psi4_geom = '\n' + str(self.charge ) + ' ' + str(self.multiplicity) + '\n '
+            psi4_geom += self.qm_geometry
+            psi4_geom += 'no_reorient \n'
+            psi4_geom += 'no_com \n '
+            print(psi4_geom)
+
+            # make sure this is in angstroms
+            mol = psi4.geometry(psi4_geom)
+            print("PSI4 GEO done")
+
+        if self.external_charges is not None:
+            charges = np.asarray(self.external_charges, dtype=float).reshape(-1, 4)
+            Chrgfield = psi4.QMMM()
+            if hasattr(Chrgfield.extern, 'appendCharges'):
+                # hand all charges to psi4 in one call
+                Chrgfield.extern.appendCharges(list(map(tuple, charges.tolist())))
+            else:
+                for q, x, y, z in charges.tolist():
+                    Chrgfield.extern.addCharge(q, x, y, z)
+            psi4.core.set_global_option_python('EXTERN', Chrgfield.extern)
+        else:
+            psi4.core.set_global_option_python('EXTERN', None)
+
+    def set_options(self):
+        """
+        Sets the Psi4 options in self.qm_param that differ from the ones 
+        this wrapper set before, and restores the options that were changed for a 
+        single computation with :func:`~janus.qm_wrapper.Psi4Wrapper.set_temporary_options`
+        """
+
         params = {}
         for k in self.qm_param.keys():
             if "sys_" not in k:
                 params[k] = self.qm_param[k]
         self.qm_param = params
 
-        print("QM Params", self.qm_param)
-        psi4.set_options(self.qm_param, True)
+        if self.temporary_options:
+            psi4.set_options(self.temporary_options)
+            self.temporary_options = {}
 
-        psi4_geom = '\n' + str(self.charge ) + ' ' + str(self.multiplicity) + '\n '
-        psi4_geom += self.qm_geometry
-        psi4_geom += 'no_reorient \n'
-        psi4_geom += 'no_com \n '
-        print(psi4_geom)
+        if (Psi4Wrapper.options_owner is not self or set(self.applied_options) - set(self.qm_param)):
+            # start from the default options if another wrapper set options or an option was removed
+            psi4.core.clean_options()
+            print("QM Params", self.qm_param)
+            psi4.set_options(self.qm_param, True)
+        else:
+            changed = {k : v for k, v in self.qm_param.items() 
+                       if (k not in self.applied_options or self.applied_options[k] != v)}
+            if changed:
+                print("QM Params changed", changed)
+                psi4.set_options(changed, True)
 
-        # make sure this is in angstroms
-        mol = psi4.geometry(psi4_geom)
-        print("PSI4 GEO done")
+        self.applied_options = dict(self.qm_param)
+        Psi4Wrapper.options_owner = self
 
-        if self.external_charges is not None:
-            Chrgfield = psi4.QMMM()
-            print("external charges", self.external_charges)
-            for charge in self.external_charges:
-                Chrgfield.extern.addCharge(charge[0], charge[1], charge[2], charge[3])
-            psi4.core.set_global_option_python('EXTERN', Chrgfield.extern)
+    def set_convergence(self):
+        """
+        Sets the convergence thresholds of the current computation and saves 
+        them as self.convergence. With an error tolerance, e_convergence and d_convergence 
+        are loosened up to self.error_tolerance for this computation only, 
+        but never beyond self.max_convergence or tighter than the QM parameters.
+
+        Note
+        ----
+        e_convergence is the change of the energy between SCF iterations, 
+        so the error tolerance is only an estimate of the error of the energy, not a bound.
+        """
+
+        self.convergence = {k : self.qm_param[k] for k in ['e_convergence', 'd_convergence']}
+
+        if self.error_tolerance is not None:
+            for k, v in self.convergence.items():
+                self.convergence[k] = max(v, min(self.error_tolerance, self.max_convergence))
+            self.set_temporary_options(self.convergence)
+
+    def set_temporary_options(self, options):
+        """
+        Sets Psi4 options for the next computation only.
+        The values the options had before are set again by the next 
+        :func:`~janus.qm_wrapper.Psi4Wrapper.set_options`
+
+        Parameters
+        ----------
+        options : dict
+        """
+
+        for k in options:
+            if k not in self.temporary_options:
+                if k in self.qm_param:
+                    self.temporary_options[k] = self.qm_param[k]
+                else:
+                    self.temporary_options[k] = Psi4Wrapper.default_options[k]
+
+        psi4.set_options(options)
+
+    def set_molecule(self):
+        """
+        Makes the molecule of self.qm_symbols and self.qm_coordinates the active 
+        Psi4 molecule. A molecule is only built the first time a set of elements, 
+        charge and multiplicity is seen, and afterwards its geometry is updated.
+        """
+
+        key = (self.qm_symbols, self.charge, self.multiplicity)
+
+        if key in self.molecules:
+            mol = self.molecules[key]
+            self.molecules.move_to_end(key)
+            mol.set_geometry(psi4.core.Matrix.from_array(self.qm_coordinates / psi4.constants.bohr2angstroms))
+        else:
+            mol = psi4.core.Molecule.from_arrays(geom=self.qm_coordinates,
+                                                 elem=list(self.qm_symbols),
+                                                 molecular_charge=self.charge,
+                                                 molecular_multiplicity=self.multiplicity,
+                                                 units='Angstrom',
+                                                 fix_com=True,
+                                                 fix_orientation=True)
+            self.molecules[key] = mol
+            if len(self.molecules) > self.max_guesses:
+                self.molecules.popitem(last=False)
+
+        mol.update_geometry()
+        psi4.core.set_active_molecule(mol)
 
-        print("Psi4 params set up done")
-            
     def compute_scf_charges(self, charge_method='MULLIKEN_CHARGES'):
         """
         Calls Psi4 to obtain the self.charges on each atom given and saves it as a numpy array.
@@ -0,0 +1,186 @@
+from collections import OrderedDict
+import hashlib
+import pickle
+import tempfile
+import os
+
+
+class QMCache(object):
+    """
+    A two tier store for the results of QM computations.
+    Results are kept in a least recently used store in memory and,
+    if a directory is given, in a content addressed store on disk
+    that several janus processes can share.
+
+    Parameters
+    ----------
+    max_size : int
+        The maximum number of results kept in memory, default is 100.
+        Setting max_size to 0 disables the memory tier.
+    cache_dir : str
+        The directory of the store on disk. Default is None,
+        which disables the disk tier.
+    """
+
+    def __init__(self, max_size=100, cache_dir=None):
+
+        self.max_size = max_size
+        self.cache_dir = cache_dir
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def make_key(*parts):
+        """
+        Hashes the inputs of a QM computation into a key
+
+        Parameters
+        ----------
+        *parts :
+            anything that determines the result of the computation,
+            numpy arrays are hashed by their dtype, shape and contents
+
+        Returns
+        -------
+        str
+            hex digest of the inputs
+
+        Examples
+        --------
+        >>> QMCache.make_key('scf', 'STO-3G', geometry, charges)
+        """
+
+        h = hashlib.sha256()
+        for part in parts:
+            if hasattr(part, 'tobytes'):
+                h.update(repr((str(part.dtype), part.shape)).encode())
+                h.update(part.tobytes())
+            else:
+                h.update(repr(part).encode())
+            h.update(b'|')
+
+        return h.hexdigest()
+
+    def get(self, key):
+        """
+        Looks up a result in memory and then on disk
+
+        Parameters
+        ----------
+        key : str
+            key from :func:`~janus.qm_wrapper.QMCache.make_key`
+
+        Returns
+        -------
+        object
+            the stored result, or None if key is not in the cache
+        """
+
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        if self.cache_dir is not None:
+            path = self.get_path(key)
+            try:
+                with open(path, 'rb') as f:
+                    entry = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                entry = None
+
+            if entry is not None:
+                self.disk_hits += 1
+                self.put_memory(key, entry)
+                return entry
+
+        self.misses += 1
+        return None
+
+    def put(self, key, entry):
+        """
+        Stores a result in memory and on disk. The file on disk is
+        replaced atomically, so processes reading the same store
+        never see a partially written result.
+
+        Parameters
+        ----------
+        key : str
+            key from :func:`~janus.qm_wrapper.QMCache.make_key`
+        entry : object
+            the result to store, which must be picklable
+        """
+
+        self.put_memory(key, entry)
+
+        if self.cache_dir is not None:
+            path = self.get_path(key)
+            directory = os.path.dirname(path)
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=directory)
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(entry, f)
+            os.replace(tmp, path)
+
+    def put_memory(self, key, entry):
+        """
+        Stores a result in memory, evicting the least
+        recently used result if the memory tier is full
+
+        Parameters
+        ----------
+        key : str
+        entry : object
+        """
+
+        if self.max_size <= 0:
+            return
+
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def get_path(self, key):
+        """
+        Gets the file of a key in the store on disk,
+        which is spread over subdirectories by the first characters of the key
+
+        Parameters
+        ----------
+        key : str
+
+        Returns
+        -------
+        str
+        """
+
+        return os.path.join(self.cache_dir, key[:2], key + '.pkl')
+
+    def get_stats(self):
+        """
+        Gets the usage counters of the cache
+
+        Returns
+        -------
+        dict
+            number of memory hits, disk hits, misses, the hit rate
+            and the number of results in memory
+        """
+
+        lookups = self.hits + self.disk_hits + self.misses
+        hit_rate = (self.hits + self.disk_hits)/lookups if lookups > 0 else 0.0
+
+        return {'hits' : self.hits,
+                'disk_hits' : self.disk_hits,
+                'misses' : self.misses,
+                'hit_rate' : hit_rate,
+                'size' : len(self.entries)}
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,535 @@
+from collections import deque
+from multiprocessing.connection import wait
+import multiprocessing as mp
+import traceback
+import time
+import numpy as np
+from janus.qm_wrapper import QMWrapper, Psi4Wrapper, AnalyticWrapper
+
+
+class QMWorkerPool(object):
+    """
+    A pool of long lived worker processes that each own a QM wrapper,
+    so QM computations run outside of the janus process with the QM program
+    kept set up between computations. Jobs are sent to the workers over pipes,
+    queued while all workers are busy, and workers that crash are restarted.
+
+    Parameters
+    ----------
+    wrapper_class : :class:`~janus.qm_wrapper.QMWrapper` subclass
+        The QM wrapper each worker creates
+    wrapper_kwargs : dict
+        Parameters for creating the QM wrapper of each worker
+    n_workers : int
+        number of worker processes, default is 1
+    max_retries : int
+        how many times a job is resubmitted after the worker
+        computing it crashed, default is 1
+    """
+
+    def __init__(self, wrapper_class, wrapper_kwargs, n_workers=1, max_retries=1):
+
+        self.wrapper_class = wrapper_class
+        self.wrapper_kwargs = wrapper_kwargs
+        self.max_retries = max_retries
+        self.restarts = 0
+
+        # workers do not inherit the global state of the QM program from this process
+        self.context = mp.get_context('spawn')
+
+        self.workers = [None]*n_workers
+        for i in range(n_workers):
+            self.start_worker(i)
+
+    def start_worker(self, i):
+        """
+        Starts worker process i
+
+        Parameters
+        ----------
+        i : int
+            index of the worker
+        """
+
+        conn, child_conn = self.context.Pipe()
+        process = self.context.Process(target=QMWorkerPool.run_worker,
+                                       args=(child_conn, self.wrapper_class, self.wrapper_kwargs),
+                                       daemon=True)
+        process.start()
+        child_conn.close()
+
+        self.workers[i] = (process, conn)
+
+    def restart_worker(self, i):
+        """
+        Replaces worker process i by a new one
+
+        Parameters
+        ----------
+        i : int
+            index of the worker
+        """
+
+        process, conn = self.workers[i]
+        conn.close()
+        if process.is_alive():
+            process.terminate()
+        process.join()
+
+        print('restarting QM worker {}'.format(i))
+        self.restarts += 1
+        self.start_worker(i)
+
+    def run(self, jobs):
+        """
+        Computes jobs on the workers
+
+        Parameters
+        ----------
+        jobs : list
+            a dict for every job, with keys 'geometry', 'charges', 'minimize',
+            'guess_key' and 'guess_atoms', see :func:`~janus.qm_wrapper.QMWorkerPool.run_worker`
+
+        Returns
+        -------
+        list
+            the result of every job, in the order of jobs
+
+        Raises
+        ------
+        RuntimeError
+            if a job raises an exception in the worker, or its
+            worker crashes more than max_retries times. 
+            The other jobs are finished first, so no results are left in the pipes.
+        """
+
+        results = [None]*len(jobs)
+        attempts = [0]*len(jobs)
+        queue = deque(range(len(jobs)))
+        busy = {}
+        errors = []
+
+        while (queue or busy):
+
+            # hand queued jobs to idle workers
+            for i in range(len(self.workers)):
+                if (i not in busy and queue):
+                    j = queue.popleft()
+                    try:
+                        self.workers[i][1].send(jobs[j])
+                        busy[i] = j
+                    except (BrokenPipeError, OSError):
+                        self.retry(i, j, attempts, queue, errors)
+
+            if not busy:
+                continue
+
+            ready = wait([self.workers[i][1] for i in busy] + [self.workers[i][0].sentinel for i in busy])
+
+            for i, j in list(busy.items()):
+                process, conn = self.workers[i]
+                if (conn not in ready and process.sentinel not in ready):
+                    continue
+
+                del busy[i]
+                try:
+                    status, result = conn.recv()
+                except (EOFError, OSError):
+                    self.retry(i, j, attempts, queue, errors)
+                    continue
+
+                if status == 'error':
+                    errors.append('QM job {} failed in worker {}:\n{}'.format(j, i, result))
+                results[j] = result
+
+        if errors:
+            raise RuntimeError(errors[0])
+
+        return results
+
+    def retry(self, i, j, attempts, queue, errors):
+        """
+        Restarts a crashed worker and queues its job again
+
+        Parameters
+        ----------
+        i : int
+            index of the worker
+        j : int
+            index of the job
+        attempts : list
+            number of crashes of every job
+        queue : deque
+            queued job indices
+        errors : list
+            error messages of failed jobs
+        """
+
+        self.restart_worker(i)
+        attempts[j] += 1
+        if attempts[j] > self.max_retries:
+            errors.append('QM worker crashed computing job {} {} times'.format(j, attempts[j]))
+        else:
+            queue.appendleft(j)
+
+    def close(self):
+        """
+        Stops all worker processes
+        """
+
+        for process, conn in self.workers:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+
+        for process, conn in self.workers:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+            conn.close()
+
+    def run_worker(conn, wrapper_class, wrapper_kwargs):
+        """
+        Main loop of a worker process, which computes jobs received
+        over conn until it receives None
+
+        Parameters
+        ----------
+        conn : multiprocessing connection object
+        wrapper_class : :class:`~janus.qm_wrapper.QMWrapper` subclass
+        wrapper_kwargs : dict
+            Parameters for creating the QM wrapper
+
+        Note
+        ----
+        Each job is a dict with the XYZ geometry ('geometry'), optionally the element 
+        symbols and coordinates of the geometry ('symbols', 'coordinates'), the external charges
+        ('charges'), whether to optimize the geometry ('minimize'), optionally whether to only
+        compute the energy ('energy_only'), and the 'guess_key', 'guess_atoms' and optionally 
+        'error_tolerance' and 'level' of :func:`~janus.qm_wrapper.QMWrapper.get_energy_and_gradient`.
+        The result of a job is ('done', dict with 'energy' and 'gradients', 'energy' and
+        'geometry' for optimizations, or only 'energy', the 'convergence' thresholds and the 
+        'telemetry' of :func:`~janus.qm_wrapper.QMWrapper.get_telemetry`) or ('error', traceback).
+        """
+
+        wrapper = wrapper_class(**wrapper_kwargs)
+
+        while True:
+            try:
+                job = conn.recv()
+            except EOFError:
+                break
+
+            if job is None:
+                break
+
+            try:
+                wrapper.set_qm_geometry(job['geometry'])
+                wrapper.qm_symbols = job.get('symbols')
+                wrapper.qm_coordinates = job.get('coordinates')
+                wrapper.external_charges = job['charges']
+                wrapper.guess_key = job['guess_key']
+                wrapper.guess_atoms = job['guess_atoms']
+                wrapper.error_tolerance = job.get('error_tolerance')
+                wrapper.convergence = None
+                wrapper.set_level(job.get('level'))
+
+                if job['minimize'] is True:
+                    geometry = wrapper.optimize_geometry()
+                    result = {'energy' : wrapper.energy, 'geometry' : np.asarray(geometry)}
+                elif job.get('energy_only', False) is True:
+                    wrapper.compute_energy()
+                    result = {'energy' : wrapper.energy}
+                else:
+                    wrapper.compute_info()
+                    result = {'energy' : wrapper.energy, 'gradients' : np.asarray(wrapper.gradient)}
+                result['convergence'] = wrapper.convergence
+                result['telemetry'] = wrapper.get_telemetry()
+
+                conn.send(('done', result))
+            except Exception:
+                conn.send(('error', traceback.format_exc()))
+
+        conn.close()
+
+
+class QMWorkerWrapper(QMWrapper):
+    """
+    A QM wrapper class that submits its computations to a
+    :class:`~janus.qm_wrapper.QMWorkerPool`. Class inherits from QMWrapper.
+
+    Parameters
+    ----------
+    qm_program : str
+        The QM program run by the workers, Psi4 (default) or Analytic
+    n_workers : int
+        number of worker processes, default is 1
+    max_retries : int
+        how many times a computation is resubmitted after its worker crashed, default is 1
+    method : str
+        computation method, default is scf
+    charge : int
+        charge of qm system, default is 0
+    multiplicity : int
+        spin state of qm system, default is singlet(1)
+    cache_size : int
+        number of QM results kept in memory for reuse, default is 0
+    cache_dir : str
+        directory of a store of QM results on disk, default is None
+    **kwargs : dict
+        Other parameters for the QM wrapper of the workers,
+        e.g. basis and reference for Psi4
+    """
+
+    programs = {'Psi4' : Psi4Wrapper, 'Analytic' : AnalyticWrapper}
+
+    def __init__(self, qm_program='Psi4',
+                       n_workers=1,
+                       max_retries=1,
+                       method='scf',
+                       charge=0,
+                       multiplicity=1,
+                       cache_size=0,
+                       cache_dir=None,
+                       sys_info=None,
+                       sys_info_format=None,
+                       **kwargs):
+
+        super().__init__("QMWorker", cache_size=cache_size, cache_dir=cache_dir)
+
+        if qm_program not in QMWorkerWrapper.programs:
+            raise ValueError("Only {} currently available in QM workers".format(list(QMWorkerWrapper.programs)))
+
+        self.qm_program = qm_program
+        self.n_workers = n_workers
+        self.max_retries = max_retries
+        self.method = method
+        self.charge = charge
+        self.multiplicity = multiplicity
+        self.energy = None
+        self.gradient = None
+
+        self.qm_param = kwargs
+        self.pool = None
+        self.worker_telemetry = {}
+
+    def get_pool(self):
+        """
+        Gets the worker pool, starting the workers the first time
+
+        Returns
+        -------
+        :class:`~janus.qm_wrapper.QMWorkerPool`
+        """
+
+        if self.pool is None:
+            wrapper_kwargs = dict(self.qm_param)
+            wrapper_kwargs.update({'method' : self.method, 'charge' : self.charge, 'multiplicity' : self.multiplicity})
+            self.pool = QMWorkerPool(QMWorkerWrapper.programs[self.qm_program], wrapper_kwargs,
+                                     n_workers=self.n_workers, max_retries=self.max_retries)
+
+        return self.pool
+
+    def get_job(self, minimize=False, energy_only=False):
+        """
+        Gets the job of the current computation
+
+        Parameters
+        ----------
+        minimize : bool
+            whether to optimize the geometry
+        energy_only : bool
+            whether to only compute the energy
+
+        Returns
+        -------
+        dict
+        """
+
+        return {'geometry' : self.qm_geometry,
+                'symbols' : self.qm_symbols,
+                'coordinates' : self.qm_coordinates,
+                'charges' : self.external_charges,
+                'minimize' : minimize,
+                'energy_only' : energy_only,
+                'guess_key' : self.guess_key,
+                'guess_atoms' : self.guess_atoms,
+                'error_tolerance' : self.error_tolerance,
+                'level' : self.level}
+
+    def set_level(self, level=None):
+        """
+        Sets the level of theory of the next computations, 
+        which is switched to by the QM wrappers of the workers
+
+        Parameters
+        ----------
+        level : str
+            name of a level in the levels parameter of the 
+            QM wrapper, or None for the default level
+
+        Raises
+        ------
+        ValueError
+            if level is not in the levels of the QM wrapper
+        """
+
+        levels = self.qm_param.get('levels') or {}
+        if (level is not None and level not in levels):
+            raise ValueError("{} not in the levels {}".format(level, list(levels)))
+
+        self.level = level
+
+    def compute_info(self):
+        """
+        Obtains the energy and gradient of the QM region from a worker
+        and saves them as self.energy and self.gradient
+        """
+
+        self.set_result(self.get_pool().run([self.get_job()])[0])
+
+    def compute_energy(self):
+        """
+        Obtains the energy of the QM region from a worker
+        and saves it as self.energy
+        """
+
+        self.set_result(self.get_pool().run([self.get_job(energy_only=True)])[0])
+
+    def optimize_geometry(self):
+        """
+        Obtains a geometry optimized geometry from a worker
+
+        Returns
+        -------
+        numpy array
+            XYZ coordinates of the optimized geometry
+        """
+
+        result = self.get_pool().run([self.get_job(minimize=True)])[0]
+        self.set_result(result)
+        return result['geometry']
+
+    def set_result(self, result):
+        """
+        Saves the result of a job as self.energy, self.gradient, 
+        self.convergence and self.worker_telemetry
+
+        Parameters
+        ----------
+        result : dict
+            see :func:`~janus.qm_wrapper.QMWorkerPool.run_worker`
+        """
+
+        self.energy = result['energy']
+        if 'gradients' in result:
+            self.gradient = result['gradients']
+        self.convergence = result['convergence']
+        self.worker_telemetry = result['telemetry']
+
+    def get_energies_and_gradients(self, calls):
+        """
+        Gets the energies and gradients of several QM computations, which are 
+        all submitted to the workers at once, starting with the largest.
+        Computations found in the cache are not submitted.
+
+        Parameters
+        ----------
+        calls : list
+            a dict of parameters of :func:`~janus.qm_wrapper.QMWrapper.get_energy_and_gradient`
+            for every computation
+
+        Returns
+        -------
+        list
+            the result of every computation, in the order of calls
+
+        Note
+        ----
+        The results do not depend on the order in which the workers finish. With guess reuse, 
+        a computation can start from orbitals of a different worker than in the previous step, 
+        so results can differ within the convergence thresholds.
+        """
+
+        results = [None]*len(calls)
+        pending = []
+
+        for n, call in enumerate(calls):
+            start = time.perf_counter()
+            minimize = call.get('minimize', False)
+            energy_only = call.get('energy_only', False)
+
+            self.set_up_computation(**call)
+            key, cache_status = self.get_cached_info(start, minimize, energy_only)
+            if cache_status in ('memory', 'disk'):
+                results[n] = self.info
+            else:
+                pending.append((n, start, key, cache_status, self.get_job(minimize, energy_only)))
+
+        # the largest computations are started first, so they do not finish last
+        pending.sort(key=lambda p: -QMWorkerWrapper.get_job_size(p[4]))
+        done = self.get_pool().run([p[4] for p in pending])
+
+        for (n, start, key, cache_status, job), result in sorted(zip(pending, done), key=lambda item: item[0][0]):
+            self.qm_geometry, self.qm_symbols = job['geometry'], job['symbols']
+            self.error_tolerance, self.level = job['error_tolerance'], job['level']
+            self.gradient = None
+            self.set_result(result)
+            results[n] = self.get_info(start, key, cache_status, job['minimize'], job['energy_only'])
+
+        return results
+
+    def computes_outside_interpreter(self):
+        """
+        Whether the computations of the wrapper run outside of the Python interpreter,
+        which they do since they run in the worker processes
+
+        Returns
+        -------
+        bool
+        """
+        return True
+
+    def get_telemetry(self):
+        """
+        Gets the details of the last computation reported by the QM wrapper of its worker
+
+        Returns
+        -------
+        dict
+        """
+        return dict(self.worker_telemetry)
+
+    def get_job_size(job):
+        """
+        Gets the number of atoms of a job
+
+        Parameters
+        ----------
+        job : dict
+            see :func:`~janus.qm_wrapper.QMWorkerWrapper.get_job`
+
+        Returns
+        -------
+        int
+        """
+
+        if job['symbols'] is not None:
+            return len(job['symbols'])
+        return len([l for l in job['geometry'].splitlines() if len(l.split()) == 4])
+
+    def build_qm_param(self):
+        """
+        Returns the parameters for the QM wrapper of the workers
+        """
+        return self.qm_param
+
+    def close(self):
+        """
+        Stops the worker processes
+        """
+
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
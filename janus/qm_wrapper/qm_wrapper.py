@@ -1,12 +1,30 @@
 from abc import ABC, abstractmethod
-import mendeleev as mdlv
+from janus.qm_wrapper import QMCache
+import numpy as np
+import time
 
 class QMWrapper(ABC):
 
-    def __init__(self, class_type):
+    def __init__(self, class_type, cache_size=0, cache_dir=None, levels=None):
         """
         QM wrapper super class
 
+        Parameters
+        ----------
+        class_type : str
+            the QM program
+        cache_size : int
+            number of QM results kept in memory for reuse, default is 0
+        cache_dir : str
+            directory in which QM results are stored for reuse by later runs
+            and other janus processes. Default is None.
+            If cache_size is 0 and cache_dir is None, no results are reused.
+        levels : dict
+            named alternative levels of theory, e.g. {'low' : {'basis' : '3-21G'}}, 
+            each with the method ('method') and QM parameters that differ from the 
+            default level. Computations are run at a level with the level parameter of 
+            :func:`~janus.qm_wrapper.QMWrapper.get_energy_and_gradient`. Default is None.
+
         Note
         ----
         Since QMWrapper is a super class and has abstract methods
@@ -14,14 +32,30 @@ class QMWrapper(ABC):
         """
         self.class_type = class_type
 
+        if (cache_size > 0 or cache_dir is not None):
+            self.cache = QMCache(max_size=cache_size, cache_dir=cache_dir)
+        else:
+            self.cache = None
+
         self.qm_param = None
         self.external_charges = None
         self.charges = None
         self.is_open_shelled = False
         self.qm_geometry = None
-
-
-    def get_energy_and_gradient(self, traj=None, geometry=None, include_coulomb='all', link_atoms=None, minimize=False, charges=None):
+        self.qm_symbols = None
+        self.qm_coordinates = None
+        self.guess_key = None
+        self.guess_atoms = None
+        self.error_tolerance = None
+        self.convergence = None
+        self.levels = levels if levels is not None else {}
+        self.level = None
+        self.default_level = None
+        self.telemetry = None
+
+
+    def get_energy_and_gradient(self, traj=None, geometry=None, include_coulomb='all', link_atoms=None, minimize=False, charges=None,
+                                guess_key=None, guess_atoms=None, energy_only=False, error_tolerance=None, level=None):
         """
         Gets the energy and gradient from a QM computation of the primary subsystem 
 
@@ -39,17 +73,91 @@ class QMWrapper(ABC):
             whether to return the geometry optimized energy 
         charges : list
             charges and corresponding positions in angstroms as xyz coordinates
+        guess_key : hashable
+            identifies the QM region across computations, e.g. by its atoms and partition,
+            so that its converged orbitals can be reused as the next SCF guess. 
+            Default is None, which does not reuse orbitals.
+        guess_atoms : list
+            index of each atom of the QM region in the entire system, None for link atoms,
+            so that SCF guesses can be assembled from other QM regions with the same atoms. 
+            Default is None.
+        energy_only : bool
+            whether to only compute the energy, in which case 
+            the gradient is not computed and not returned. Default is False.
+        error_tolerance : float
+            absolute error in hartrees (and hartree/bohr for the gradient) that is acceptable 
+            for this computation, up to which the QM program may loosen its convergence 
+            thresholds. Default is None, which uses the thresholds of the QM parameters.
+        level : str
+            name of the level of theory in self.levels to compute at. 
+            Default is None, which uses the default level.
 
         Returns
         -------
         dict
-            A dictionary with energy('energy') and gradient('gradients') information
+            A dictionary with energy('energy') and gradient('gradients') information.
+            If the QM program reports them, the convergence thresholds that 
+            were used are included as 'convergence'. The record of the computation 
+            from :func:`~janus.qm_wrapper.QMWrapper.record_telemetry` is included as 'telemetry'
+
+        Note
+        ----
+        If a cache is used and the same computation has been done before,
+        the stored energy and gradient are returned and the wavefunction is not updated
 
         Examples
         --------
         >>> get_energy_and_gradient(traj=mdtraj, geometry=None)
         """
-        
+
+        start = time.perf_counter()
+
+        self.set_up_computation(traj=traj, geometry=geometry, charges=charges, guess_key=guess_key,
+                                guess_atoms=guess_atoms, error_tolerance=error_tolerance, level=level)
+
+        key, cache_status = self.get_cached_info(start, minimize, energy_only)
+        if cache_status in ('memory', 'disk'):
+            return self.info
+
+        if minimize is True:
+            geom = self.optimize_geometry()
+        elif energy_only is True:
+            self.gradient = None
+            self.compute_energy()
+        else:
+            self.compute_info()
+
+        return self.get_info(start, key, cache_status, minimize, energy_only)
+
+    def get_energies_and_gradients(self, calls):
+        """
+        Gets the energies and gradients of several QM computations, 
+        e.g. of the primary subsystems of all partitions of an adaptive QM/MM step.
+        The computations are done one after another. Child classes that 
+        can run computations concurrently override this function.
+
+        Parameters
+        ----------
+        calls : list
+            a dict of parameters of :func:`~janus.qm_wrapper.QMWrapper.get_energy_and_gradient`
+            for every computation
+
+        Returns
+        -------
+        list
+            the result of every computation, in the order of calls
+        """
+
+        return [self.get_energy_and_gradient(**call) for call in calls]
+
+    def set_up_computation(self, traj=None, geometry=None, charges=None, guess_key=None, 
+                           guess_atoms=None, error_tolerance=None, level=None, **kwargs):
+        """
+        Sets the geometry, external charges, guess, error tolerance and level of
+        the next computation, see :func:`~janus.qm_wrapper.QMWrapper.get_energy_and_gradient`
+        for the parameters. Other parameters of get_energy_and_gradient are ignored.
+        """
+
         if (geometry is None and traj is not None):
             self.get_geom_from_trajectory(traj)
         elif (geometry is not None and traj is None):
@@ -58,24 +166,241 @@ class QMWrapper(ABC):
         if charges is not None:
             self.external_charges = charges
 
+        self.guess_key = guess_key
+        self.guess_atoms = guess_atoms
+        self.error_tolerance = error_tolerance
+        self.convergence = None
+
         if self.qm_param is None:
             self.build_qm_param()
 
-        if minimize is True:
-            geom = self.optimize_geometry()
-        else:
-            self.compute_info()
+        self.set_level(level)
+
+    def get_cached_info(self, start, minimize=False, energy_only=False):
+        """
+        Looks up the computation that was set up in the cache. If it is found, 
+        its results are saved as self.energy, self.gradient and self.info
+
+        Parameters
+        ----------
+        start : float
+            time.perf_counter() at the start of the computation
+        minimize : bool
+            whether the computation is a geometry optimization
+        energy_only : bool
+            whether the computation only gives the energy
+
+        Returns
+        -------
+        str
+            the cache key, None if no cache is used
+        str
+            the cache status of :func:`~janus.qm_wrapper.QMWrapper.record_telemetry`
+        """
+
+        if self.cache is None:
+            return None, None
+
+        key = self.get_cache_key(minimize, energy_only)
+        hits = self.cache.hits
+        cached = self.cache.get(key)
+        print('QM cache', self.cache.get_stats())
+        if cached is None:
+            return key, 'miss'
+
+        cache_status = 'memory' if self.cache.hits > hits else 'disk'
+        self.energy = cached['energy']
+        self.info = {'energy' : self.energy}
+        if 'gradients' in cached:
+            self.gradient = np.array(cached['gradients'])
+            self.info['gradients'] = self.gradient
+        self.info['telemetry'] = self.record_telemetry(start, cache_status, minimize, energy_only)
+
+        return key, cache_status
+
+    def get_info(self, start, key=None, cache_status=None, minimize=False, energy_only=False):
+        """
+        Collects the results of the computation that was done as self.info, 
+        and stores them in the cache
+
+        Parameters
+        ----------
+        start : float
+            time.perf_counter() at the start of the computation
+        key : str
+            the cache key, default is None
+        cache_status : str
+            the cache status of :func:`~janus.qm_wrapper.QMWrapper.record_telemetry`
+        minimize : bool
+            whether the computation is a geometry optimization
+        energy_only : bool
+            whether the computation only gives the energy
+
+        Returns
+        -------
+        dict
+            see :func:`~janus.qm_wrapper.QMWrapper.get_energy_and_gradient`
+        """
 
         self.info = {}
         self.info['energy'] = self.energy
-        self.info['gradients'] = self.gradient
+        if energy_only is False:
+            self.info['gradients'] = self.gradient
+        if self.convergence is not None:
+            self.info['convergence'] = self.convergence
+
+        if key is not None:
+            entry = {'energy' : self.energy}
+            if energy_only is False:
+                entry['gradients'] = np.array(self.gradient)
+            self.cache.put(key, entry)
+
+        self.info['telemetry'] = self.record_telemetry(start, cache_status, minimize, energy_only)
         
         return self.info
 
+    def record_telemetry(self, start, cache_status=None, minimize=False, energy_only=False):
+        """
+        Records the current computation as self.telemetry, 
+        so slow QM computations can be traced back to their size, 
+        SCF convergence and guesses
+
+        Parameters
+        ----------
+        start : float
+            time.perf_counter() at the start of the computation
+        cache_status : str
+            'memory' or 'disk' if the result was found in the cache, 
+            'miss' if it was not, and None if no cache is used
+        minimize : bool
+            whether the computation is a geometry optimization
+        energy_only : bool
+            whether the computation only gives the energy
+
+        Returns
+        -------
+        dict
+            the QM program, level, number of atoms ('n_atoms'), cache status ('cache')
+            and wall time in seconds ('wall_time') of the computation. If it was computed, 
+            the details reported by :func:`~janus.qm_wrapper.QMWrapper.get_telemetry` are included.
+        """
+
+        if self.qm_symbols is not None:
+            n_atoms = len(self.qm_symbols)
+        else:
+            n_atoms = len([l for l in str(self.qm_geometry).splitlines() if len(l.split()) == 4])
+
+        self.telemetry = {'program' : self.class_type,
+                          'level' : self.level,
+                          'n_atoms' : n_atoms,
+                          'minimize' : minimize,
+                          'energy_only' : energy_only,
+                          'cache' : cache_status}
+
+        if cache_status not in ('memory', 'disk'):
+            self.telemetry.update(self.get_telemetry())
+
+        self.telemetry['wall_time'] = time.perf_counter() - start
+
+        return self.telemetry
+
+    def get_telemetry(self):
+        """
+        Gets the details of the last computation reported by the QM program.
+        Child classes that track them override this function,
+        e.g. with the number of basis functions and SCF iterations
+
+        Returns
+        -------
+        dict
+        """
+        return {}
+
+    def computes_outside_interpreter(self):
+        """
+        Whether the computations of the wrapper run outside of the Python interpreter, 
+        so that other threads can run while it computes. Child classes that 
+        compute in other processes or release the interpreter override this function
+
+        Returns
+        -------
+        bool
+        """
+        return False
+
+    def set_level(self, level=None):
+        """
+        Switches self.method and self.qm_param to a level of theory. 
+        The method and QM parameters the wrapper was created with are 
+        kept as the default level.
+
+        Parameters
+        ----------
+        level : str
+            name of the level in self.levels, or None for the default level
+
+        Raises
+        ------
+        ValueError
+            if level is not in self.levels
+        """
+
+        if level == self.level:
+            return
+
+        if (level is not None and level not in self.levels):
+            raise ValueError("{} not in the levels {}".format(level, list(self.levels)))
+
+        if self.default_level is None:
+            self.default_level = (self.method, dict(self.qm_param))
+
+        method, qm_param = self.default_level
+        qm_param = dict(qm_param)
+
+        if level is not None:
+            options = dict(self.levels[level])
+            method = options.pop('method', method)
+            qm_param.update(options)
+
+        self.method = method
+        self.qm_param = qm_param
+        self.level = level
+
+    def get_cache_key(self, minimize=False, energy_only=False):
+        """
+        Gets the cache key of the current computation from the 
+        geometry, charge, multiplicity, level, method, options, error tolerance and external charges.
+        The geometry is the rounded XYZ string given to the QM program, 
+        so computations with the same key have the same input.
+
+        Parameters
+        ----------
+        minimize : bool
+            whether the computation is a geometry optimization
+        energy_only : bool
+            whether the computation only gives the energy
+
+        Returns
+        -------
+        str
+        """
+
+        params = sorted((k, v) for k, v in self.qm_param.items() if "sys_" not in k)
+
+        charges = None
+        if self.external_charges is not None:
+            charges = np.asarray(self.external_charges, dtype=float)
+
+        return QMCache.make_key(self.class_type, self.qm_geometry, self.charge, self.multiplicity, self.level,
+                                self.method, params, charges, minimize, energy_only, self.error_tolerance)
+
             
     def get_geom_from_trajectory(self, qm_traj=None):
         """
         Obtains geometry information from an MDtrah trajectory object.
+        Saves the XYZ string as self.qm_geometry, and the element symbols and 
+        coordinates in angstroms, rounded like the XYZ string, as 
+        self.qm_symbols and self.qm_coordinates
 
         Parameters
         ----------
@@ -84,22 +409,15 @@ class QMWrapper(ABC):
 
         """
 
-        out = ""
         line = '{:3} {: > 7.3f} {: > 7.3f} {: > 7.3f} \n '
-        self.total_elec = 0.0
 
-        for i in range(qm_traj.n_atoms):
-            x, y, z =   qm_traj.xyz[0][i][0],\
-                        qm_traj.xyz[0][i][1],\
-                        qm_traj.xyz[0][i][2]
-
-            symbol = qm_traj.topology.atom(i).element.symbol
-            n = mdlv.element(symbol).atomic_number
-            self.total_elec += n
-            
-            out += line.format(symbol, x*10, y*10, z*10)
+        elements = [atom.element for atom in qm_traj.topology.atoms]
+        xyz = qm_traj.xyz[0]*10
 
-        self.qm_geometry = out
+        self.qm_symbols = tuple(e.symbol for e in elements)
+        self.qm_coordinates = np.round(xyz.astype(np.float64), 3)
+        self.qm_geometry = ''.join([line.format(s, x, y, z) for s, (x, y, z) in zip(self.qm_symbols, xyz)])
+        self.total_elec = float(sum(e.atomic_number for e in elements))
 
         if self.total_elec % 2 != 0:
             self.total_elec += self.charge   # takes charge into account
@@ -116,6 +434,8 @@ class QMWrapper(ABC):
             A str containing an XYZ coordinate 
         """
         self.qm_geometry = geom
+        self.qm_symbols = None
+        self.qm_coordinates = None
 
     @abstractmethod
     def compute_info(self):
@@ -124,6 +444,14 @@ class QMWrapper(ABC):
         """
         pass
 
+    def compute_energy(self):
+        """
+        Obtains the energy of the QM region and saves it as self.energy.
+        Child classes that can skip the gradient override this function,
+        by default the energy comes from :func:`~janus.qm_wrapper.QMWrapper.compute_info`
+        """
+        self.compute_info()
+
     @abstractmethod
     def build_qm_param(self):
         """
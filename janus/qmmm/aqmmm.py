@@ -4,6 +4,7 @@ import mdtraj as md
 import numpy as np
 from janus.partition import DistancePartition, HystereticPartition
 from janus.qmmm import QMMM
+from janus.system import System
 
 class AQMMM(ABC, QMMM):
     """
@@ -28,6 +29,9 @@ class AQMMM(ABC, QMMM):
                        Rmax=4.5,
                        Rmin_qm=3.6,
                        Rmin_bf=4.3,
+                       convergence_budget=None,
+                       partition_level=None,
+                       partition_executor='serial',
                        qmmm_param={}):
 
 
@@ -38,6 +42,13 @@ class AQMMM(ABC, QMMM):
         self.Rmax = Rmax
         self.Rmin_qm = Rmin_qm
         self.Rmin_bf = Rmin_bf
+        self.convergence_budget = convergence_budget
+        self.partition_level = partition_level
+        self.level_correction = None
+
+        if partition_executor not in ('serial', 'batch'):
+            raise ValueError("partition_executor needs to be serial or batch")
+        self.partition_executor = partition_executor
         self.class_type = class_type
         self.buffer_groups = {}
         self.get_qm_center_residues()
@@ -65,21 +76,17 @@ class AQMMM(ABC, QMMM):
         self.update_traj(main_info['positions'], main_info['topology'], wrapper_type)
         self.find_buffer_zone()
         self.find_configurations()
+        self.set_error_tolerances()
+        self.level_correction = None
 
-        counter = 0
-        for i, system in self.systems[self.run_ID].items():
-            print('Running QM/MM partition {}'.format(counter))
-            print('Number of QM atoms for partition {} is {}'.format(counter,len(system.qm_atoms)))
-
-            self.qm_atoms = deepcopy(system.qm_atoms)
+        # partitions are computed from the smallest to the largest, so that 
+        # nested partitions can start from the results of the ones they contain
+        partitions = sorted(self.systems[self.run_ID].items(), key=lambda item: len(item[1].qm_atoms))
 
-            if self.embedding_method =='Mechanical':
-                self.mechanical(system, main_info)
-            elif self.embedding_method =='Electrostatic':
-                self.electrostatic(system, main_info)
-            else:
-                print('only mechanical and electrostatic embedding schemes implemented at this time')
-            counter += 1
+        if self.partition_executor == 'batch':
+            self.run_partitions_batch(partitions, main_info)
+        else:
+            self.run_partitions(partitions, main_info)
 
         print('QM/MM partitions done. Getting zero energies')
         self.get_zero_energy()
@@ -90,6 +97,8 @@ class AQMMM(ABC, QMMM):
         #if self.run_ID % 10 == 0:
         print('!', self.run_ID, self.systems[self.run_ID]['qmmm_energy'] + self.systems[self.run_ID]['kinetic_energy'])
 
+        self.record_telemetry()
+
         # updates current step count
         self.run_ID += 1
 
@@ -98,6 +107,459 @@ class AQMMM(ABC, QMMM):
             del self.systems[self.run_ID - 2]
 
         
+    def run_partitions(self, partitions, main_info):
+        """
+        Computes the QM/MM energy and gradients of each partition, one after another
+
+        Parameters
+        ----------
+        partitions : list
+            (partition ID, :class:`~janus.system.System`) of the partitions, 
+            in the order they are computed
+        main_info : dict 
+            contains the energy and forces for the whole system
+        """
+
+        counter = 0
+        for i, system in partitions:
+            print('Running QM/MM partition {}'.format(counter))
+            print('Number of QM atoms for partition {} is {}'.format(counter,len(system.qm_atoms)))
+
+            self.qm_atoms = deepcopy(system.qm_atoms)
+
+            if self.embedding_method =='Mechanical':
+                self.mechanical(system, main_info)
+            elif self.embedding_method =='Electrostatic':
+                self.electrostatic(system, main_info)
+            else:
+                print('only mechanical and electrostatic embedding schemes implemented at this time')
+
+            if system.error_tolerance is not None:
+                print('Partition {} has weight {:.3e} and error tolerance {:.3e}, converged with {}'\
+                      .format(counter, system.weight, system.error_tolerance, system.primary_subsys['hl'].get('convergence')))
+            counter += 1
+
+    def run_partitions_batch(self, partitions, main_info):
+        """
+        Computes the QM/MM energy and gradients of all partitions with their 
+        high level computations submitted together to the high level wrapper, 
+        see :func:`~janus.qm_wrapper.QMWrapper.get_energies_and_gradients`.
+        All partitions are set up first, then the high level computations are done, 
+        starting with the largest, and the MM computations of the partitions one after another,
+        concurrently if self.concurrent_hl is True. The results are combined for each partition 
+        in the order of partitions, so they do not depend on the order in which the high level 
+        computations finish. With :class:`~janus.qm_wrapper.QMWorkerWrapper`, the high level 
+        computations run concurrently on its workers.
+
+        Parameters
+        ----------
+        partitions : list
+            (partition ID, :class:`~janus.system.System`) of the partitions
+        main_info : dict 
+            contains the energy and forces for the whole system
+        """
+
+        calls = []
+        prepared = []
+        for counter, (i, system) in enumerate(partitions):
+            print('Setting up QM/MM partition {}'.format(counter))
+            print('Number of QM atoms for partition {} is {}'.format(counter,len(system.qm_atoms)))
+
+            self.qm_atoms = deepcopy(system.qm_atoms)
+
+            if self.embedding_method =='Mechanical':
+                traj_ps, link_indices, charges = self.set_up_mechanical(system, main_info)
+            elif self.embedding_method =='Electrostatic':
+                traj_ps, link_indices, charges = self.set_up_electrostatic(system, main_info)
+            else:
+                print('only mechanical and electrostatic embedding schemes implemented at this time')
+                continue
+
+            self.save_boundary(system)
+
+            first = len(calls)
+            for level in self.get_hl_levels(system):
+                calls.append(self.get_hl_call(system, traj_ps, link_indices, charges=charges, level=level))
+            prepared.append((counter, system, link_indices, first, len(calls)))
+
+        # largest computations first, results are put back in the order of calls
+        order = sorted(range(len(calls)), key=lambda k: -calls[k]['traj'].n_atoms)
+        print('Running {} high level computations'.format(len(calls)))
+        if self.concurrent_hl is True:
+            hl = self.get_hl_executor().submit(self.hl_wrapper.get_energies_and_gradients, [calls[k] for k in order])
+
+        for counter, system, link_indices, first, last in prepared:
+            self.qm_atoms = deepcopy(system.qm_atoms)
+            self.restore_boundary(system)
+            self.compute_ll(system, link_indices)
+
+        if self.concurrent_hl is True:
+            done = hl.result()
+        else:
+            done = self.hl_wrapper.get_energies_and_gradients([calls[k] for k in order])
+
+        results = [None]*len(calls)
+        for k, info in zip(order, done):
+            results[k] = info
+
+        # the qm partition is combined first, as the level correction of the other partitions comes from it
+        for counter, system, link_indices, first, last in sorted(prepared, key=lambda p: p[1].partition_ID != 'qm'):
+            self.qm_atoms = deepcopy(system.qm_atoms)
+            self.restore_boundary(system)
+
+            infos = results[first:last]
+            for info in infos:
+                self.add_qm_telemetry(system, info)
+            system.primary_subsys['hl'] = self.combine_levels(system, self.get_guess_atoms(system, link_indices), infos)
+
+            self.compute_qmmm_energy(system)
+
+            if system.error_tolerance is not None:
+                print('Partition {} has weight {:.3e} and error tolerance {:.3e}, converged with {}'\
+                      .format(counter, system.weight, system.error_tolerance, system.primary_subsys['hl'].get('convergence')))
+
+    def save_boundary(self, system):
+        """
+        Keeps the boundary bonds, link atoms and secondary subsystem atoms of the 
+        partition that was set up last in system.boundary
+
+        Parameters
+        ----------
+        system : :class:`~janus.system.System`
+        """
+
+        system.boundary = {'qmmm_boundary_bonds' : self.qmmm_boundary_bonds,
+                           'link_atoms' : getattr(self, 'link_atoms', {}),
+                           'mm_atoms' : getattr(self, 'mm_atoms', [])}
+
+    def restore_boundary(self, system):
+        """
+        Sets the boundary bonds, link atoms and secondary subsystem atoms 
+        kept by :func:`~janus.qmmm.AQMMM.save_boundary` for a partition
+
+        Parameters
+        ----------
+        system : :class:`~janus.system.System`
+        """
+
+        self.qmmm_boundary_bonds = system.boundary['qmmm_boundary_bonds']
+        self.link_atoms = system.boundary['link_atoms']
+        self.mm_atoms = system.boundary['mm_atoms']
+
+    def compute_hl(self, system, traj_ps, link_indices, charges=None, level=None):
+        """
+        Gets the high level energy and gradients of the primary subsystem of a partition,
+        see :func:`~janus.qmmm.QMMM.compute_hl`.
+
+        If self.partition_level is set, only the qm partition is computed at the 
+        default level of the high level wrapper. The qm partition is also computed at 
+        self.partition_level, and all other partitions are computed at self.partition_level
+        and corrected by the difference between the two levels for the qm partition,
+        see :func:`~janus.qmmm.AQMMM.correct_level`
+
+        Parameters
+        ----------
+        system : :class:`~janus.system.System`
+        traj_ps : MDtraj trajectory object
+            the primary subsystem with its link atoms
+        link_indices : list
+            indices of the link atoms in traj_ps
+        charges : numpy array
+            external charges for electrostatic embedding, default is None
+        level : str
+            level of theory of the high level wrapper, default is None
+
+        Returns
+        -------
+        dict
+            A dictionary with energy('energy') and gradient('gradients') information
+        """
+
+        if (self.partition_level is None or level is not None):
+            return super().compute_hl(system, traj_ps, link_indices, charges=charges, level=level)
+
+        infos = []
+        for l in self.get_hl_levels(system):
+            infos.append(super().compute_hl(system, traj_ps, link_indices, charges=charges, level=l))
+        return self.combine_levels(system, self.get_guess_atoms(system, link_indices), infos)
+
+    def get_hl_levels(self, system):
+        """
+        Gets the levels of theory at which the primary subsystem
+        of a partition is computed, see :func:`~janus.qmmm.AQMMM.compute_hl`
+
+        Parameters
+        ----------
+        system : :class:`~janus.system.System`
+
+        Returns
+        -------
+        list
+            names of levels of the high level wrapper, None for the default level
+        """
+
+        if self.partition_level is None:
+            return [None]
+
+        if system.partition_ID == 'qm':
+            # the correction is only needed if there are other partitions
+            if len(self.systems[self.run_ID]) > 1:
+                return [None, self.partition_level]
+            return [None]
+
+        return [self.partition_level]
+
+    def combine_levels(self, system, atoms, infos):
+        """
+        Combines the high level results of a partition at the levels of 
+        :func:`~janus.qmmm.AQMMM.get_hl_levels`. For the qm partition, the level 
+        correction is computed from its results at both levels, and other partitions
+        are corrected with :func:`~janus.qmmm.AQMMM.correct_level`
+
+        Parameters
+        ----------
+        system : :class:`~janus.system.System`
+        atoms : list
+            index in the entire system of each atom of the primary subsystem, None for link atoms
+        infos : list
+            energy and gradients of the partition at each level
+
+        Returns
+        -------
+        dict
+            energy and gradients of the partition
+        """
+
+        if self.partition_level is None:
+            return infos[0]
+
+        if system.partition_ID == 'qm':
+            if len(infos) > 1:
+                link_atoms = self.link_atoms if self.qmmm_boundary_bonds else {}
+                self.level_correction = AQMMM.get_level_correction(infos[0], infos[1], atoms, link_atoms)
+                print('Level correction of the qm partition', self.level_correction['energy'])
+            return infos[0]
+
+        return self.correct_level(infos[0], atoms)
+
+    def get_level_correction(high, low, atoms, link_atoms):
+        """
+        Gets the difference between the high level results 
+        of a primary subsystem at two levels of theory.
+        The gradient difference of each link atom is projected onto
+        the qm and mm atoms of its bond, as in :func:`~janus.qmmm.QMMM.compute_gradients`
+
+        Parameters
+        ----------
+        high : dict
+            energy and gradients at the default level
+        low : dict
+            energy and gradients at the cheaper level
+        atoms : list
+            index in the entire system of each atom of the primary subsystem, None for link atoms
+        link_atoms : dict
+            the link atoms of the primary subsystem, see :func:`~janus.qmmm.QMMM.prepare_link_atom`
+
+        Returns
+        -------
+        dict
+            the energy difference ('energy') and if available the gradient 
+            difference of each atom of the entire system ('gradients')
+        """
+
+        correction = {'energy' : high['energy'] - low['energy']}
+
+        if ('gradients' in high and 'gradients' in low):
+            difference = np.asarray(high['gradients']) - np.asarray(low['gradients'])
+            gradients = {a : difference[i] for i, a in enumerate(atoms) if a is not None}
+
+            # the link atom is at (1 - g) * qm atom + g * mm atom
+            for j, link in link_atoms.items():
+                if isinstance(j, int):
+                    q1 = link['qm_atom'].index
+                    m1 = link['mm_atom'].index
+                    g = link['scale_factor']
+                    delta = difference[link['link_atom_index']]
+                    gradients[q1] = gradients.get(q1, 0.0) + (1 - g) * delta
+                    gradients[m1] = gradients.get(m1, 0.0) + g * delta
+
+            correction['gradients'] = gradients
+
+        return correction
+
+    def correct_level(self, info, atoms):
+        """
+        Corrects the results of a partition computed at self.partition_level
+        by the difference between the levels for the qm partition.
+        The gradient is corrected for the atoms of the primary subsystem of the partition,
+        and the correction of other atoms, e.g. the mm atoms of the link atom bonds of the 
+        qm partition, is kept as 'outer_gradients' for :func:`~janus.qmmm.AQMMM.compute_gradients`
+
+        Parameters
+        ----------
+        info : dict
+            energy and gradients of the partition at self.partition_level
+        atoms : list
+            index in the entire system of each atom of the primary subsystem, None for link atoms
+
+        Returns
+        -------
+        dict
+            the corrected energy and gradients
+
+        Raises
+        ------
+        ValueError
+            if the qm partition has not been computed in the current step
+        """
+
+        if self.level_correction is None:
+            raise ValueError("the qm partition must be computed before the other partitions to correct their level")
+
+        corrected = dict(info)
+        corrected['energy'] = info['energy'] + self.level_correction['energy']
+        corrected['level'] = self.partition_level
+
+        if ('gradients' in info and 'gradients' in self.level_correction):
+            gradients = np.array(info['gradients'])
+            rows = {a : i for i, a in enumerate(atoms) if a is not None}
+            outer = {}
+            for a, gradient in self.level_correction['gradients'].items():
+                if a in rows:
+                    gradients[rows[a]] += gradient
+                else:
+                    outer[a] = gradient
+            corrected['gradients'] = gradients
+            corrected['outer_gradients'] = outer
+
+        return corrected
+
+    def compute_gradients(self, system):
+        """
+        Computes the QM/MM gradients of a partition, see :func:`~janus.qmmm.QMMM.compute_gradients`,
+        and adds the level correction of the atoms outside of its primary subsystem
+        from :func:`~janus.qmmm.AQMMM.correct_level`
+
+        Parameters
+        ----------
+        system : :class:`~janus.system.System`
+            The system in which to save qmmm energy and forces
+        """
+
+        super().compute_gradients(system)
+
+        for a, gradient in system.primary_subsys['hl'].get('outer_gradients', {}).items():
+            if a in system.qmmm_forces:
+                system.qmmm_forces[a] = system.qmmm_forces[a] - gradient
+            else:
+                system.qmmm_forces[a] = -1 * gradient
+
+    def get_partition_weights(self):
+        """
+        Gets the weight of the energy of each partition of the current step
+        in the interpolated QM/MM energy. Schemes with several partitions
+        override this function, the default weight of every partition is 1.
+
+        Returns
+        -------
+        dict
+            the weight of each partition ID
+        """
+
+        return {i : 1.0 for i, system in self.systems[self.run_ID].items() if isinstance(system, System)}
+
+    def scale_partition(system, weight):
+        """
+        Scales the QM/MM energy and forces of a partition by its weight 
+        from :func:`~janus.qmmm.AQMMM.get_partition_weights` and saves them
+        as system.aqmmm_energy and system.aqmmm_forces
+
+        Parameters
+        ----------
+        system : :class:`~janus.system.System`
+        weight : float
+        """
+
+        system.aqmmm_energy = system.qmmm_energy * weight
+        system.aqmmm_forces = {i : force * weight for i, force in system.qmmm_forces.items()}
+
+    def get_partition_weight_gradients(self, step=1e-6):
+        """
+        Gets the norm of the gradient of the weight of each partition 
+        from :func:`~janus.qmmm.AQMMM.get_partition_weights` with respect to the 
+        distances of the buffer groups from the qm center. The derivatives of the 
+        weights with respect to the switching function s_i of each buffer group 
+        are computed by finite differences, and multiplied by the derivative of s_i
+
+        Parameters
+        ----------
+        step : float
+            the change of s_i for the finite differences, default is 1e-6
+
+        Returns
+        -------
+        dict
+            the norm of the gradient of the weight of each partition ID in 1/angstrom
+        """
+
+        weights = self.get_partition_weights()
+        gradients = {i : 0.0 for i in weights}
+
+        for buf in self.buffer_groups.values():
+            # d_s_i is the derivative of s_i divided by r_i, see compute_lamda_i
+            d_s = abs(buf.d_s_i * buf.r_i)
+            if d_s == 0.0:
+                continue
+
+            s_i = buf.s_i
+            h = -step if s_i > 0.5 else step
+            buf.s_i = s_i + h
+            shifted = self.get_partition_weights()
+            buf.s_i = s_i
+
+            for i in weights:
+                gradients[i] += abs((shifted[i] - weights[i]) / h) * d_s
+
+        # the switching functions of the current step are set again
+        self.get_partition_weights()
+
+        return gradients
+
+    def set_error_tolerances(self):
+        """
+        Divides self.convergence_budget, the error in hartrees allowed for the 
+        interpolated energy and forces, evenly between the partitions of the current step,
+        and saves the error that is allowed for each partition as system.error_tolerance.
+        Partitions with small weights that do not change quickly with the positions of 
+        the buffer groups are allowed large errors, so their QM computations 
+        can be converged less tightly.
+
+        Note
+        ----
+        The allowed error of a partition is convergence_budget/(n*max(w, |dw|*(Rmax - Rmin)))
+        for n partitions, weight w and the gradient dw of the weight from 
+        :func:`~janus.qmmm.AQMMM.get_partition_weight_gradients`. An error of this size
+        adds at most convergence_budget/n to the energy, and convergence_budget/(n*(Rmax - Rmin))
+        per angstrom to the forces, including the terms from the gradient of the switching functions.
+        The QM programs are converged to the allowed errors with their convergence thresholds, 
+        which do not bound the error of the energy, so the budget is a heuristic, not a guarantee.
+        """
+
+        if self.convergence_budget is None:
+            return
+
+        weights = self.get_partition_weights()
+        gradients = self.get_partition_weight_gradients()
+
+        for i, weight in weights.items():
+            system = self.systems[self.run_ID][i]
+            system.weight = abs(weight)
+            scale = max(system.weight, gradients[i] * (self.Rmax - self.Rmin))
+            if scale > 0.0:
+                system.error_tolerance = self.convergence_budget / (len(weights) * scale)
+            else:
+                system.error_tolerance = float('inf')
+
     def compute_lamda_i(self, r_i):
         """
         Computes the switching function and the derivative 
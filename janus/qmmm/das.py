@@ -95,14 +95,10 @@ class DAS(AQMMM):
 
         else:
 
+            weights = self.get_partition_weights()
+
             # getting first term of ap energy and forces (w/o gradient of switching function)
-            qm.aqmmm_energy = deepcopy(qm.qmmm_energy)
-            qm.aqmmm_forces = deepcopy(qm.qmmm_forces)
-            
-            dis = sorted(self.buffer_distance, key=self.buffer_distance.get)
-            sigma = self.buffer_groups[dis[0]].s_i
-            qm.aqmmm_energy *= sigma
-            qm.aqmmm_forces.update((x, y*sigma) for x,y in qm.aqmmm_forces.items())
+            AQMMM.scale_partition(qm, weights['qm'])
 
             energy = deepcopy(qm.aqmmm_energy)
             qmmm_forces = deepcopy(qm.aqmmm_forces)
@@ -111,10 +107,7 @@ class DAS(AQMMM):
             for i, part in enumerate(self.partitions):
 
                 sys = self.systems[self.run_ID][i]
-                sys.aqmmm_energy = sys.qmmm_energy * sys.sigma
-
-                sys.aqmmm_forces = deepcopy(sys.qmmm_forces)
-                sys.aqmmm_forces.update((x, y*sys.sigma) for x,y in sys.aqmmm_forces.items())
+                AQMMM.scale_partition(sys, weights[i])
 
                 energy += sys.aqmmm_energy
 
@@ -151,6 +144,29 @@ class DAS(AQMMM):
             self.systems[self.run_ID]['qmmm_forces'] = qmmm_forces
             
 
+    def get_partition_weights(self):
+        """
+        Gets the weight of each partition in the DAS energy,
+        which is the sigma of each partition, and for the qm partition
+        the switching function of the closest buffer group
+
+        Returns
+        -------
+        dict
+            the weight of each partition ID
+        """
+
+        weights = {'qm' : 1.0}
+
+        if self.buffer_groups:
+            dis = sorted(self.buffer_distance, key=self.buffer_distance.get)
+            weights['qm'] = self.buffer_groups[dis[0]].s_i
+
+            for i, part in enumerate(self.partitions):
+                weights[i] = self.systems[self.run_ID][i].sigma
+
+        return weights
+
     def get_combos(self, items=None):
         """
         Gets all combinations of a given list of indices 
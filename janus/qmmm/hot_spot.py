@@ -78,7 +78,8 @@ class HotSpot(AQMMM):
         self.systems[self.run_ID]['qmmm_energy'] = qm.qmmm_energy
 
         # do I need to do deepcopy?
-        if not self.buffer_groups:
+        # there are no forces to scale in energy only mode
+        if (not self.buffer_groups or self.energy_only is True):
             self.systems[self.run_ID]['qmmm_forces'] = qm.qmmm_forces
 
         else:
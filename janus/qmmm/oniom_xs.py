@@ -85,18 +85,22 @@ class OniomXS(AQMMM):
 
         else:
             qm_bz = self.systems[self.run_ID]['qm_bz']
-            lamda = self.get_switching_function()
-            
+            weights = self.get_partition_weights()
+            lamda = weights['qm_bz']
 
             self.systems[self.run_ID]['qmmm_energy'] = \
-            (1- lamda)*qm.qmmm_energy + lamda*qm_bz.qmmm_energy
+            weights['qm']*qm.qmmm_energy + lamda*qm_bz.qmmm_energy
+
+            if self.energy_only is True:
+                self.systems[self.run_ID]['qmmm_forces'] = {}
+                return
 
             # needs work!
             # computing gradients
             forces = {}
             for f, coord in qm_bz.qmmm_forces.items():
                 if f in qm.qmmm_forces:
-                    forces[f] = lamda*coord + (1-lamda)*qm.qmmm_forces[f] 
+                    forces[f] = lamda*coord + weights['qm']*qm.qmmm_forces[f]
                 else: 
                     forces[f] = lamda*coord
 
@@ -112,6 +116,24 @@ class OniomXS(AQMMM):
             self.systems[self.run_ID]['qmmm_forces'] = forces
 
 
+    def get_partition_weights(self):
+        """
+        Gets the weight of each partition in the ONIOM-XS energy,
+        1 - s for the qm partition and s for the qm_bz partition,
+        where s is the average switching function
+
+        Returns
+        -------
+        dict
+            the weight of each partition ID
+        """
+
+        if not self.buffer_groups:
+            return {'qm' : 1.0}
+
+        lamda = self.get_switching_function()
+        return {'qm' : 1 - lamda, 'qm_bz' : lamda}
+
     def get_switching_function(self):
         """
         Averages the individual switching functions 
@@ -97,14 +97,10 @@ class PAP(AQMMM):
 
         else:
 
-            # getting first term of ap energy and forces (w/o gradient of switching function)
-            qm.aqmmm_energy = deepcopy(qm.qmmm_energy)
-            qm.aqmmm_forces = deepcopy(qm.qmmm_forces)
-
-            for i, buf in self.buffer_groups.items():
+            weights = self.get_partition_weights()
 
-                qm.aqmmm_energy *= (1 - buf.s_i)
-                qm.aqmmm_forces.update((x, y*(1 - buf.s_i)) for x,y in qm.aqmmm_forces.items())
+            # getting first term of ap energy and forces (w/o gradient of switching function)
+            AQMMM.scale_partition(qm, weights['qm'])
 
             energy = deepcopy(qm.aqmmm_energy)
             qmmm_forces = deepcopy(qm.aqmmm_forces)
@@ -113,20 +109,11 @@ class PAP(AQMMM):
             for i, part in enumerate(self.partitions):
 
                 sys = self.systems[self.run_ID][i]
-                sys.aqmmm_energy = deepcopy(sys.qmmm_energy)
-                sys.aqmmm_forces = deepcopy(sys.qmmm_forces)
-
-                for j, buf in self.buffer_groups.items():
-                    if j in part:
-                        sys.aqmmm_energy *= buf.s_i
-                        sys.aqmmm_forces.update((x, y*buf.s_i) for x,y in sys.aqmmm_forces.items())
-                    else:
-                        sys.aqmmm_energy *= (1 - buf.s_i)
-                        sys.aqmmm_forces.update((x, y*(1 - buf.s_i)) for x,y in sys.aqmmm_forces.items())
+                AQMMM.scale_partition(sys, weights[i])
 
                 energy += sys.aqmmm_energy
 
-            if self.modified_variant is False:
+            if (self.modified_variant is False and self.energy_only is False):
                 # computing forces due to gradient of switching function for PAP
                 forces_sf = self.compute_sf_gradient()
 
@@ -150,6 +137,30 @@ class PAP(AQMMM):
             self.systems[self.run_ID]['qmmm_energy'] = energy
             
 
+    def get_partition_weights(self):
+        """
+        Gets the weight of each partition in the PAP energy, 
+        which is the product of s_i for buffer groups in the 
+        partition and 1 - s_i for the other buffer groups
+
+        Returns
+        -------
+        dict
+            the weight of each partition ID
+        """
+
+        weights = {'qm' : 1.0}
+        for buf in self.buffer_groups.values():
+            weights['qm'] *= (1 - buf.s_i)
+
+        if self.buffer_groups:
+            for i, part in enumerate(self.partitions):
+                weights[i] = 1.0
+                for j, buf in self.buffer_groups.items():
+                    weights[i] *= buf.s_i if j in part else (1 - buf.s_i)
+
+        return weights
+
     def compute_sf_gradient(self):
         """
         Computes forces due to the gradient of the switching function
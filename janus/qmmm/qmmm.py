@@ -1,6 +1,9 @@
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 import numpy as np
 import mdtraj as md
+from scipy.spatial import cKDTree
+from scipy.spatial.distance import cdist
 from janus.system import System
 
 
@@ -34,6 +37,27 @@ class QMMM(object):
         link_atom_element : str 
             Element to use for link atom, default is H. 
             Beware of using others (not all functionality tested)
+        primary_subsys_engine : str
+            Engine for the low-level computation of the primary subsystem,
+            e.g. 'numpy' to avoid an OpenMM context for small QM regions. 
+            Default is None, which uses the low-level program.
+        embedding_cutoff : float
+            Distance from the QM region in angstroms within which 
+            external charges are kept as point charges in electrostatic embedding.
+            Default is None, which keeps all charges.
+        far_field_cell : float
+            Size in angstroms of the cells in which the charges beyond 
+            embedding_cutoff are represented by their monopole and dipole.
+            Default is 10.0. If None, charges beyond the cutoff are left out.
+        energy_only : bool
+            Whether to only compute QM/MM energies. No gradients are computed
+            by the wrappers and the QM/MM forces are empty. Default is False.
+        concurrent_hl : bool
+            Whether to run the high level computation on a thread while the 
+            MM computations of the primary and secondary subsystems are done, which hides the MM cost. 
+            The high level wrapper has to compute outside of the Python interpreter, 
+            e.g. :class:`~janus.qm_wrapper.QMWorkerWrapper`, otherwise the thread 
+            cannot run at the same time as the MM computations. Default is False.
         
     """
 
@@ -45,7 +69,12 @@ class QMMM(object):
                        qmmm_scheme='subtractive', 
                        embedding_method='Mechanical', 
                        boundary_treatment='link_atom',
-                       link_atom_element='H'):
+                       link_atom_element='H',
+                       primary_subsys_engine=None,
+                       embedding_cutoff=None,
+                       far_field_cell=10.0,
+                       energy_only=False,
+                       concurrent_hl=False):
         
         self.class_type = 'QMMM'
         self.hl_wrapper = hl_wrapper
@@ -62,8 +91,23 @@ class QMMM(object):
         self.embedding_method = embedding_method
         self.boundary_treatment = boundary_treatment
         self.link_atom_element = link_atom_element
+        self.primary_subsys_engine = primary_subsys_engine
+        self.embedding_cutoff = embedding_cutoff
+        self.far_field_cell = far_field_cell
+        self.energy_only = energy_only
+
+        if (concurrent_hl is True and hl_wrapper.computes_outside_interpreter() is False):
+            raise ValueError("concurrent_hl needs a high level wrapper that computes outside of the Python interpreter, e.g. QMWorkerWrapper")
+        self.concurrent_hl = concurrent_hl
+        self.hl_executor = None
 
         self.systems = {}
+        self.entire_sys_info = None
+        self.charge_field = None
+        self.charge_mask = None
+        self.telemetry = None
+        self.main_topology = None
+        self.second_subsys_topology = None
 
     def run_qmmm(self, main_info, wrapper_type):
         """
@@ -102,6 +146,8 @@ class QMMM(object):
         print('! total energy', self.run_ID, self.systems[self.run_ID]['qmmm_energy'] + self.systems[self.run_ID]['kinetic_energy'])
         # add kinetic in total qmmm_energy
 
+        self.record_telemetry()
+
         # updates current step count
         self.run_ID += 1
         
@@ -123,17 +169,30 @@ class QMMM(object):
         wrapper_type : str
             Defines the program used to obtain topology and positions
 
+        Note
+        ----
+        The topology is only converted the first time it is seen, and 
+        afterwards the positions of self.traj are updated in place
+
        """ 
-        # later can think about saving instead of making new instance
-        # convert openmm topology to mdtraj topology
-        if wrapper_type == 'OpenMM':
-            top = md.Topology.from_openmm(topology)
-        for atom in top.atoms:
-            atom.serial = atom.index + 1
-
-        self.traj = md.Trajectory(position, top)
+        if (self.main_topology is not None and self.main_topology[0] is topology):
+            top = self.main_topology[1]
+        else:
+            # convert openmm topology to mdtraj topology
+            if wrapper_type == 'OpenMM':
+                top = md.Topology.from_openmm(topology)
+            for atom in top.atoms:
+                atom.serial = atom.index + 1
+            self.main_topology = (topology, top)
+
+        if self.traj.topology is top:
+            self.traj.xyz[0] = position
+        else:
+            self.traj = md.Trajectory(position, top)
         self.topology = self.traj.topology
         self.positions = self.traj.xyz[0]
+        self.entire_sys_info = None
+        self.charge_field = None
 
 
     def mechanical(self, system, main_info):
@@ -154,35 +213,52 @@ class QMMM(object):
         """
 
         if self.qmmm_scheme == 'subtractive':
-            # Get MM energy on whole system
-            system.entire_sys = self.ll_wrapper.get_energy_and_gradient(self.traj)
-            print('entire', system.entire_sys['energy'])
-
-            #print(system.entire_sys['energy'])
-            # Get MM energy on QM region
-            print('calling make primary subsys trajectory')
-            traj_ps, link_indices = self.make_primary_subsys_trajectory(qm_atoms=system.qm_atoms)
-            system.primary_subsys['trajectory'] = traj_ps
-            print('getting mm energy and gradient of qm region')
-            system.primary_subsys['ll'] = self.ll_wrapper.get_energy_and_gradient(traj_ps, include_coulomb='no_link', link_atoms=link_indices)
-            print('ll', system.primary_subsys['ll']['energy'])
+            traj_ps, link_indices, charges = self.set_up_mechanical(system, main_info)
 
-            # Get QM energy
-            print('getting qm energy and gradient of qm region')
-            system.primary_subsys['hl'] = self.hl_wrapper.get_energy_and_gradient(traj_ps)
+            # Get MM energy on QM region and QM energy
+            print('getting mm and qm energy and gradient of qm region')
+            self.compute_ll_and_hl(system, traj_ps, link_indices)
+            print('ll', system.primary_subsys['ll']['energy'])
             print('hl', system.primary_subsys['hl']['energy'])
-            print('hl', system.primary_subsys['hl']['gradients'])
+            if self.energy_only is False:
+                print('hl', system.primary_subsys['hl']['gradients'])
 
-            # Compute the total QM/MM energy based on
-            # subtractive Mechanical embedding
-            system.qmmm_energy = system.entire_sys['energy']\
-                        - system.primary_subsys['ll']['energy']\
-                        + system.primary_subsys['hl']['energy']
-
-            self.compute_gradients(system)
+            self.compute_qmmm_energy(system)
         else:
             print('only a subtractive scheme is implemented at this time')
 
+    def set_up_mechanical(self, system, main_info):
+        """
+        Gets the MM energy of the entire system and prepares 
+        the primary subsystem for the subtractive mechanical embedding scheme
+
+        Parameters
+        ----------
+        system : :class:`~janus.system.System`
+            The system in which to save the MM information
+        main_info : dict 
+            contains the energy and forces for the whole system
+
+        Returns
+        -------
+        MDtraj trajectory object
+            the primary subsystem with its link atoms
+        list
+            indices of the link atoms in the primary subsystem
+        None
+            mechanical embedding has no external charges
+        """
+
+        # Get MM energy on whole system
+        system.entire_sys = self.get_entire_sys_info(main_info)
+        print('entire', system.entire_sys['energy'])
+
+        print('calling make primary subsys trajectory')
+        traj_ps, link_indices = self.make_primary_subsys_trajectory(qm_atoms=system.qm_atoms)
+        system.primary_subsys['trajectory'] = traj_ps
+
+        return traj_ps, link_indices, None
+
     def electrostatic(self, system, main_info):
         """
         Gets energies of needed components and computes
@@ -201,36 +277,347 @@ class QMMM(object):
         """ 
 
         if self.qmmm_scheme == 'subtractive':
+            traj_ps, link_indices, charges = self.set_up_electrostatic(system, main_info)
+
+            # Get MM energies of the subsystems and QM energy
+            self.compute_ll_and_hl(system, traj_ps, link_indices, charges=charges)
 
-            # Get MM energy on whole system
-            system.entire_sys = self.ll_wrapper.get_energy_and_gradient(self.traj)
-            print('entire', system.entire_sys['energy'])
+            self.compute_qmmm_energy(system)
+
+        else:
+            print('only a subtractive scheme is implemented at this time')
 
-            # Get MM energy on QM region
-            traj_ps, link_indices = self.make_primary_subsys_trajectory(qm_atoms=system.qm_atoms)
-            system.primary_subsys['trajectory'] = traj_ps
-            system.primary_subsys['ll'] = self.ll_wrapper.get_energy_and_gradient(traj_ps, include_coulomb=None)
+    def set_up_electrostatic(self, system, main_info):
+        """
+        Gets the MM energy of the entire system without coulomb interactions and prepares 
+        the primary subsystem, its external charges and the secondary subsystem
+        for the subtractive electrostatic embedding scheme
+
+        Parameters
+        ----------
+        system : :class:`~janus.system.System`
+            The system in which to save the MM information
+        main_info : dict 
+            contains the energy and forces for the whole system
+
+        Returns
+        -------
+        MDtraj trajectory object
+            the primary subsystem with its link atoms
+        list
+            indices of the link atoms in the primary subsystem
+        numpy array
+            the external charges
+        """
+
+        # Get MM energy on whole system
+        system.entire_sys = self.get_entire_sys_info(main_info)
+        print('entire', system.entire_sys['energy'])
+
+        traj_ps, link_indices = self.make_primary_subsys_trajectory(qm_atoms=system.qm_atoms)
+        system.primary_subsys['trajectory'] = traj_ps
+
+        traj_ss = self.make_second_subsys_trajectory()
+        system.second_subsys['trajectory'] = traj_ss
+
+        charges = self.get_external_charges(system)
+
+        return traj_ps, link_indices, charges
+
+    def compute_ll(self, system, link_indices):
+        """
+        Gets the MM energy of the primary subsystem, and for electrostatic embedding
+        without coulomb interactions and the MM coulomb energy of the secondary subsystem
+
+        Parameters
+        ----------
+        system : :class:`~janus.system.System`
+            The system prepared by :func:`~janus.qmmm.QMMM.set_up_mechanical`
+            or :func:`~janus.qmmm.QMMM.set_up_electrostatic`
+        link_indices : list
+            indices of the link atoms in the primary subsystem
+        """
+
+        traj_ps = system.primary_subsys['trajectory']
+
+        if self.embedding_method == 'Electrostatic':
+            system.primary_subsys['ll'] = self.ll_wrapper.get_energy_and_gradient(traj_ps, include_coulomb=None,
+                                                                                  atom_indices=sorted(system.qm_atoms), link_bonds=self.get_link_bonds(),
+                                                                                  engine=self.primary_subsys_engine, energy_only=self.energy_only)
 
             # Get MM coulomb energy on secondary subsystem
-            traj_ss = self.make_second_subsys_trajectory()
-            system.second_subsys['trajectory'] = traj_ss
-            system.second_subsys['ll'] = self.ll_wrapper.get_energy_and_gradient(traj_ss, include_coulomb='only')
+            system.second_subsys['ll'] = self.ll_wrapper.get_energy_and_gradient(system.second_subsys['trajectory'], include_coulomb='only', 
+                                                                                 atom_indices=self.mm_atoms, energy_only=self.energy_only)
+        else:
+            system.primary_subsys['ll'] = self.ll_wrapper.get_energy_and_gradient(traj_ps, include_coulomb='no_link', link_atoms=link_indices,
+                                                                                  atom_indices=sorted(system.qm_atoms), link_bonds=self.get_link_bonds(),
+                                                                                  engine=self.primary_subsys_engine, energy_only=self.energy_only)
 
-            # Get QM energy
-            charges = self.get_external_charges(system)
-            system.primary_subsys['hl'] = self.hl_wrapper.get_energy_and_gradient(traj_ps, charges=charges)
+    def compute_ll_and_hl(self, system, traj_ps, link_indices, charges=None):
+        """
+        Gets the MM energies of :func:`~janus.qmmm.QMMM.compute_ll` and the high level 
+        energy of the primary subsystem. If self.concurrent_hl is True, the high level 
+        computation runs on a thread while the MM computations are done.
+
+        Parameters
+        ----------
+        system : :class:`~janus.system.System`
+        traj_ps : MDtraj trajectory object
+            the primary subsystem with its link atoms
+        link_indices : list
+            indices of the link atoms in traj_ps
+        charges : numpy array
+            external charges for electrostatic embedding, default is None
+        """
+
+        if self.concurrent_hl is True:
+            hl = self.get_hl_executor().submit(self.compute_hl, system, traj_ps, link_indices, charges=charges)
+            self.compute_ll(system, link_indices)
+            system.primary_subsys['hl'] = hl.result()
+        else:
+            self.compute_ll(system, link_indices)
+            system.primary_subsys['hl'] = self.compute_hl(system, traj_ps, link_indices, charges=charges)
 
-            # Compute the total QM/MM energy based on
-            # subtractive Mechanical embedding
-            system.qmmm_energy = system.entire_sys['energy']\
-                        - system.primary_subsys['ll']['energy']\
-                        + system.second_subsys['ll']['energy']\
-                        + system.primary_subsys['hl']['energy']
+    def get_hl_executor(self):
+        """
+        Gets the thread that runs high level computations concurrently 
+        with the MM computations, starting it the first time
+
+        Returns
+        -------
+        :class:`concurrent.futures.ThreadPoolExecutor`
+        """
+
+        if self.hl_executor is None:
+            self.hl_executor = ThreadPoolExecutor(max_workers=1)
+
+        return self.hl_executor
+
+    def close(self):
+        """
+        Shuts down the thread of the high level computations
+        started for concurrent_hl, and the high level wrapper
+        if it has a close function, e.g. the worker processes
+        of :class:`~janus.qm_wrapper.QMWorkerWrapper`
+        """
+
+        if self.hl_executor is not None:
+            self.hl_executor.shutdown()
+            self.hl_executor = None
+
+        if hasattr(self.hl_wrapper, 'close'):
+            self.hl_wrapper.close()
+
+    def compute_qmmm_energy(self, system):
+        """
+        Computes the subtractive QM/MM energy and gradients of a system from its 
+        high and low level information. The MM coulomb energy of the secondary 
+        subsystem is included for electrostatic embedding.
+
+        Parameters
+        ----------
+        system : :class:`~janus.system.System`
+            The system in which to save qmmm energy and forces
+        """
+
+        # Compute the total QM/MM energy based on
+        # subtractive Mechanical embedding
+        system.qmmm_energy = system.entire_sys['energy']\
+                    - system.primary_subsys['ll']['energy']\
+                    + system.primary_subsys['hl']['energy']
+
+        if 'll' in system.second_subsys:
+            system.qmmm_energy += system.second_subsys['ll']['energy']
+
+        self.compute_gradients(system)
+
+    def compute_hl(self, system, traj_ps, link_indices, charges=None, level=None):
+        """
+        Gets the high level energy and gradients of the primary subsystem of a system
+
+        Parameters
+        ----------
+        system : :class:`~janus.system.System`
+        traj_ps : MDtraj trajectory object
+            the primary subsystem with its link atoms
+        link_indices : list
+            indices of the link atoms in traj_ps
+        charges : numpy array
+            external charges for electrostatic embedding, default is None
+        level : str
+            level of theory of the high level wrapper, default is None
+
+        Returns
+        -------
+        dict
+            A dictionary with energy('energy') and gradient('gradients') information
+        """
+
+        info = self.hl_wrapper.get_energy_and_gradient(**self.get_hl_call(system, traj_ps, link_indices, charges=charges, level=level))
+        self.add_qm_telemetry(system, info)
+
+        return info
+
+    def get_hl_call(self, system, traj_ps, link_indices, charges=None, level=None):
+        """
+        Gets the parameters of the high level computation of the primary subsystem of a system,
+        see :func:`~janus.qmmm.QMMM.compute_hl`
+
+        Returns
+        -------
+        dict
+            parameters for the get_energy_and_gradient function of the high level wrapper
+        """
+
+        return {'traj' : traj_ps,
+                'charges' : charges,
+                'guess_key' : self.get_guess_key(system),
+                'guess_atoms' : self.get_guess_atoms(system, link_indices),
+                'energy_only' : self.energy_only,
+                'error_tolerance' : system.error_tolerance,
+                'level' : level}
+
+    def add_qm_telemetry(self, system, info):
+        """
+        Attaches the telemetry record of a high level computation to a system
+
+        Parameters
+        ----------
+        system : :class:`~janus.system.System`
+        info : dict
+            the result of the high level computation
+        """
+
+        if 'telemetry' in info:
+            system.qm_telemetry.append(info['telemetry'])
+
+    def record_telemetry(self):
+        """
+        Aggregates the QM telemetry of all partitions of the current step
+        as self.systems[self.run_ID]['telemetry'], and adds it to the 
+        totals of the run in self.telemetry
+        """
+
+        records = []
+        for i, system in self.systems[self.run_ID].items():
+            if isinstance(system, System):
+                records.extend(system.qm_telemetry)
+
+        step = QMMM.summarize_telemetry(records)
+        self.systems[self.run_ID]['telemetry'] = step
+        self.telemetry = QMMM.summarize_telemetry(records, self.telemetry)
+
+        print('QM telemetry of step {}: {} calls, {} cached, {} SCF iterations, {:.3f} s'\
+              .format(self.run_ID, step['calls'], step['cache_hits'], step['scf_iterations'], step['wall_time']))
+
+    def summarize_telemetry(records, summary=None):
+        """
+        Aggregates QM telemetry records from
+        :func:`~janus.qm_wrapper.QMWrapper.record_telemetry`
+
+        Parameters
+        ----------
+        records : list
+            telemetry records of QM computations
+        summary : dict
+            a summary to add the records to, default is None
+
+        Returns
+        -------
+        dict
+            the number of computations ('calls'), of computations found in the cache ('cache_hits'), 
+            and that had to be repeated after a failure ('fallbacks'), the total SCF iterations 
+            ('scf_iterations') and wall time ('wall_time'), the largest number of atoms ('max_atoms') 
+            and basis functions ('max_basis'), and the number of computations with each SCF guess ('guesses')
 
-            self.compute_gradients(system)
+        Examples
+        --------
+        >>> QMMM.summarize_telemetry(system.qm_telemetry)
+        """
 
+        if summary is None:
+            summary = {'calls' : 0, 'cache_hits' : 0, 'fallbacks' : 0, 'scf_iterations' : 0,
+                       'wall_time' : 0.0, 'max_atoms' : 0, 'max_basis' : 0, 'guesses' : {}}
         else:
-            print('only a subtractive scheme is implemented at this time')
+            summary = deepcopy(summary)
+
+        for record in records:
+            summary['calls'] += 1
+            summary['wall_time'] += record.get('wall_time', 0.0)
+            summary['max_atoms'] = max(summary['max_atoms'], record.get('n_atoms') or 0)
+            summary['max_basis'] = max(summary['max_basis'], record.get('n_basis') or 0)
+            summary['scf_iterations'] += int(record.get('scf_iterations') or 0)
+            if record.get('cache') in ('memory', 'disk'):
+                summary['cache_hits'] += 1
+            if record.get('fallback') is not None:
+                summary['fallbacks'] += 1
+            if record.get('guess') is not None:
+                summary['guesses'][record['guess']] = summary['guesses'].get(record['guess'], 0) + 1
+
+        return summary
+
+    def get_guess_atoms(self, system, link_indices):
+        """
+        Gets the index in the entire system of each atom of the 
+        primary subsystem of a system, None for link atoms
+
+        Parameters
+        ----------
+        system : :class:`~janus.system.System`
+        link_indices : list
+            indices of the link atoms of the primary subsystem
+
+        Returns
+        -------
+        list
+        """
+
+        return sorted(system.qm_atoms) + [None]*len(link_indices)
+
+    def get_guess_key(self, system):
+        """
+        Gets the key that identifies the QM region of a partition
+        across MD steps, so that the high level wrapper can reuse 
+        the orbitals of the previous step as the SCF guess
+
+        Parameters
+        ----------
+        system : :class:`~janus.system.System`
+            The partition of the QM region
+
+        Returns
+        -------
+        tuple
+            the partition ID and the sorted QM atoms
+        """
+
+        return (system.partition_ID, tuple(sorted(system.qm_atoms)))
+
+    def get_entire_sys_info(self, main_info=None):
+        """
+        Gets the MM energy and gradients of the entire system for the current geometry.
+        The result is computed once and shared by all partitions of a step.
+        If main_info contains the MM information of the entire 
+        system ('entire_sys'), it is used instead of a new computation
+
+        Parameters
+        ----------
+        main_info : dict 
+            contains the energy and forces for the whole system
+
+        Returns
+        -------
+        dict
+            A dictionary with energy('energy') and gradient('gradients') information
+        """
+
+        if (main_info is not None and 'entire_sys' in main_info):
+            return main_info['entire_sys']
+
+        if self.entire_sys_info is None:
+            self.entire_sys_info = self.ll_wrapper.get_energy_and_gradient(self.traj, energy_only=self.energy_only)
+
+        return self.entire_sys_info
 
     def compute_gradients(self, system):
         """
@@ -238,7 +625,8 @@ class QMMM(object):
 
         Note
         ----
-        RCD gradients currently not implemented
+        RCD gradients currently not implemented.
+        In energy only mode no gradients are available and the QM/MM forces are empty.
 
         Parameters
         ----------
@@ -246,6 +634,10 @@ class QMMM(object):
             The system in which to save qmmm energy and forces
 
         """
+        if self.energy_only is True:
+            system.qmmm_forces = {}
+            return
+
         # NEED TO MAKE SURE: am I working with GRADIENTS or FORCES? NEED TO MAKE SURE CONSISTENT!
         # NEED TO MAKE SURE UNITS CONSISTENT
 
@@ -386,6 +778,27 @@ class QMMM(object):
                 self.link_atoms['all_outer_bonds'].append(bonds)
 
 
+    def get_link_bonds(self):
+        """
+        Gets the bonds cut across the QM/MM boundary that 
+        link atoms were added for by :func:`~janus.qmmm.QMMM.make_primary_subsys_trajectory`
+
+        Returns
+        -------
+        list
+            (qm index, mm index, g) for each link atom, in the 
+            order the link atoms were added to the primary subsystem
+
+        """
+        link_bonds = []
+
+        if self.qmmm_boundary_bonds:
+            for i, link in self.link_atoms.items():
+                if isinstance(i, int):
+                    link_bonds.append((link['qm_atom'].index, link['mm_atom'].index, link['scale_factor']))
+
+        return link_bonds
+
     def make_primary_subsys_trajectory(self, qm_atoms=None):
         '''
         Creates a MDtraj trajectory object with just the 
@@ -470,9 +883,19 @@ class QMMM(object):
         if qm_atoms is None:
             qm_atoms = self.qm_atoms
     
-        self.mm_atoms = [i for i in range(self.traj.n_atoms) if i not in qm_atoms]
-
-        traj = self.traj.atom_slice(self.mm_atoms)
+        qm_set = set(qm_atoms)
+        self.mm_atoms = [i for i in range(self.traj.n_atoms) if i not in qm_set]
+
+        # the topology of the secondary subsystem is reused while the partition stays the same
+        key = (self.topology, tuple(self.mm_atoms))
+        if (self.second_subsys_topology is not None and self.second_subsys_topology[0][0] is key[0]
+                and self.second_subsys_topology[0][1] == key[1]):
+            traj = md.Trajectory(self.traj.xyz[:, self.mm_atoms], self.second_subsys_topology[1],
+                                 unitcell_lengths=self.traj.unitcell_lengths,
+                                 unitcell_angles=self.traj.unitcell_angles)
+        else:
+            traj = self.traj.atom_slice(self.mm_atoms)
+            self.second_subsys_topology = (key, traj.topology)
 
         return traj
 
@@ -513,80 +936,227 @@ class QMMM(object):
 
         Returns
         -------
-        list
-            charges and corresponding positions in angstroms as xyz coordinates
+        numpy array
+            (M,4) array with the charges and corresponding positions in angstroms as xyz coordinates
 
-        """
-        charges = []
-        # in angstroms
-        es_pos = 10*system.entire_sys['positions']
-        charge = self.ll_wrapper.get_main_charges()
+        Note
+        ----
+        The charges of all atoms are obtained once per step and shared by all systems,
+        see :func:`~janus.qmmm.QMMM.get_charge_field`. If self.embedding_cutoff is set,
+        the charges are screened by :func:`~janus.qmmm.QMMM.screen_charges`
 
+        """
         if self.embedding_method == 'Mechanical':
             return None
 
-        elif self.boundary_treatment == 'link_atom':
-            for i, chrg in enumerate(charge):
-                # add every atom not in qm system 
-                if i not in system.qm_atoms:
-                    # save positions in angstroms
-                    charges.append([chrg, es_pos[i][0], es_pos[i][1], es_pos[i][2]])
+        field = self.get_charge_field(system)
+
+        if self.boundary_treatment == 'link_atom':
+            # add every atom not in qm system 
+            charges = field[self.get_charge_mask(system.qm_atoms)]
         
         # This is for the RC and RCD schemes
         elif self.boundary_treatment == 'RC':
 
-            for i, chrg in enumerate(charge):
-                # add every atom not in qm system or the M1 atom 
-                if i not in system.qm_atoms and i not in self.link_atoms['all_mm']:
-                        charges.append([chrg, es_pos[i][0], es_pos[i][1], es_pos[i][2]])
-            
             bonds = self.link_atoms['all_outer_bonds']
+            redistributed = []
+
+            # add every atom not in qm system or the M1 atom 
+            excluded = list(system.qm_atoms) + list(self.link_atoms['all_mm'])
 
             for i, index in enumerate(self.link_atoms['all_mm']):
 
                 # check to see that the M1 atom is attached to any M2 atoms
                 if bonds[i]:
-                    # get q0
-                    q0 = charge[index] / len(bonds[i])
-
-                    # get positions in angstroms
-                    positions = self.get_redistributed_positions(es_pos, bonds[i], index)
+                    rc = np.empty((len(bonds[i]), 4))
+                    # q0
+                    rc[:,0] = field[index, 0] / len(bonds[i])
+                    rc[:,1:] = self.get_redistributed_positions(field[:,1:], bonds[i], index)
+                    redistributed.append(rc)
 
-                    for pos in positions:
-                        charges.append([q0, pos[0], pos[1], pos[2]])
+            charges = np.concatenate([field[self.get_charge_mask(excluded)]] + redistributed)
 
         elif self.boundary_treatment == 'RCD':
 
             bonds = self.link_atoms['all_outer_bonds']
+            redistributed = []
             m1_m2 = []
 
             for i, index in enumerate(self.link_atoms['all_mm']):
 
                 m1_m2.append(index)
-                # get q0
 
                 if bonds[i]:
+                    m2 = list(bonds[i])
+                    m1_m2 += m2
 
-                    q0 = charge[index] / len(bonds[i])
-                    q0_RCD = q0 * 2
+                    q0 = field[index, 0] / len(m2)
+                    rcd = np.empty((2*len(m2), 4))
+                    rcd[:len(m2),0] = q0 * 2
+                    rcd[:len(m2),1:] = self.get_redistributed_positions(field[:,1:], m2, index)
+                    rcd[len(m2):] = field[m2]
+                    rcd[len(m2):,0] -= q0
+                    redistributed.append(rcd)
 
-                    # get positions in angstroms
-                    positions = self.get_redistributed_positions(es_pos, bonds[i], index)
+            # add every atom not in qm system or the M1 and M2 atoms
+            excluded = list(system.qm_atoms) + m1_m2
+            charges = np.concatenate(redistributed + [field[self.get_charge_mask(excluded)]])
 
-                    for pos in positions:
-                        charges.append([q0_RCD, pos[0], pos[1], pos[2]])
+        if self.embedding_cutoff is not None:
+            charges = self.screen_charges(charges, system)
 
-                    for bond in bonds[i]:
-                        m1_m2.append(bond)
-                        charges.append([charge[bond] - q0, es_pos[bond][0], es_pos[bond][1], es_pos[bond][2]])
+        return charges
 
-            for i, chrg in enumerate(charge):
-                # add every atom not in qm system or the M1 atom 
-                if i not in system.qm_atoms and i not in m1_m2:
-                        charges.append([chrg, es_pos[i][0], es_pos[i][1], es_pos[i][2]])
+    def screen_charges(self, charges, system):
+        """
+        Keeps the charges within self.embedding_cutoff of any QM atom
+        as point charges, and replaces the charges beyond it with 
+        the compressed charges of :func:`~janus.qmmm.QMMM.compress_charges`.
+        The largest error of the electrostatic potential at the QM atoms
+        caused by the compression is saved as system.embedding_error in atomic units.
 
-                
-        return charges
+        Parameters
+        ----------
+        charges : numpy array
+            (M,4) array of charges and positions in angstroms
+        system : :class:`~janus.system.System`
+
+        Returns
+        -------
+        numpy array
+            the screened charges
+        """
+
+        qm_pos = self.get_charge_field(system)[sorted(system.qm_atoms), 1:]
+
+        # nearest QM atom of each charge, inf if beyond the cutoff
+        distance, _ = cKDTree(qm_pos).query(charges[:,1:], distance_upper_bound=self.embedding_cutoff)
+        near = np.isfinite(distance)
+        far = charges[~near]
+
+        if self.far_field_cell is not None:
+            compressed = QMMM.compress_charges(far, self.far_field_cell)
+        else:
+            compressed = np.empty((0, 4))
+
+        # potential from charges in e/angstrom, converted to e/bohr
+        error = np.dot(far[:,0], 1/cdist(far[:,1:], qm_pos)) if len(far) else np.zeros(len(qm_pos))
+        if len(compressed):
+            error -= np.dot(compressed[:,0], 1/cdist(compressed[:,1:], qm_pos))
+        system.embedding_error = 0.52917721*np.max(np.abs(error)) if len(error) else 0.0
+
+        print('Embedding: {} point charges, {} charges beyond {} angstroms as {} far field charges, potential error {:.2e} a.u.'\
+              .format(np.sum(near), len(far), self.embedding_cutoff, len(compressed), system.embedding_error))
+
+        return np.concatenate((charges[near], compressed))
+
+    def compress_charges(charges, cell):
+        """
+        Represents a set of charges on a grid of cubic cells. 
+        The charges in each cell are replaced by two charges on 
+        either side of the cell center that have the same total charge
+        and dipole moment about the cell center.
+
+        Parameters
+        ----------
+        charges : numpy array
+            (M,4) array of charges and positions in angstroms
+        cell : float
+            size of the cells in angstroms
+
+        Returns
+        -------
+        numpy array
+            (K,4) array of the compressed charges, 
+            K is at most twice the number of occupied cells
+
+        Examples
+        --------
+        >>> compressed = QMMM.compress_charges(charges, 10.0)
+        """
+
+        if len(charges) == 0:
+            return np.empty((0, 4))
+
+        cells, inverse = np.unique(np.floor(charges[:,1:]/cell).astype(int), axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        centers = (cells + 0.5)*cell
+
+        total = np.bincount(inverse, weights=charges[:,0], minlength=len(cells))
+        dipole = np.empty((len(cells), 3))
+        for k in range(3):
+            dipole[:,k] = np.bincount(inverse, weights=charges[:,0]*(charges[:,k+1] - centers[inverse,k]), minlength=len(cells))
+
+        p = np.linalg.norm(dipole, axis=1)
+        u = np.zeros((len(cells), 3))
+        u[p > 0] = dipole[p > 0] / p[p > 0][:,np.newaxis]
+        d = cell/4
+
+        compressed = np.empty((2*len(cells), 4))
+        compressed[:len(cells),0] = (total + p/d)/2
+        compressed[:len(cells),1:] = centers + d*u
+        compressed[len(cells):,0] = (total - p/d)/2
+        compressed[len(cells):,1:] = centers - d*u
+
+        return compressed[compressed[:,0] != 0.0]
+
+    def get_charge_field(self, system):
+        """
+        Gets the charges and positions of all atoms of the current step
+        as a (N,4) array, which is only built once for all the systems
+        that share the entire system information
+
+        Parameters
+        ----------
+        system : :class:`~janus.system.System`
+
+        Returns
+        -------
+        numpy array
+            charges and positions in angstroms of all atoms
+        """
+
+        positions = system.entire_sys['positions']
+
+        if (self.charge_field is None or self.charge_field[0] is not positions):
+            charge = np.asarray(self.ll_wrapper.get_main_charges(), dtype=float)
+            field = np.empty((len(charge), 4))
+            field[:,0] = charge
+            # in angstroms
+            field[:,1:] = 10*np.asarray(positions)
+            self.charge_field = (positions, field)
+
+        return self.charge_field[1]
+
+    def get_charge_mask(self, excluded):
+        """
+        Gets a boolean mask selecting the atoms that are not excluded
+        from the charge field. The mask is kept between calls and only the
+        atoms excluded by the previous call and by this one are changed.
+
+        Parameters
+        ----------
+        excluded : list
+            indices of the atoms left out of the charge field
+
+        Returns
+        -------
+        numpy array
+            the mask, which is only valid until the next call
+        """
+
+        n_atoms = len(self.charge_field[1])
+        excluded = np.asarray(excluded, dtype=int)
+
+        if (self.charge_mask is None or len(self.charge_mask[0]) != n_atoms):
+            self.charge_mask = (np.ones(n_atoms, dtype=bool), excluded)
+
+        mask, previous = self.charge_mask
+        mask[previous] = True
+        mask[excluded] = False
+        self.charge_mask = (mask, excluded)
+
+        return mask
 
     def get_redistributed_positions(self, positions, bonds, mm):
         """
@@ -594,7 +1164,7 @@ class QMMM(object):
 
         Parameters
         ----------
-        positions : list 
+        positions : numpy array
         bonds : list 
             indices of all atoms (in secondary subsystem) bonded to M1  
         mm : int 
@@ -602,18 +1172,13 @@ class QMMM(object):
 
         Returns
         -------
-        list
+        numpy array
             positions for the redistributed charges
 
         """
         
-        pos = []
-    
-        for bond in bonds:
-            new_pos = ((positions[bond] + positions[mm]) / 2)
-            pos.append(new_pos)
-        
-        return pos
+        positions = np.asarray(positions)
+        return (positions[list(bonds)] + positions[mm]) / 2
 
             
     def convert_input(self, fil, form):
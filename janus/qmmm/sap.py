@@ -98,16 +98,12 @@ class SAP(AQMMM):
 
         else:
 
-            self.get_switching_functions()
+            # also computes the switching functions
+            weights = self.get_partition_weights()
 
             # getting first term of ap energy and forces (w/o gradient of switching function)
-            qm.aqmmm_energy = deepcopy(qm.qmmm_energy)
-            qm.aqmmm_forces = deepcopy(qm.qmmm_forces)
-            print('qm aqmmm energy', qm.aqmmm_energy)
-
-            for i, buf in self.buffer_groups.items():
-                qm.aqmmm_energy *= (1 - buf.phi_i)
-                qm.aqmmm_forces.update((x, y*(1 - buf.phi_i)) for x,y in qm.aqmmm_forces.items())
+            print('qm qmmm energy', qm.qmmm_energy)
+            AQMMM.scale_partition(qm, weights['qm'])
 
             energy = deepcopy(qm.aqmmm_energy)
             qmmm_forces = deepcopy(qm.aqmmm_forces)
@@ -116,20 +112,11 @@ class SAP(AQMMM):
             for i, part in enumerate(self.partitions):
 
                 sys = self.systems[self.run_ID][i]
-                sys.aqmmm_energy = deepcopy(sys.qmmm_energy)
-                sys.aqmmm_forces = deepcopy(sys.qmmm_forces)
-
-                for j, buf in self.buffer_groups.items():
-                    if (j in part and buf.order == i):
-                        sys.aqmmm_energy *= buf.phi_i
-                        sys.aqmmm_forces.update((x, y*buf.phi_i) for x,y in sys.aqmmm_forces.items())
-                    elif j not in part:
-                        sys.aqmmm_energy *= (1 - buf.phi_i)
-                        sys.aqmmm_forces.update((x, y*(1 - buf.phi_i)) for x,y in sys.aqmmm_forces.items())
+                AQMMM.scale_partition(sys, weights[i])
 
                 energy += sys.aqmmm_energy
 
-            if self.modified_variant is False:
+            if (self.modified_variant is False and self.energy_only is False):
                 # computing forces due to gradient of switching function for SAP
                 forces_sf = self.compute_sf_gradient()
 
@@ -154,6 +141,35 @@ class SAP(AQMMM):
             print('forces')
             print(qmmm_forces)
             
+    def get_partition_weights(self):
+        """
+        Gets the weight of each partition in the SAP energy 
+        from the switching functions phi_i of the buffer groups
+
+        Returns
+        -------
+        dict
+            the weight of each partition ID
+        """
+
+        weights = {'qm' : 1.0}
+
+        if self.buffer_groups:
+            self.get_switching_functions()
+
+            for buf in self.buffer_groups.values():
+                weights['qm'] *= (1 - buf.phi_i)
+
+            for i, part in enumerate(self.partitions):
+                weights[i] = 1.0
+                for j, buf in self.buffer_groups.items():
+                    if (j in part and buf.order == i):
+                        weights[i] *= buf.phi_i
+                    elif j not in part:
+                        weights[i] *= (1 - buf.phi_i)
+
+        return weights
+
     def compute_sf_gradient(self):
         """
         Computes forces due to the gradient of the switching function
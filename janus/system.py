@@ -29,10 +29,16 @@ class System(object):
         self.buffer_groups = None
         self.switching_functions = None
         self.qmmm_forces = None
+        self.embedding_error = None
+        self.weight = None
+        self.error_tolerance = None
+        self.qm_telemetry = []
+        # boundary bonds, link atoms and secondary subsystem atoms of the partition, 
+        # kept while the partitions of a step are computed together
+        self.boundary = {}
         self.entire_sys = {}
         self.primary_subsys = {}
         self.second_subsys = {}
-        self.boundary = {}
         self.zero_energy = 0.0
         self.qmmm_energy = 0.0
         self.aqmmm_energy= 1.0
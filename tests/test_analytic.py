@@ -0,0 +1,103 @@
+from janus.qm_wrapper import AnalyticWrapper
+from janus import initializer
+import numpy as np
+import mdtraj as md
+import pytest
+import time
+import os
+
+water = os.path.join(str('tests/files/test_openmm/water.pdb'))
+traj = md.load(water)
+qm_traj = traj.atom_slice([0,1,2,3,4,5])
+charges = np.array([[-0.834, 2.0, 0.5, 0.0], [0.417, 2.5, 1.0, 0.3]])
+
+analytic = AnalyticWrapper()
+analytic_cost = AnalyticWrapper(cost_scale=1e-3, cost_exponent=1)
+
+def test_get_energy_and_gradient():
+
+    info1 = analytic.get_energy_and_gradient(traj=qm_traj, charges=charges)
+    info2 = analytic.get_energy_and_gradient(traj=qm_traj, charges=charges)
+    info3 = analytic.get_energy_and_gradient(traj=qm_traj, charges=charges, energy_only=True)
+
+    assert info1['gradients'].shape == (6,3)
+    assert info1['energy'] == info2['energy']
+    assert np.array_equal(info1['gradients'], info2['gradients'])
+    assert np.allclose(info1['energy'], info3['energy'])
+    assert 'gradients' not in info3
+
+def test_compute_info():
+
+    analytic.get_geom_from_trajectory(qm_traj)
+    analytic.external_charges = charges
+    analytic.compute_info()
+    gradient = analytic.gradient
+
+    # central differences of the energy, coordinates are in angstroms and the gradient in hartree/bohr
+    h = 1e-4
+    coordinates = analytic.qm_coordinates.copy()
+    numerical = np.zeros_like(gradient)
+    for i in range(coordinates.shape[0]):
+        for k in range(3):
+            analytic.qm_coordinates = coordinates.copy()
+            analytic.qm_coordinates[i,k] += h
+            analytic.compute_energy()
+            e_plus = analytic.energy
+            analytic.qm_coordinates[i,k] -= 2*h
+            analytic.compute_energy()
+            numerical[i,k] = (e_plus - analytic.energy)/(2*h*AnalyticWrapper.bohr_per_angstrom)
+    analytic.qm_coordinates = coordinates
+
+    assert np.allclose(gradient, numerical, atol=1e-6)
+
+def test_get_atoms():
+
+    analytic.set_qm_geometry("""O  0.000  0.000  0.000
+                                H  0.757  0.586  0.000
+                                H -0.757  0.586  0.000""")
+    symbols, coordinates = analytic.get_atoms()
+
+    assert symbols == ['O', 'H', 'H']
+    assert coordinates.shape == (3,3)
+    assert np.allclose(analytic.get_atom_charges(symbols).sum(), 0.0)
+
+def test_optimize_geometry():
+
+    analytic.set_qm_geometry("""O  0.000  0.000  0.000
+                                H  0.957  0.000  0.000""")
+    analytic.external_charges = None
+    analytic.compute_energy()
+    energy = analytic.energy
+    geometry = analytic.optimize_geometry()
+
+    assert geometry.shape == (2,3)
+    assert analytic.energy < energy
+    assert np.allclose(np.linalg.norm(geometry[0] - geometry[1]), 2.0, atol=1e-3)
+
+def test_cost():
+
+    start = time.perf_counter()
+    analytic_cost.get_energy_and_gradient(traj=qm_traj)
+    # 6 atoms, cost of the energy and of the gradient
+    assert time.perf_counter() - start >= 0.012
+    assert analytic_cost.telemetry['times']['cost'] >= 0.012
+
+    with pytest.raises(ValueError):
+        AnalyticWrapper(cost_mode='fast')
+
+def test_initializer():
+
+    param = {"system" : {"system_info" : water, 
+                         "hl_program" : "Analytic"},
+             "hl" : {"basis" : "STO-3G"},
+             "qmmm" : {"qm_atoms" : [0,1,2], "embedding_method" : "Electrostatic"}}
+
+    init = initializer.Initializer(param, as_file=False)
+    mm, qmmm = init.initialize_wrappers()
+    mm.initialize(qmmm.embedding_method)
+    main_info = mm.get_main_info()
+    qmmm.run_qmmm(main_info, 'OpenMM')
+
+    assert qmmm.hl_wrapper.class_type == 'Analytic'
+    assert len(qmmm.systems[0]['qmmm_forces']) == 9
+    assert qmmm.systems[0]['telemetry']['calls'] == 1
@@ -0,0 +1,34 @@
+from janus import driver
+from janus.mm_wrapper import OpenMMWrapper
+import json
+import os
+
+input_file = os.path.join(str('tests/files/test_initializer/input.json'))
+
+def test_run_calibration(tmp_path):
+    profile = str(tmp_path / 'platform_profile.json')
+    driver.run_calibration(filename=input_file, profile=profile)
+
+    with open(profile) as f:
+        best = json.load(f)
+
+    assert set(best) == {'main', 'subsys'}
+    for role, setting in best.items():
+        assert setting['platform'] in ('CPU', 'Reference')
+        assert setting['time'] > 0.0
+
+def test_run_calibration_without_pdb(tmp_path, monkeypatch):
+    # Amber inputs of a prmtop and an inpcrd file have no pdb
+    convert_input = OpenMMWrapper.convert_input
+    def convert_amber_input(self):
+        convert_input(self)
+        del self.pdb
+    monkeypatch.setattr(OpenMMWrapper, 'convert_input', convert_amber_input)
+
+    profile = str(tmp_path / 'platform_profile.json')
+    driver.run_calibration(filename=input_file, profile=profile)
+
+    with open(profile) as f:
+        best = json.load(f)
+
+    assert set(best) == {'main', 'subsys'}
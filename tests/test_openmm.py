@@ -5,6 +5,7 @@ import pytest
 from janus.mm_wrapper import OpenMMWrapper
 import simtk.unit as OM_unit
 import numpy as np
+import json
 import os
 
 #ala_water_pdb_file = os.path.join(str('tests/files/test_openmm/ala_water.pdb'))
@@ -26,6 +27,23 @@ def test_create_new_residue_template():
 
     assert wrapper_ala.forcefield._templates['Modified_ALA'].name == 'Modified_ALA' 
 
+def test_residue_template_cache(tmp_path):
+    template_file = str(tmp_path / 'templates.pkl')
+    wrapper1 = OpenMMWrapper(sys_info=ala_pdb_file, residue_template_file=template_file, **{'md_ensemble':'NVT'})
+
+    mod = wrapper1.create_modeller(keep_atoms=False, atoms=[0,1,2,3])
+    sys1 = wrapper1.create_openmm_system(mod.topology)
+    sys2 = wrapper1.create_openmm_system(mod.topology)
+
+    assert len(wrapper1.residue_templates) == 1
+    assert len(wrapper1.matched_topologies) == 1
+    assert os.path.isfile(template_file)
+
+    wrapper2 = OpenMMWrapper(sys_info=ala_pdb_file, residue_template_file=template_file, **{'md_ensemble':'NVT'})
+
+    assert wrapper2.forcefield._templates['Modified_ALA'].name == 'Modified_ALA'
+    assert wrapper2.forcefield.getUnmatchedResidues(mod.topology) == []
+
 def test_set_charge_zero():
 
     sys1 = wrapper.create_openmm_system(wrapper.pdb.topology)
@@ -69,6 +87,93 @@ def test_compute_info():
     assert np.allclose(state1['kinetic'] + state1['potential'],-0.010557407627282312)
     assert np.allclose(state2['kinetic'] + state2['potential'],-0.02892,rtol=1e-05,atol=1e-05)
 
+def test_context_pool():
+    pool_wrapper = OpenMMWrapper(sys_info=water_pdb_file, **{'md_ensemble':'NVT', 'return_info':[]})
+
+    state1 = pool_wrapper.compute_info(pool_wrapper.pdb.topology, pool_wrapper.pdb.positions)
+    state2 = pool_wrapper.compute_info(pool_wrapper.pdb.topology, pool_wrapper.pdb.positions)
+    state3 = pool_wrapper.compute_info(pool_wrapper.pdb.topology, pool_wrapper.pdb.positions, include_coulomb='only')
+
+    stats = pool_wrapper.context_pool.get_stats()
+
+    assert stats['hits'] == 1
+    assert stats['misses'] == 2
+    assert stats['size'] == 2
+    assert np.allclose(state1['potential'], state2['potential'])
+    assert np.allclose(state1['forces'], state2['forces'])
+    assert not np.allclose(state1['potential'], state3['potential'])
+
+def test_system_slicer():
+    slice_wrapper = OpenMMWrapper(sys_info=water_pdb_file, subsystem_slicing=True, **{'md_ensemble':'NVT', 'return_info':[]})
+
+    mod = slice_wrapper.create_modeller(keep_atoms=True, atoms=[3,4,5,6,7,8])
+    state1 = slice_wrapper.compute_info(mod.topology, mod.positions)
+    state2 = slice_wrapper.compute_info(mod.topology, mod.positions, atom_indices=[3,4,5,6,7,8])
+
+    sys = slice_wrapper.get_system_slicer().slice([3,4,5,6,7,8])
+
+    assert sys.getNumParticles() == 6
+    assert np.allclose(state1['potential'], state2['potential'])
+    assert np.allclose(state1['gradients'], state2['gradients'])
+
+def test_coulomb_force_groups():
+    group_wrapper = OpenMMWrapper(sys_info=water_pdb_file, coulomb_force_groups=True, **{'md_ensemble':'NVT', 'return_info':[]})
+
+    top, pos = group_wrapper.pdb.topology, group_wrapper.pdb.positions
+    states = {}
+    for variant in ['all', 'none', 'no_link']:
+        states[variant] = group_wrapper.compute_info(top, pos, include_coulomb=variant, link_atoms=[0])
+    OM_system, simulation, state = group_wrapper.compute_info(top, pos, return_system=True, 
+                                                              return_simulation=True, link_atoms=[0])
+
+    state1 = wrapper.compute_info(top, pos, include_coulomb='all')
+    state2 = wrapper.compute_info(top, pos, include_coulomb='none')
+    state3 = wrapper.compute_info(top, pos, include_coulomb='no_link', link_atoms=[0])
+
+    assert len(group_wrapper.context_pool) == 1
+    assert group_wrapper.context_pool.get_stats()['hits'] == 3
+    assert OM_system is not simulation.system
+    assert OM_system.getNumParticles() == simulation.system.getNumParticles()
+    assert not np.allclose(states['all']['potential'], states['none']['potential'])
+    assert np.allclose(states['all']['potential'], state1['potential'])
+    assert np.allclose(states['none']['potential'], state2['potential'])
+    assert np.allclose(states['no_link']['potential'], state3['potential'])
+    assert np.allclose(states['no_link']['gradients'], state3['gradients'])
+
+def test_numpy_evaluator():
+    numpy_wrapper = OpenMMWrapper(sys_info=ala_pdb_file, **{'md_ensemble':'NVT', 'return_info':[]})
+
+    top, pos = numpy_wrapper.pdb.topology, numpy_wrapper.pdb.positions
+    state1 = numpy_wrapper.compute_info(top, pos)
+    state2 = numpy_wrapper.compute_info(top, pos, engine='numpy')
+    state3 = numpy_wrapper.compute_info(top, pos, include_coulomb='only')
+    state4 = numpy_wrapper.compute_info(top, pos, include_coulomb='only', engine='numpy')
+
+    assert np.allclose(state1['potential'], state2['potential'])
+    assert np.allclose(state1['gradients'], state2['gradients'], atol=1e-7)
+    assert np.allclose(state3['potential'], state4['potential'])
+    assert np.allclose(state3['gradients'], state4['gradients'], atol=1e-7)
+
+def test_platform_profile(tmp_path):
+    profile = str(tmp_path / 'platform_profile.json')
+    best, timings = wrapper.calibrate_platforms(wrapper.pdb.topology, wrapper.pdb.positions, 
+                                                platforms=['CPU', 'Reference'], threads=[1, 2], repeats=2)
+    with open(profile, 'w') as f:
+        json.dump({'main' : best, 'subsys' : {'platform' : 'Reference', 'properties' : {}}}, f)
+
+    profile_wrapper = OpenMMWrapper(sys_info=water_pdb_file, platform_profile=profile, main_platform='CPU', 
+                                    main_platform_properties={'Threads' : 1}, **{'md_ensemble':'NVT', 'return_info':[]})
+    state = profile_wrapper.compute_info(profile_wrapper.pdb.topology, profile_wrapper.pdb.positions)
+    simulation = profile_wrapper.context_pool.entries[next(iter(profile_wrapper.context_pool.entries))]
+    platform, properties = profile_wrapper.get_platform('main')
+
+    assert len(timings) == 3
+    assert best in timings
+    assert simulation.context.getPlatform().getName() == 'Reference'
+    assert platform.getName() == 'CPU'
+    assert properties == {'Threads' : '1'}
+    assert np.allclose(state['potential'], wrapper.compute_info(wrapper.pdb.topology, wrapper.pdb.positions)['potential'])
+
 def test_initialize():
     wrapper.initialize('Mechanical')
     wrapper_ala.initialize('Electrostatic')
@@ -83,6 +188,16 @@ def test_get_main_info():
     assert np.allclose(state2['kinetic'] + state2['potential'],0.016526506142315156)
     assert 'topology' in state1
     assert 'topology' in state2
+    assert np.allclose(state1['entire_sys']['potential'], state1['potential'])
+    assert np.allclose(state1['entire_sys']['gradients'], state1['gradients'])
+
+def test_main_state_copy():
+    state1 = wrapper_ala.get_main_info()
+    state1['potential'] = 0.0
+    state2 = wrapper_ala.get_main_info()
+
+    assert state2['potential'] != 0.0
+    assert wrapper_ala.main_state['potential'] != 0.0
 
 def test_take_updated_step():
 
@@ -99,6 +214,33 @@ def test_take_updated_step():
     assert np.allclose(energy1, -0.0105, atol=1e-04)
     assert np.allclose(energy2, -0.009, atol=1e-03)
 
+def test_update_forces():
+
+    force1 = {1 : np.array([-0.0001, -0.0001, -0.0001])}
+    wrapper.update_forces(force1, wrapper.qmmm_force, wrapper.main_simulation)
+
+    assert np.allclose(force1[1], np.array([-0.0001, -0.0001, -0.0001]))
+    assert np.allclose(wrapper.qmmm_forces[1], -0.0001 * wrapper.au_bohr_to_kjmol_nm)
+
+    wrapper.update_forces(np.array([[0.0001, 0.0, 0.0]]), wrapper.qmmm_force, wrapper.main_simulation, indices=[2])
+
+    assert np.allclose(wrapper.qmmm_forces[1], 0.0)
+    assert np.allclose(wrapper.qmmm_force.getParticleParameters(1)[1], 0.0)
+    assert np.allclose(wrapper.qmmm_force.getParticleParameters(2)[1][0], 0.0001 * wrapper.au_bohr_to_kjmol_nm)
+
+def test_main_info_cache():
+
+    state1 = wrapper.get_main_info()
+    wrapper.update_forces({0 : np.array([0.001, 0.0, 0.0])}, wrapper.qmmm_force, wrapper.main_simulation)
+    state2 = wrapper.get_main_info()
+    wrapper.take_step(1)
+    state3 = wrapper.get_main_info()
+
+    assert state1['positions'] is state2['positions']
+    assert np.allclose(state1['entire_sys']['potential'], state2['entire_sys']['potential'])
+    assert not np.allclose(state1['potential'], state2['potential'])
+    assert not np.allclose(state2['positions'], state3['positions'])
+
 def test_create_modeller():
     mod1 = wrapper_ala.create_modeller(atoms=[0,1,2,3], keep_atoms=True)
     mod2 = wrapper_ala.create_modeller(atoms=[0,1,2,3], keep_atoms=False)
@@ -2,9 +2,11 @@ import pytest
 from janus import qm_wrapper, mm_wrapper, qmmm
 from copy import deepcopy
 import numpy as np
+import mdtraj as md
 import os
 
 water = os.path.join(str('tests/files/test_openmm/water.pdb'))
+ala = os.path.join(str('tests/files/test_openmm/ala_ala_ala.pdb'))
 
 psi4 = qm_wrapper.Psi4Wrapper()
 openmm = mm_wrapper.OpenMMWrapper(sys_info=water, **{'md_ensemble':'NVT', 'return_info':[]})
@@ -62,6 +64,149 @@ def test_compute_sf_gradient():
     for i, f in f2.items():
         assert np.allclose(f, force2[i])
 
+def test_get_partition_weight_gradients():
+
+    weights = pap_2.get_partition_weights()
+    gradients = pap_2.get_partition_weight_gradients()
+
+    # the PAP weight is a product of s_i and 1 - s_i
+    analytic = {}
+    for i, weight in weights.items():
+        part = pap_2.partitions[i] if i != 'qm' else ()
+        analytic[i] = 0.0
+        for j, buf in pap_2.buffer_groups.items():
+            d_w = weight / buf.s_i if j in part else -weight / (1 - buf.s_i)
+            analytic[i] += abs(d_w * buf.d_s_i * buf.r_i)
+
+    assert pap_2.get_partition_weights() == weights
+    for i in weights:
+        assert np.isclose(gradients[i], analytic[i], rtol=1e-4)
+
+def test_set_error_tolerances():
+
+    weights = pap_2.get_partition_weights()
+    gradients = pap_2.get_partition_weight_gradients()
+    width = pap_2.Rmax - pap_2.Rmin
+
+    pap_2.convergence_budget = 1e-6
+    pap_2.set_error_tolerances()
+    tolerances = {i : pap_2.systems[0][i].error_tolerance for i in weights}
+
+    pap_2.convergence_budget = None
+    for i in weights:
+        pap_2.systems[0][i].error_tolerance = None
+
+    assert len(weights) == 4
+    assert np.isclose(sum(weights.values()), 1.0)
+    for i, w in weights.items():
+        assert np.isclose(tolerances[i] * max(w, gradients[i] * width) * len(weights), 1e-6)
+        # the errors of the energy and of the forces from the switching functions
+        assert tolerances[i] * w * len(weights) <= 1e-6 * (1 + 1e-9)
+        assert tolerances[i] * gradients[i] * width * len(weights) <= 1e-6 * (1 + 1e-9)
+
+def test_correct_level():
+
+    top = md.load(water).topology
+    links = {0 : {'qm_atom' : top.atom(0), 'mm_atom' : top.atom(3), 'scale_factor' : 0.5, 'link_atom_index' : 1}}
+    high = {'energy' : -2.0, 'gradients' : np.array([[0.1, 0.0, 0.0], [0.0, 0.2, 0.0]])}
+    low = {'energy' : -1.5, 'gradients' : np.array([[0.0, 0.0, 0.0], [0.0, 0.1, 0.0]])}
+    part = {'energy' : -3.0, 'gradients' : np.zeros((3,3))}
+
+    pap_1.level_correction = qmmm.AQMMM.get_level_correction(high, low, [0, None], links)
+    pap_1.partition_level = 'low'
+    corrected = pap_1.correct_level(part, [0, 3, None])
+    corrected_outer = pap_1.correct_level(part, [0, 1, None])
+    pap_1.level_correction = None
+    pap_1.partition_level = None
+
+    assert np.allclose(corrected['energy'], -3.5)
+    assert np.allclose(corrected['gradients'], [[0.1, 0.05, 0.0], [0.0, 0.05, 0.0], [0.0, 0.0, 0.0]])
+    assert corrected['outer_gradients'] == {}
+    assert np.allclose(corrected_outer['gradients'], [[0.1, 0.05, 0.0], [0.0, 0.0, 0.0], [0.0, 0.0, 0.0]])
+    assert list(corrected_outer['outer_gradients']) == [3]
+    assert np.allclose(corrected_outer['outer_gradients'][3], [0.0, 0.05, 0.0])
+    assert np.allclose(part['energy'], -3.0)
+
+def get_link_atoms(traj, qm_atoms, g=0.709):
+    # link atoms of the bonds cut by qm_atoms, appended after the sorted qm atoms
+    link_atoms = {}
+    for a, b in traj.topology.bonds:
+        for qm, mm in ((a, b), (b, a)):
+            if (qm.index in qm_atoms and mm.index not in qm_atoms):
+                link_atoms[len(link_atoms)] = {'qm_atom' : qm, 'mm_atom' : mm, 'scale_factor' : g,
+                                               'link_atom_index' : len(qm_atoms) + len(link_atoms)}
+    return link_atoms
+
+def compute_primary_subsys(wrapper, traj, xyz, qm_atoms, link_atoms, level=None):
+    # the coordinates are not rounded as in QMWrapper.get_geom_from_trajectory, for the finite differences
+
+    atoms = sorted(qm_atoms) + [link['mm_atom'].index for link in link_atoms.values()]
+    coordinates = xyz[atoms]
+    for link in link_atoms.values():
+        g = link['scale_factor']
+        coordinates[link['link_atom_index']] = (1 - g) * xyz[link['qm_atom'].index] + g * xyz[link['mm_atom'].index]
+
+    wrapper.qm_symbols = tuple(traj.topology.atom(a).element.symbol for a in atoms)
+    wrapper.qm_coordinates = coordinates * 10
+    wrapper.set_level(level)
+    wrapper.compute_info()
+    return {'energy' : wrapper.energy, 'gradients' : wrapper.gradient}
+
+def test_correct_level_gradient():
+
+    # the CB methyl group of the first alanine is the qm partition, cut from CA (atom 4), 
+    # one partition adds O (atom 11) and keeps the CA-CB link atom, the other adds CA and HA
+    traj = md.load(ala)
+    analytic = qm_wrapper.AnalyticWrapper(levels={'low' : {'morse_depth' : 0.08, 'morse_distance' : 2.2}})
+    core = [6, 7, 8, 9]
+    core_links = get_link_atoms(traj, core)
+
+    def get_corrected(xyz, part):
+
+        part_links = get_link_atoms(traj, part)
+        high = compute_primary_subsys(analytic, traj, xyz, core, core_links)
+        low = compute_primary_subsys(analytic, traj, xyz, core, core_links, level='low')
+        info = compute_primary_subsys(analytic, traj, xyz, part, part_links, level='low')
+
+        pap_1.level_correction = qmmm.AQMMM.get_level_correction(high, low, core + [None]*len(core_links), core_links)
+        pap_1.partition_level = 'low'
+        atoms = sorted(part) + [None]*len(part_links)
+        corrected = pap_1.correct_level(info, atoms)
+        pap_1.level_correction = None
+        pap_1.partition_level = None
+
+        # projecting the link atoms of the partition as in QMMM.compute_gradients
+        gradients = dict(corrected['outer_gradients'])
+        for i, a in enumerate(atoms):
+            if a is not None:
+                gradients[a] = gradients.get(a, 0.0) + corrected['gradients'][i]
+        for link in part_links.values():
+            g = link['scale_factor']
+            for a, c in ((link['qm_atom'].index, 1 - g), (link['mm_atom'].index, g)):
+                gradients[a] = gradients.get(a, 0.0) + c * corrected['gradients'][link['link_atom_index']]
+
+        return corrected['energy'], gradients
+
+    xyz = traj.xyz[0].astype(np.float64)
+    for part in (core + [11], core + [4, 5]):
+
+        energy, gradients = get_corrected(xyz, part)
+
+        # central differences of the energy, positions are in nm and the gradient in hartree/bohr
+        h = 1e-5
+        for a, gradient in gradients.items():
+            numerical = np.zeros(3)
+            for k in range(3):
+                displaced = xyz.copy()
+                displaced[a, k] += h
+                e_plus = get_corrected(displaced, part)[0]
+                displaced[a, k] -= 2*h
+                e_minus = get_corrected(displaced, part)[0]
+                numerical[k] = (e_plus - e_minus)/(2*h*openmm.nm_to_bohr)
+            assert np.allclose(gradient, numerical, atol=1e-6)
+
+        assert 4 in gradients
+
 def test_run_aqmmm():
 
     pap_1.systems[0]['qm'].qmmm_forces = {key: np.ones((3)) for key in range(3)}
@@ -106,3 +251,21 @@ def test_run_qmmm():
     assert len(pap_1.systems[0]['qmmm_forces']) == 6
     assert len(pap_2.systems[0]['qmmm_forces']) == 9
 
+
+def test_run_partitions_batch():
+
+    analytic = qm_wrapper.AnalyticWrapper()
+    pap_s = qmmm.PAP(hl_wrapper=analytic, ll_wrapper=openmm, sys_info=water, qmmm_param={'embedding_method' : 'Mechanical'}, Rmin=2.6, Rmax=3.4)
+    pap_b = qmmm.PAP(hl_wrapper=analytic, ll_wrapper=openmm, sys_info=water, qmmm_param={'embedding_method' : 'Mechanical'}, Rmin=2.6, Rmax=3.4,
+                     partition_executor='batch')
+
+    pap_s.run_qmmm(main_info_m, 'OpenMM')
+    pap_b.run_qmmm(main_info_m, 'OpenMM')
+
+    assert pap_b.systems[0]['telemetry']['calls'] == 4
+    assert np.allclose(pap_b.systems[0]['qmmm_energy'], pap_s.systems[0]['qmmm_energy'])
+    for atom, force in pap_s.systems[0]['qmmm_forces'].items():
+        assert np.allclose(pap_b.systems[0]['qmmm_forces'][atom], force)
+
+    with pytest.raises(ValueError):
+        qmmm.PAP(hl_wrapper=analytic, ll_wrapper=openmm, sys_info=water, partition_executor='threads')
@@ -1,11 +1,13 @@
 """
 Testing for psi4_wrapper.py module
 """
-from janus.qm_wrapper import Psi4Wrapper
+from janus.qm_wrapper import Psi4Wrapper, QMCache, QMWorkerWrapper
+import psi4
 import mdtraj as md
 import numpy as np
 import os
 from copy import deepcopy
+import pytest
 
 water = os.path.join(str('tests/files/test_openmm/water.pdb'))
 traj = md.load(water)
@@ -99,6 +101,8 @@ def test_get_geom_from_trajectory():
     
     assert qm_sys2.qm_geometry == qm_mol
     assert qm_sys3.qm_geometry == qm_mol
+    assert qm_sys2.qm_symbols == ('O', 'H', 'H', 'O', 'H', 'H')
+    assert np.allclose(qm_sys2.qm_coordinates[1], [-0.022, 2.679, 5.599])
     assert qm_sys1.is_open_shelled is False
 
 
@@ -133,6 +137,9 @@ def test_compute_info():
 
     assert np.allclose(qm_sys1.energy, -149.92882700815)
     assert np.allclose(qm_sys1.gradient, gradient1)
+    assert np.allclose(qm_sys2.energy,-151.18483039002274)
+    assert np.allclose(qm_sys2.gradient, gradient2)
+    assert qm_sys2.wavefunction is not None
 
 def test_compute_scf_charges():
 
@@ -178,4 +185,170 @@ def test_get_energy_and_gradient():
     assert np.allclose(info2['gradients'], gradient2)
     assert np.allclose(info3['gradients'], gradient3)
 
+    info4 = qm_sys2.get_energy_and_gradient(traj=qm_traj,charges=charges) 
+
+    assert len(qm_sys2.molecules) == 1
+    assert np.allclose(info4['energy'],-151.18483039002274)
+
+
+
+def test_set_options():
+
+    qm_sys9 = Psi4Wrapper(**config1)
+    qm_sys10 = Psi4Wrapper(**config2)
+    qm_sys9.set_qm_geometry(qm_mol)
+    qm_sys10.set_qm_geometry(qm_mol)
+
+    options = []
+    for qm in [qm_sys9, qm_sys10, qm_sys9, qm_sys9]:
+        qm.set_up_psi4()
+        options.append((Psi4Wrapper.options_owner, psi4.core.get_global_option('BASIS'),
+                        psi4.core.get_global_option('REFERENCE'), psi4.core.get_global_option('GUESS')))
+
+    qm_sys9.compute_energy()
+
+    assert options[0] == (qm_sys9, 'STO-3G', 'RHF', 'AUTO')
+    assert options[1] == (qm_sys10, '3-21G', 'UHF', 'SAD')
+    # the options of qm_sys10 are cleaned before the options of qm_sys9 are set again
+    assert options[2] == (qm_sys9, 'STO-3G', 'RHF', 'AUTO')
+    assert options[3] == options[2]
+    assert qm_sys9.applied_options == qm_sys9.qm_param
+    assert np.allclose(qm_sys9.energy, -149.92882700815)
+
+def test_get_aspc_coefficients():
+
+    assert np.allclose(Psi4Wrapper.get_aspc_coefficients(0), [2.0, -1.0])
+    assert np.allclose(Psi4Wrapper.get_aspc_coefficients(1), [2.5, -2.0, 0.5])
+    assert np.allclose(Psi4Wrapper.get_aspc_coefficients(2).sum(), 1.0)
+
+def test_set_convergence():
+
+    qm_sys5 = Psi4Wrapper(**config1)
+    qm_sys5.set_convergence()
+    convergence = qm_sys5.convergence
+
+    qm_sys5.error_tolerance = 1e-6
+    qm_sys5.set_convergence()
+    loosened = qm_sys5.convergence
+
+    qm_sys5.error_tolerance = 1.0
+    qm_sys5.set_convergence()
+
+    assert convergence == {'e_convergence' : 1e-8, 'd_convergence' : 1e-8}
+    assert loosened == {'e_convergence' : 1e-6, 'd_convergence' : 1e-6}
+    assert qm_sys5.convergence == {'e_convergence' : 1e-4, 'd_convergence' : 1e-4}
+
+def test_set_level():
+
+    qm_sys6 = Psi4Wrapper(levels={'low' : {'method' : 'hf', 'basis' : '3-21G'}}, **config1)
+    qm_sys6.set_level('low')
+    low = (qm_sys6.method, qm_sys6.qm_param['basis'], qm_sys6.qm_param['e_convergence'])
+    qm_sys6.set_level()
+
+    assert low == ('hf', '3-21G', 1e-8)
+    assert (qm_sys6.method, qm_sys6.qm_param['basis']) == ('scf', 'STO-3G')
+    with pytest.raises(ValueError):
+        qm_sys6.set_level('high')
+
+def test_guess_reuse():
+
+    qm_sys4 = Psi4Wrapper(guess_reuse='extrapolate', **config1)
+    key = ('qm', (0,1,2,3,4,5))
+
+    info1 = qm_sys4.get_energy_and_gradient(traj=qm_traj, guess_key=key)
+    iterations1 = qm_sys4.scf_iterations
+    info2 = qm_sys4.get_energy_and_gradient(traj=qm_traj, guess_key=key)
+    info3 = qm_sys4.get_energy_and_gradient(traj=qm_traj, guess_key=key)
+
+    assert len(qm_sys4.guesses[key]['history']) == 3
+    assert qm_sys4.scf_iterations < iterations1
+    assert np.allclose(info1['energy'], info3['energy'])
+    assert np.allclose(info1['gradients'], info3['gradients'])
+
+def test_guess_read():
+
+    qm_sys8 = Psi4Wrapper(guess_reuse='previous', **config1)
+    key = ('qm', (0,1,2,3,4,5))
+
+    qm_sys8.get_energy_and_gradient(traj=qm_traj, guess_key=key)
+    cold = qm_sys8.scf_iterations
+    qm_sys8.get_energy_and_gradient(traj=qm_traj, guess_key=key)
+    gradient = qm_sys8.scf_iterations
+    qm_sys8.get_energy_and_gradient(traj=qm_traj, guess_key=key, energy_only=True)
+    energy = qm_sys8.scf_iterations
+
+    # the guess has to be read by psi4.gradient as well as psi4.energy
+    assert qm_sys8.guess_type == 'previous'
+    assert gradient < cold
+    assert energy < cold
+
+def test_fragment_guess():
+
+    qm_sys5 = Psi4Wrapper(fragment_guess=True, **config1)
+
+    qm_sys5.get_energy_and_gradient(traj=traj.atom_slice([0,1,2]), guess_atoms=[0,1,2])
+    qm_sys5.get_energy_and_gradient(traj=traj.atom_slice([3,4,5]), guess_atoms=[3,4,5])
+    blocks = qm_sys5.assemble_fragments([0,1,2,3,4,5])
+    info = qm_sys5.get_energy_and_gradient(traj=qm_traj, guess_atoms=[0,1,2,3,4,5])
+
+    cold = qm_sys1.get_energy_and_gradient(traj=qm_traj)
+
+    assert len(blocks) == 2
+    assert qm_sys5.assemble_fragments([0,1,2,6]) is None
+    assert info['telemetry']['guess'] == 'fragments'
+    assert info['telemetry']['scf_iterations'] < cold['telemetry']['scf_iterations']
+    assert np.allclose(info['energy'], qm_sys1.energy)
+    assert np.allclose(info['gradients'], qm_sys1.gradient)
+
+def test_qm_cache(tmp_path):
+
+    cache_dir = str(tmp_path / 'qm_cache')
+    qm_sys6 = Psi4Wrapper(cache_size=10, cache_dir=cache_dir, **config1)
+    qm_sys7 = Psi4Wrapper(cache_size=10, cache_dir=cache_dir, **config1)
+
+    info1 = qm_sys6.get_energy_and_gradient(traj=qm_traj)
+    info2 = qm_sys6.get_energy_and_gradient(traj=qm_traj)
+    info3 = qm_sys7.get_energy_and_gradient(traj=qm_traj)
+    info4 = qm_sys7.get_energy_and_gradient(traj=qm_traj, charges=charges)
+
+    assert qm_sys6.cache.get_stats()['hits'] == 1
+    assert qm_sys7.cache.get_stats()['disk_hits'] == 1
+    assert qm_sys7.cache.get_stats()['misses'] == 1
+    assert np.allclose(info1['energy'], info2['energy'])
+    assert np.allclose(info1['gradients'], info3['gradients'])
+    assert not np.allclose(info1['energy'], info4['energy'])
+
+    assert info1['telemetry']['cache'] == 'miss'
+    assert info2['telemetry']['cache'] == 'memory'
+    assert info3['telemetry']['cache'] == 'disk'
+    assert info1['telemetry']['n_atoms'] == 6
+    assert info1['telemetry']['scf_iterations'] > 0
+    assert 'gradient' in info1['telemetry']['times']
+
+def test_qm_cache_store(tmp_path):
+
+    cache = QMCache(max_size=1, cache_dir=str(tmp_path))
+    key1 = QMCache.make_key('scf', qm_mol, np.zeros(3))
+    key2 = QMCache.make_key('scf', qm_mol, np.ones(3))
+
+    cache.put(key1, {'energy' : 1.0})
+    cache.put(key2, {'energy' : 2.0})
+
+    assert len(cache) == 1
+    assert cache.get(key1)['energy'] == 1.0
+    assert cache.get(QMCache.make_key('scf', qm_mol, np.zeros(2))) is None
+    assert cache.get_stats()['disk_hits'] == 1
+    assert cache.get_stats()['hit_rate'] == 0.5
+
+def test_qm_worker():
+
+    qm_worker = QMWorkerWrapper(n_workers=2, **config2)
+
+    info = qm_worker.get_energy_and_gradient(geometry=qm_mol)
+    results = qm_worker.get_pool().run([qm_worker.get_job(), qm_worker.get_job(), qm_worker.get_job()])
+    qm_worker.close()
 
+    assert np.allclose(info['energy'], -151.17927491846075)
+    assert np.allclose(info['gradients'], gradient3)
+    assert len(results) == 3
+    assert np.allclose(results[2]['gradients'], gradient3)
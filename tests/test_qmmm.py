@@ -85,6 +85,24 @@ def test_get_external_charges():
     assert len(charges_ala_link) == 29
     assert len(charges_ala_RC) == 30
     assert len(charges_ala_RCD) == 31
+    assert charges_ala_RC.shape == (30, 4)
+    assert np.allclose(charges_ala_link, ala_link.get_external_charges(sys_ala_link))
+
+def test_screen_charges():
+
+    charges = ala_RC.get_external_charges(sys_ala_RC)
+    ala_RC.embedding_cutoff = 3.0
+    screened = ala_RC.get_external_charges(sys_ala_RC)
+    ala_RC.embedding_cutoff = None
+
+    compressed = qmmm.QMMM.compress_charges(charges, 10.0)
+    dipole = np.dot(charges[:,0], charges[:,1:])
+    
+    assert screened.shape[1] == 4
+    assert len(screened) < len(charges)
+    assert sys_ala_RC.embedding_error > 0.0
+    assert np.isclose(np.sum(compressed[:,0]), np.sum(charges[:,0]))
+    assert np.allclose(np.dot(compressed[:,0], compressed[:,1:]), dipole)
 
 def test_make_primary_subsys_trajectory():
 
@@ -122,6 +140,12 @@ def test_mechanical():
     assert np.allclose(sys_ala_link.primary_subsys['ll']['energy'], 0.024946918087355077)
     assert np.allclose(sys_ala_link.primary_subsys['hl']['energy'], -55.86812550986576)
 
+def test_get_entire_sys_info():
+    info = mech.get_entire_sys_info(main_info_m)
+
+    assert info is main_info_m['entire_sys']
+    assert np.allclose(info['energy'], -0.010569627400199556)
+
 def test_electrostatic():
     #ala_link.electrostatic(sys_ala_link, main_info_ala)
     #ala_RCD.electrostatic(sys_ala_RCD, main_info_ala)
@@ -134,6 +158,81 @@ def test_electrostatic():
     assert np.allclose(sys_elec.primary_subsys['hl']['energy'], -74.97080694971332)
 
 
+def test_energy_only():
+    om_hl = mm_wrapper.OpenMMWrapper(sys_info=water, **{'md_ensemble':'NVT', 'return_info':[]})
+    mech_f = qmmm.QMMM(om_hl, om_m, sys_info=water, qm_atoms=[0,1,2], embedding_method='Mechanical')
+    mech_e = qmmm.QMMM(om_hl, om_m, sys_info=water, qm_atoms=[0,1,2], embedding_method='Mechanical', energy_only=True)
+    sys_f = system.System([0,1,2], [0], 0)
+    sys_e = system.System([0,1,2], [0], 0)
+
+    mech_f.mechanical(sys_f, main_info_m)
+    mech_e.mechanical(sys_e, main_info_m)
+
+    assert sys_e.qmmm_forces == {}
+    assert 'gradients' not in sys_e.primary_subsys['ll']
+    assert 'gradients' not in sys_e.primary_subsys['hl']
+    assert np.allclose(sys_e.qmmm_energy, sys_f.qmmm_energy)
+
+def test_concurrent_hl():
+    analytic = qm_wrapper.AnalyticWrapper(cost_scale=1e-3)
+    elec_s = qmmm.QMMM(analytic, om_m, sys_info=water, qm_atoms=[0,1,2], embedding_method='Electrostatic')
+    elec_c = qmmm.QMMM(analytic, om_m, sys_info=water, qm_atoms=[0,1,2], embedding_method='Electrostatic', concurrent_hl=True)
+    sys_s = system.System([0,1,2], [0], 0)
+    sys_c = system.System([0,1,2], [0], 0)
+
+    elec_s.electrostatic(sys_s, main_info_e)
+    elec_c.electrostatic(sys_c, main_info_e)
+
+    assert np.allclose(sys_c.qmmm_energy, sys_s.qmmm_energy)
+    assert np.allclose(sys_c.primary_subsys['hl']['energy'], sys_s.primary_subsys['hl']['energy'])
+    for atom, force in sys_s.qmmm_forces.items():
+        assert np.allclose(sys_c.qmmm_forces[atom], force)
+
+    elec_c.close()
+    assert elec_c.hl_executor is None
+
+    with pytest.raises(ValueError):
+        qmmm.QMMM(om_m, om_m, sys_info=water, qm_atoms=[0,1,2], concurrent_hl=True)
+    with pytest.raises(ValueError):
+        qmmm.QMMM(psi4, om_m, sys_info=water, qm_atoms=[0,1,2], concurrent_hl=True)
+    with pytest.raises(ValueError):
+        busy = qm_wrapper.AnalyticWrapper(cost_mode='busy')
+        qmmm.QMMM(busy, om_m, sys_info=water, qm_atoms=[0,1,2], concurrent_hl=True)
+
+def test_close():
+    worker = qm_wrapper.QMWorkerWrapper(qm_program='Analytic', n_workers=2)
+    elec_w = qmmm.QMMM(worker, om_m, sys_info=water, qm_atoms=[0,1,2], embedding_method='Electrostatic', concurrent_hl=True)
+    sys_w = system.System([0,1,2], [0], 0)
+
+    elec_w.electrostatic(sys_w, main_info_e)
+    processes = [process for process, conn in worker.pool.workers]
+    elec_w.close()
+
+    assert len(processes) == 2
+    assert worker.pool is None
+    assert elec_w.hl_executor is None
+    for process in processes:
+        assert process.is_alive() is False
+        assert process.exitcode == 0
+
+def test_summarize_telemetry():
+    records = [{'n_atoms' : 3, 'n_basis' : 7, 'scf_iterations' : 9, 'guess' : 'default', 'fallback' : None, 'cache' : 'miss', 'wall_time' : 1.0},
+               {'n_atoms' : 5, 'n_basis' : 12, 'scf_iterations' : 4, 'guess' : 'previous', 'fallback' : 'gradient', 'cache' : 'miss', 'wall_time' : 2.0},
+               {'n_atoms' : 5, 'cache' : 'memory', 'wall_time' : 0.5}]
+
+    step = qmmm.QMMM.summarize_telemetry(records[:2])
+    run = qmmm.QMMM.summarize_telemetry(records[2:], step)
+
+    assert step['calls'] == 2
+    assert step['scf_iterations'] == 13
+    assert step['fallbacks'] == 1
+    assert step['max_basis'] == 12
+    assert step['guesses'] == {'default' : 1, 'previous' : 1}
+    assert run['calls'] == 3
+    assert run['cache_hits'] == 1
+    assert np.allclose(run['wall_time'], 3.5)
+    assert step['cache_hits'] == 0
+
 def test_update_traj():
 
     mech.traj.xyz[0] = np.zeros((9,3))
@@ -142,6 +241,11 @@ def test_update_traj():
     
     assert np.allclose(pos1, np.zeros((9,3)))
     assert np.allclose(mech.traj.xyz[0], main_info_m['positions'])
+
+    top = mech.traj.topology
+    mech.update_traj(main_info_m['positions'], main_info_m['topology'], 'OpenMM')
+
+    assert mech.traj.topology is top
     
 def test_run_qmmm():
     mech.qm_atoms = [0,1,2]